@@ -0,0 +1,122 @@
+from multiprocessing import Pool
+
+from cost_functions import EditDistanceCost
+from directed_acyclic_graph_comparator import DirectedAcyclicGraphComparator
+from directed_acyclic_graph_mapper import DirectedAcyclicGraphMapper
+from transitions_iterator import TransitionsIterator, derivation_score
+
+# Batch comparator used by the processes of the pool, check the function
+# initialize_batch_worker.
+batch_worker = None
+
+
+def initialize_batch_worker(batch_comparator):
+    """
+    Initializer of the processes of the pool used by the BatchComparator,
+    the query side is received once by each process instead of once for
+    each dag of the corpus.
+    """
+    global batch_worker
+    batch_worker = batch_comparator
+
+
+def compare_corpus_entry(entry):
+    """
+    Compares a (dag_id, dag) entry of the corpus with the query of the batch
+    comparator of the process, it returns the tuple
+    (dag_id, best_score, best_derivation).
+    """
+    dag_id, dag = entry
+
+    return (dag_id, ) + batch_worker.compare(dag)
+
+
+class BatchComparator:
+    """
+    This class compares one query dag against a corpus of dags.
+
+    The data of the query that doesn't depend on the dag it is compared with
+    is built only once: its mapper, the mappings rooted at each of its nodes
+    (generated the first time they are required, each comparison only groups
+    them by their number of variables) and the data the cost function
+    precomputes for it, for the edit distance the nodes reachable from each
+    node and the effective nodes of each mapping. Each dag of the corpus is
+    compared with the query looking only for the best derivation, check the
+    best_only option of the function buildHyperGraph of the
+    DirectedAcyclicGraphComparator.
+    """
+
+    def __init__(self, query, number_of_variables=float('inf'),
+                 cost_function=None):
+        """
+        query -> The DirectedAcyclicGraph compared with the corpus, it can
+                 also be a DirectedAcyclicGraphMapper that is reused.
+        number_of_variables -> The maximum number of variables of the
+                               mappings.
+        cost_function -> Optional, the CostFunction used to compare the dags
+                         as specified on the file cost_functions.py, the edit
+                         distance is used by default.
+        """
+        if cost_function is None:
+            cost_function = EditDistanceCost()
+
+        if isinstance(query, DirectedAcyclicGraphMapper):
+            self.query_mapper = query
+        else:
+            self.query_mapper = DirectedAcyclicGraphMapper(query)
+        self.query = self.query_mapper.dag
+        self.number_of_variables = number_of_variables
+        self.cost_function = cost_function
+        self.cost_function.prepare(self.query)
+
+    def compare(self, dag):
+        """
+        This function compares the query with a dag, or with the dag of a
+        DirectedAcyclicGraphMapper that is reused. It returns a tuple with the
+        best score and the best derivation, if the roots of the dags don't
+        start any hyperedge both are None.
+        """
+        comparator = DirectedAcyclicGraphComparator(self.query_mapper,
+                                                    dag,
+                                                    cost_function=
+                                                    self.cost_function)
+        comparator.buildHyperGraph(self.number_of_variables, best_only=True)
+
+        roots = (self.query.root, comparator.dag2_mapper.dag.root)
+        try:
+            transitions = TransitionsIterator(comparator.hypergraph,
+                                              roots,
+                                              comparator.getNodeBounds())
+        except ValueError:
+            return None, None
+
+        best = transitions.next(False)
+
+        return derivation_score(best), best
+
+    def compareCorpus(self, corpus, processes=None, chunksize=1):
+        """
+        This function compares the query with each dag of a corpus, it yields
+        the tuples (dag_id, best_score, best_derivation) in the same order as
+        the corpus.
+
+        corpus -> An iterable of tuples (dag_id, dag), it is consumed lazily
+                  so the corpus doesn't have to fit in memory.
+        processes -> Optional, if specified the dags of the corpus are
+                     compared in parallel using a pool with that number of
+                     processes.
+        chunksize -> The number of dags of the corpus sent at once to each
+                     process of the pool.
+        """
+        if not processes:
+            for dag_id, dag in corpus:
+                yield (dag_id, ) + self.compare(dag)
+            return
+
+        pool = Pool(processes, initialize_batch_worker, (self, ))
+        try:
+            for result in pool.imap(compare_corpus_entry, corpus, chunksize):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,279 @@
+from utils import graphs_node_positions
+from utils import mapping_effective_nodes
+from utils import nodes_bitmask
+from utils import popcount
+from utils import reachable_bitmasks_sizes
+from utils import t_cost_default
+from utils import t_cost_edit_distance_bitmasks
+from utils import t_cost_edit_distance_graphs_no_vars_all_pairs
+
+
+class CostFunction:
+    """
+    Base class of the cost functions used by the comparator to build the
+    hypergraph.
+
+    A cost function scores the nodes of the hypergraph, that is every pair
+    formed by one node of each dag, and its hyperedges, that is every pair of
+    mappings with the same number of variables. The scores are computed in
+    batches so each implementation can share the work among all the pairs.
+
+    symmetric -> True if the scores of the nodes and the hyperedges don't
+                 change when the dags are swapped, in that case the best
+                 score of comparing dag1 with dag2 is the same as the one of
+                 comparing dag2 with dag1. The best derivations can differ
+                 when several of them tie.
+    """
+    symmetric = False
+
+    def scoreNodes(self, dag1, dag2):
+        """
+        This function returns a dictionary with every pair of nodes (n1, n2)
+        of the dags as keys and its score as values.
+        """
+        raise NotImplementedError
+
+    def scoreMappings(self, mappings1, mappings2):
+        """
+        This function scores every pair formed by one mapping of mappings1
+        and one mapping of mappings2, all of them have the same number of
+        variables. It returns a list with a list of scores for each mapping
+        of mappings1, the scores follow the order of mappings2.
+        """
+        raise NotImplementedError
+
+    def boundNodes(self, dag1, dag2):
+        """
+        This function returns a dictionary with every pair of nodes (n1, n2)
+        of the dags as keys and as values an upper bound of the accumulated
+        weight of any derivation starting on that pair, that is the sum of
+        the scores of its hyperedges and of the nodes where it ends. If the
+        cost function can't bound them it returns None.
+
+        The bounds are used to prune the search of the best derivation, check
+        the TransitionsIterator.
+        """
+        return None
+
+    def prepare(self, dag):
+        """
+        This function lets the cost function precompute the data of a dag
+        that is going to be compared, as the first dag, with many others. The
+        data is used while the same dag object is given to the rest of the
+        functions, the dag must not be modified after preparing it.
+        """
+        pass
+
+
+class EditDistanceCost(CostFunction):
+    """
+    Cost function based on the edit distance between the nodes of the graphs,
+    check the functions t_cost_edit_distance_graphs_no_vars and
+    t_cost_edit_distance_graphs_with_vars.
+
+    Once a dag is prepared the nodes reachable from its nodes and the
+    effective nodes of its mappings are computed only once. The positions of
+    the nodes and the effective nodes of the mappings of the last pair of
+    graphs whose mappings were scored are also kept until the nodes of a pair
+    of graphs are scored again, so the mappings of a comparison scored in many
+    calls (as the lazy hypergraphs do) are only processed once.
+    """
+    symmetric = True
+
+    def __init__(self):
+        self.prepared_dag = None
+        self.prepared_reachable = None
+        self.prepared_mappings = dict()
+        self.comparison = None
+
+    def prepare(self, dag):
+        self.prepared_dag = dag
+        self.prepared_reachable = \
+            reachable_bitmasks_sizes(dag, graphs_node_positions(dag))
+        self.prepared_mappings = dict()
+        self.comparison = None
+
+    def scoreNodes(self, dag1, dag2):
+        # A comparison starts scoring the nodes, the dags may have been
+        # edited in place since the last one.
+        self.comparison = None
+
+        reachable1 = None
+        if dag1 is self.prepared_dag:
+            reachable1 = self.prepared_reachable
+
+        return t_cost_edit_distance_graphs_no_vars_all_pairs(dag1, dag2,
+                                                             reachable1)
+
+    def boundNodes(self, dag1, dag2):
+        """
+        The effective nodes of the mappings of a derivation cover the nodes
+        reachable from its starting pair, as the symmetric difference is
+        subadditive no derivation can be better than the score of the pair
+        without variables.
+        """
+        return self.scoreNodes(dag1, dag2)
+
+    def __effectiveNodes(self, mappings, positions, memo=None):
+        """
+        Auxiliary function that computes once for each mapping the bitmask of
+        its nodes that are not replaced by the variables and its size. If
+        memo is specified the results are stored on it by subgraph and
+        variables.
+        """
+        answers = []
+        for mapping in mappings:
+            key = (mapping.subgraph, mapping.variables)
+            if memo is not None and key in memo:
+                answers.append(memo[key])
+                continue
+
+            mask = nodes_bitmask(mapping_effective_nodes(mapping), positions)
+            answers.append((mask, popcount(mask)))
+            if memo is not None:
+                memo[key] = answers[-1]
+
+        return answers
+
+    def __getComparison(self, graph1, graph2):
+        """
+        Auxiliary function that returns the positions of the nodes of a pair
+        of graphs and the memos of the effective nodes of the mappings of
+        each one, they are built again when the pair changes.
+        """
+        if self.comparison is None or \
+           self.comparison[0] is not graph1 or \
+           self.comparison[1] is not graph2:
+            # The nodes of the first graph take the first positions, so the
+            # masks of the prepared dag are valid for any second graph.
+            memo1 = dict()
+            if graph1 is self.prepared_dag:
+                memo1 = self.prepared_mappings
+            self.comparison = (graph1,
+                               graph2,
+                               graphs_node_positions(graph1, graph2),
+                               memo1,
+                               dict())
+
+        return self.comparison[2:]
+
+    def scoreMappings(self, mappings1, mappings2):
+        if not mappings1 or not mappings2:
+            return [[] for _ in mappings1]
+
+        positions, memo1, memo2 = self.__getComparison(mappings1[0].graph,
+                                                       mappings2[0].graph)
+        effective2 = self.__effectiveNodes(mappings2, positions, memo2)
+
+        scores = []
+        for mask1, size1 in self.__effectiveNodes(mappings1, positions,
+                                                  memo1):
+            scores.append([t_cost_edit_distance_bitmasks(mask1, size1,
+                                                         mask2, size2)
+                           for mask2, size2 in effective2])
+
+        return scores
+
+
+class DefaultCost(CostFunction):
+    """
+    Cost function based on t_cost_default, used for testing purposes.
+    """
+    symmetric = True
+
+    def scoreNodes(self, dag1, dag2):
+        return dict(((n1, n2), t_cost_default([n1], [n2]))
+                    for n1 in dag1.links.iterkeys()
+                    for n2 in dag2.links.iterkeys())
+
+    def scoreMappings(self, mappings1, mappings2):
+        return [[t_cost_default(map1.subgraph.nodes, map2.subgraph.nodes)
+                 for map2 in mappings2]
+                for map1 in mappings1]
+
+
+class WeightedCost(CostFunction):
+    """
+    Cost function formed by the weighted sum of other cost functions.
+
+    components -> A sequence of tuples (cost function, weight).
+    """
+
+    def __init__(self, components):
+        self.components = tuple(components)
+
+        if not self.components:
+            raise ValueError("At least one cost function is required")
+
+        self.symmetric = all(cost_function.symmetric
+                             for cost_function, _ in self.components)
+
+    def scoreNodes(self, dag1, dag2):
+        scores = dict()
+        for cost_function, weight in self.components:
+            for pair, score in \
+                    cost_function.scoreNodes(dag1, dag2).iteritems():
+                scores[pair] = scores.get(pair, 0) + weight * score
+
+        return scores
+
+    def boundNodes(self, dag1, dag2):
+        """
+        The bounds are the weighted sum of the bounds of the components, they
+        only exist if all the components can be bounded and no weight is
+        negative.
+        """
+        bounds = dict()
+        for cost_function, weight in self.components:
+            component_bounds = cost_function.boundNodes(dag1, dag2)
+            if component_bounds is None or weight < 0:
+                return None
+            for pair, bound in component_bounds.iteritems():
+                bounds[pair] = bounds.get(pair, 0) + weight * bound
+
+        return bounds
+
+    def prepare(self, dag):
+        for cost_function, _ in self.components:
+            cost_function.prepare(dag)
+
+    def scoreMappings(self, mappings1, mappings2):
+        scores = [[0] * len(mappings2) for _ in mappings1]
+        for cost_function, weight in self.components:
+            component_scores = cost_function.scoreMappings(mappings1,
+                                                           mappings2)
+            for row, component_row in zip(scores, component_scores):
+                for position, score in enumerate(component_row):
+                    row[position] += weight * score
+
+        return scores
+
+
+# Registry of the cost functions that can be referenced by name, check the
+# function costAssembler of the comparator.
+COST_FUNCTIONS = {
+    'edit_distance': EditDistanceCost,
+    'default': DefaultCost
+}
+
+
+def register_cost_function(name, cost_function):
+    """
+    Registers a cost function so it can be referenced by its name.
+
+    name -> The name of the cost function.
+    cost_function -> A subclass of CostFunction that can be created without
+                     arguments.
+    """
+    COST_FUNCTIONS[name] = cost_function
+
+
+def get_cost_function(name):
+    """
+    Returns a new instance of the cost function registered with the given
+    name. If there isn't any it raises an exception.
+    """
+    if name not in COST_FUNCTIONS:
+        raise ValueError("Unknown cost function: " + str(name))
+
+    return COST_FUNCTIONS[name]()
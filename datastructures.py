@@ -15,3 +15,20 @@ DirectedAcyclicSubgraphWithVariables = namedtuple('DirectedAcyclicSubgraphWithVa
                                                   ['graph',
                                                    'subgraph',
                                                    'variables'])
+
+# This data structure represents an edit of a dag. The operation must be one
+# of 'add_node', 'remove_node', 'add_edge', 'remove_edge' or 'relabel'. For
+# the edges source and target are the nodes of the edge, for 'add_node' and
+# 'remove_node' source is the node and target is not used, for 'relabel'
+# source is the current label of the node and target the new one.
+DirectedAcyclicGraphEdit = namedtuple('DirectedAcyclicGraphEdit',
+                                      ['operation',
+                                       'source',
+                                       'target'])
+
+# This data structure represents the changes on the variable mappings of a
+# dag after an edit. Both fields are lists of
+# DirectedAcyclicSubgraphWithVariables, removed contains the mappings that
+# are no longer valid and added the new ones.
+VariableMappingsUpdate = namedtuple('VariableMappingsUpdate', ['removed',
+                                                               'added'])
@@ -1,14 +1,25 @@
 from directed_acyclic_graph_mapper import DirectedAcyclicGraphMapper
 
+from hypergraph import ArrayHypergraph
 from hypergraph import Hypergraph
+from hypergraph import LazyHypergraph
+
+from cost_functions import CostFunction
+from cost_functions import DefaultCost
+from cost_functions import EditDistanceCost
+from cost_functions import WeightedCost
+from cost_functions import get_cost_function
 
 from utils import stringifyGraph
-from utils import t_cost_default
-from utils import t_cost_edit_distance_graphs_with_vars
-from utils import t_cost_edit_distance_graphs_no_vars
 
 from utils import DEBUG_MODE
 
+# The data of each hyperedge is the id of the pair of mappings that forms it,
+# the id of each mapping is its position on the table of mappings of its dag
+# and both are packed on a single integer, check getHyperedgeMappings.
+MAPPING_ID_BITS = 32
+MAPPING_ID_MASK = (1 << MAPPING_ID_BITS) - 1
+
 
 class DirectedAcyclicGraphComparator:
     """
@@ -26,133 +37,170 @@ class DirectedAcyclicGraphComparator:
                     variables. As a value it will store the sum of the cost of
                     the variables plus applying the transformation function to
                     the graphs without the nodes being substituted. Each
-                    hyperedge must be different.
+                    hyperedge must be different. The data of the hyperedges
+                    is the id of the pair of mappings that forms them, the
+                    mappings (and their subgraphs) are obtained with the
+                    functions getHyperedgeMappings and getHyperedgeSubgraphs.
     """
-    def __init__(self, dag1, dag2):
+    def __init__(self, dag1, dag2, cache=None, cost_function=None):
         """
         The first and second parameters must be DirectedAcyclicGraphs as
-        specified on the file datastructures.py"
+        specified on the file datastructures.py". They can also be
+        DirectedAcyclicGraphMappers, in that case the mappers are reused along
+        the mappings they have already generated for the nodes of their dags.
+
+        cache is optional, if specified it must be a MappingCache that will
+        be shared by the mappers of both dags.
+
+        cost_function is optional, if specified it must be a CostFunction as
+        specified on the file cost_functions.py, by default the edit distance
+        is used. Check also the function costAssembler.
         """
 
-        self.dag1_mapper = DirectedAcyclicGraphMapper(dag1)
-        self.dag2_mapper = DirectedAcyclicGraphMapper(dag2)
+        mappers = []
+        for dag in (dag1, dag2):
+            if not isinstance(dag, DirectedAcyclicGraphMapper):
+                dag = DirectedAcyclicGraphMapper(dag, cache)
+            mappers.append(dag)
+        self.dag1_mapper, self.dag2_mapper = mappers
         self.hypergraph = Hypergraph()
+        self.mapping_tables = (list(), list())
+        self.node_pairs = dict()
+        if cost_function is None:
+            cost_function = EditDistanceCost()
+        self.cost_function = cost_function
 
     def costAssembler(self, functions):
-        pass
+        """
+        This function combines several cost functions into the one used to
+        build the hypergraph, the resulting cost is the weighted sum of them.
 
-    def __sort_by_num_of_variables(self, v):
-        max_num_of_variables = max(map(lambda x: len(x.variables), v))
-        answers = tuple([[] for _ in xrange(max_num_of_variables)])
+        functions -> A sequence of tuples (cost function, weight), the cost
+                     function can be either a CostFunction or the name of a
+                     registered one (check the file cost_functions.py).
 
-        for x in v:
-            answers[len(x.variables)-1].append(x)
+        The function returns the assembled cost function.
+        """
+        components = []
+        for cost_function, weight in functions:
+            if not isinstance(cost_function, CostFunction):
+                cost_function = get_cost_function(cost_function)
+            components.append((cost_function, weight))
 
-        return answers
+        self.cost_function = WeightedCost(components)
 
-    def __iterate_over_sorted_maps(self, s1, s2):
-        for x1, x2 in zip(s1, s2):
-            for map1 in x1:
-                for map2 in x2:
-                    yield (map1, map2)
+        return self.cost_function
 
-    def buildHyperGraph(self, number_of_variables=float('inf')):
+    def __sort_by_num_of_variables(self, v, table):
         """
-        This function builds the hypergraph that will contain the comparision
-        between the two dags and all its subgraphs
+        Groups the mappings by their number of variables. The mappings can be
+        consumed lazily from a generator as they are grouped in one pass.
 
-        The function returns a hypergraph containing the comparision between
-        the two dags.
+        Each mapping is appended to the given table of mappings and the groups
+        contain their ids, that is their positions on the table. If an id
+        doesn't fit on the bits reserved for it (check MAPPING_ID_BITS) it
+        raises an exception.
         """
+        answers = []
 
-        # Compute the nodes of the hypergraph and its associated cost. Each
-        # node is formed by each possible pair created using two random nodes
-        # of each dag.
-        g1 = self.dag1_mapper.dag
-        g2 = self.dag2_mapper.dag
-        for n1 in self.dag1_mapper.dag.links.iterkeys():
-            for n2 in self.dag2_mapper.dag.links.iterkeys():
-                # value = t_cost_function_distance([n1], [n2])
-                value = t_cost_edit_distance_graphs_no_vars(g1, n1,
-                                                            g2, n2)
-                self.hypergraph.addNode((n1, n2), value)
-
-        # In the algorithm we don't allow to compute the cost function between
-        # two subgraphs with different number of variables. Here
-        # we sort both sequences of subgraphs by its number of variables to
-        # assure that doesn't happen.
-        map1_sorted_by_vars = self.__sort_by_num_of_variables(
-            self.dag1_mapper.generateAllVariableMappings(number_of_variables=
-                                                         number_of_variables))
-        map2_sorted_by_vars = self.__sort_by_num_of_variables(
-            self.dag2_mapper.generateAllVariableMappings(number_of_variables=
-                                                         number_of_variables))
+        for x in v:
+            if len(table) > MAPPING_ID_MASK:
+                raise ValueError("Too many mappings, their ids don't fit " +
+                                 "on " + str(MAPPING_ID_BITS) + " bits")
+            num_of_variables = len(x.variables)
+            while len(answers) < num_of_variables:
+                answers.append([])
+            answers[num_of_variables-1].append(len(table))
+            table.append(x)
+
+        return tuple(answers)
+
+    def countHyperedges(self, number_of_variables=float('inf')):
+        """
+        This function returns the number of hyperedges that buildHyperGraph
+        would add to the hypergraph without building it.
 
-        # Thanks to its ordering coming from the Mapper class the hypergraph
-        # will be built on a top down fashion.
-        # map1 and map2 will always contain the same number of variables.
-        for map1, map2 in self.__iterate_over_sorted_maps(map1_sorted_by_vars,
-                                                          map2_sorted_by_vars):
-            # This variable will contain the total coming from the
-            # substituted variables.
-            # total_from_variables = 0.0
-
-            # The node of the hypergraph.
-            hypergraph_node = (map1.subgraph.root, map2.subgraph.root)
-
-            # The current hyperedge, on this implementation the order
-            # matters the first node will be the node acting as a root
-            # and the rest the nodes that are going to be substituted
-            # by variables.
-            hyperedge = (hypergraph_node, ) + tuple(zip(map1.variables,
-                                                        map2.variables))
-
-            # The cost of the node of the hypergraph.
-            # f1 = t_cost_function([map1.subgraph.root],
-            #                      [map2.subgraph.root])
-            f1 = t_cost_edit_distance_graphs_with_vars(map1, map2)
-
-            # This is for debuging pourposes
-            if DEBUG_MODE:
-                print stringifyGraph(map1.graph,
-                                     map1.subgraph.root,
-                                     map1.variables,
-                                     map1.subgraph.nodes)
-                print stringifyGraph(map2.graph,
-                                     map2.subgraph.root,
-                                     map2.variables,
-                                     map2.subgraph.nodes)
-
-                print 'Hyperedge', hyperedge
-
-            # Obtain the accumulated value for the variables involved on
-            # the substitution.
-            # for n1, n2 in zip(map1.variables, map2.variables):
-            #     if DEBUG_MODE:
-            #         print 'Querying:', n1, n2
-            #     total_from_variables += self.hypergraph.getNodeWeight((n1,
-            #                                                            n2))
+        Only the mappings with the same number of variables are compared, so
+        the result is the sum for each number of variables of the product of
+        the number of mappings of both dags. The mappings are counted, not
+        generated, check the function countAllVariableMappings.
+        """
+        totals = []
+        for mapper in (self.dag1_mapper, self.dag2_mapper):
+            total = dict()
+            for _, counts in mapper.countAllVariableMappings(
+                    number_of_variables):
+                for variables, count in counts.iteritems():
+                    total[variables] = total.get(variables, 0) + count
+            totals.append(total)
+
+        return sum(count * totals[1].get(variables, 0)
+                   for variables, count in totals[0].iteritems())
+
+    def buildHyperGraph(self, number_of_variables=float('inf'),
+                        processes=None, lazy=False, best_only=False,
+                        compact=False, sink=None):
+        """
+        This function builds the hypergraph that will contain the comparision
+        between the two dags and all its subgraphs, the nodes and the
+        hyperedges are scored with the cost function of the comparator.
+
+        processes is optional, if specified the mappings of the dags are
+        generated in parallel using a pool with that number of processes.
+
+        lazy is optional, if True the hypergraph is a LazyHypergraph, the
+        hyperedges that start on a node are only generated the first time the
+        node is expanded (the TransitionsIterator does it when it reaches the
+        node). Only the mappings rooted at the nodes of the expanded pairs are
+        generated, so neither the processes nor the cache of the mappers are
+        used.
+
+        best_only is optional, if True the hypergraph is built lazily and
+        each hyperedge is only scored the first time its weight is requested.
+        The TransitionsIterator only requests the weights of the hyperedges
+        it selects, combined with the bounds of getNodeBounds most of the
+        hypergraph is never generated nor scored when only the best
+        derivation is computed.
+
+        compact is optional, if True the whole hypergraph is stored on an
+        ArrayHypergraph, that uses far less memory than the Hypergraph. It
+        can't be combined with lazy nor best_only.
+
+        sink is optional, if specified the nodes and hyperedges of the whole
+        hypergraph are sent to that HypergraphSink as they are generated
+        (check the file hypergraph.py), the hypergraph is the one returned by
+        its function finalize. For example a HypergraphFileWriter writes them
+        to a file so the hypergraph doesn't have to fit in memory. If the
+        hypergraph can't be built the function discard of the sink is called.
+        It can't be combined with lazy nor best_only.
 
-            # Add the hyperedge to the graph
-            # The hyperedges are directed and as the algorithm works
-            # there should't be any duplicates so there is no need to
-            # check if it exists.
-            subgraphs = (map1.subgraph, map2.subgraph)
-            # weight = f1 + total_from_variables
-            weight = f1 
-            self.hypergraph.addHyperedge(hyperedge, subgraphs, weight)
-
-            # Check if with the values we have computed we have to update
-            # value of the node.
-            # if (f1 + total_from_variables) > \
-            #    self.hypergraph.getNodeValue(hypergraph_node):
-            #     self.hypergraph.updateNode(hypergraph_node,
-            #                                (f1 + total_from_variables))
-
-            # if DEBUG_MODE:
-            #     print 'Partial graph value', f1
-            #     print 'Variables value', total_from_variables
-            #     print "=========================="
+        The function returns a hypergraph containing the comparision between
+        the two dags.
+        """
+        if (lazy or best_only) and compact:
+            raise ValueError("The hypergraphs built lazily can't be " +
+                             "compact")
+        if (lazy or best_only) and sink is not None:
+            raise ValueError("The hypergraphs built lazily can't be sent " +
+                             "to a sink")
+
+        if lazy or best_only:
+            self.__buildLazyHyperGraph(self.cost_function,
+                                       number_of_variables,
+                                       best_only)
+        else:
+            if sink is not None:
+                self.hypergraph = sink
+            elif compact:
+                self.hypergraph = ArrayHypergraph()
+            try:
+                self.__buildHyperGraph(self.cost_function,
+                                       number_of_variables,
+                                       processes)
+            except:
+                self.hypergraph.discard()
+                raise
+            self.hypergraph = self.hypergraph.finalize()
 
         if DEBUG_MODE:
             print "\nNodes:"
@@ -162,6 +210,45 @@ class DirectedAcyclicGraphComparator:
             print "=========================="
             self.hypergraph.printHyperedges()
 
+    def getNodeBounds(self):
+        """
+        This function returns a dictionary with an upper bound of the
+        accumulated weight of any derivation starting on each node of the
+        hypergraph, or None if the cost function of the comparator can't bound
+        them. Check the function boundNodes of the cost functions.
+        """
+        return self.cost_function.boundNodes(self.dag1_mapper.dag,
+                                             self.dag2_mapper.dag)
+
+    def getHyperedgeMappings(self, hyperedge):
+        """
+        This function returns the tuple with the mappings of the first and
+        the second dag that form a hyperedge of the hypergraph. If the
+        hyperedge doesn't exist it raises an exception.
+        """
+        data = self.hypergraph.getHyperedgeLabel(hyperedge).data
+
+        return self.__getMappings(data)
+
+    def getHyperedgeSubgraphs(self, hyperedge):
+        """
+        This function returns the tuple with the subgraphs of the first and
+        the second dag that form a hyperedge of the hypergraph. If the
+        hyperedge doesn't exist it raises an exception.
+        """
+        map1, map2 = self.getHyperedgeMappings(hyperedge)
+
+        return map1.subgraph, map2.subgraph
+
+    def __getMappings(self, data):
+        """
+        Auxiliary function that returns the pair of mappings of the id stored
+        as the data of a hyperedge.
+        """
+        table1, table2 = self.mapping_tables
+
+        return table1[data >> MAPPING_ID_BITS], table2[data & MAPPING_ID_MASK]
+
     def buildHyperGraphDebug(self, number_of_variables=float('inf')):
         """
         Debugging function that uses the default computing cost function
@@ -169,25 +256,149 @@ class DirectedAcyclicGraphComparator:
 
         Used for testing purposes.
         """
+        self.__buildHyperGraph(DefaultCost(), number_of_variables)
 
+    def __addNodes(self, cost_function):
+        """
+        Auxiliary function that adds the nodes of the hypergraph.
+
+        Each node is formed by each possible pair created using two random
+        nodes of each dag. The costs of all the pairs are computed at once.
+        The pairs are stored on node_pairs so all the hyperedges share the
+        same tuples, the tables of mappings are also reset.
+        """
+        costs = cost_function.scoreNodes(self.dag1_mapper.dag,
+                                         self.dag2_mapper.dag)
+        self.mapping_tables = (list(), list())
+        self.node_pairs = dict()
         for n1 in self.dag1_mapper.dag.links.iterkeys():
+            pairs = self.node_pairs[n1] = dict()
             for n2 in self.dag2_mapper.dag.links.iterkeys():
-                value = t_cost_default([n1], [n2])
-                self.hypergraph.addNode((n1, n2), value)
+                pairs[n2] = (n1, n2)
+                self.hypergraph.addNode(pairs[n2], costs[(n1, n2)])
 
+    def __iterHyperedges(self, cost_function, map1_sorted_by_vars,
+                         map2_sorted_by_vars):
+        """
+        Auxiliary generator that yields the tuples (hyperedge, data, weight)
+        formed by each pair of mappings with the same number of variables,
+        the groups contain the ids of the mappings. If cost_function is None
+        the hyperedges are not scored and the weights are None.
+        """
+        table1, table2 = self.mapping_tables
+        node_pairs = self.node_pairs
+
+        # map1 and map2 will always contain the same number of variables, the
+        # costs of each group are computed at once by the cost function.
+        for ids1, ids2 in zip(map1_sorted_by_vars, map2_sorted_by_vars):
+            maps1 = [table1[x] for x in ids1]
+            maps2 = [table2[x] for x in ids2]
+            if cost_function is None:
+                scores = [[None] * len(maps2) for _ in maps1]
+            else:
+                scores = cost_function.scoreMappings(maps1, maps2)
+            for id1, map1, row in zip(ids1, maps1, scores):
+                pairs = node_pairs[map1.subgraph.root]
+                id1 <<= MAPPING_ID_BITS
+                for id2, map2, weight in zip(ids2, maps2, row):
+                    # The node of the hypergraph.
+                    hypergraph_node = pairs[map2.subgraph.root]
+
+                    # The current hyperedge, on this implementation the order
+                    # matters the first node will be the node acting as a
+                    # root and the rest the nodes that are going to be
+                    # substituted by variables.
+                    hyperedge = (hypergraph_node, ) + \
+                        tuple([node_pairs[v1][v2] for v1, v2 in
+                               zip(map1.variables, map2.variables)])
+
+                    # This is for debuging pourposes
+                    if DEBUG_MODE:
+                        print stringifyGraph(map1.graph,
+                                             map1.subgraph.root,
+                                             map1.variables,
+                                             map1.subgraph.nodes)
+                        print stringifyGraph(map2.graph,
+                                             map2.subgraph.root,
+                                             map2.variables,
+                                             map2.subgraph.nodes)
+
+                        print 'Hyperedge', hyperedge
+
+                    yield hyperedge, id1 | id2, weight
+
+    def __buildHyperGraph(self, cost_function, number_of_variables,
+                          processes=None):
+        """
+        Auxiliary function that builds the hypergraph using the given cost
+        function.
+        """
+        self.__addNodes(cost_function)
+
+        # In the algorithm we don't allow to compute the cost function between
+        # two subgraphs with different number of variables. Here
+        # we sort both sequences of subgraphs by its number of variables to
+        # assure that doesn't happen.
         map1_sorted_by_vars = self.__sort_by_num_of_variables(
-            self.dag1_mapper.generateAllVariableMappings(number_of_variables=
-                                                         number_of_variables))
+            self.dag1_mapper.iterAllVariableMappings(number_of_variables=
+                                                     number_of_variables,
+                                                     processes=processes),
+            self.mapping_tables[0])
         map2_sorted_by_vars = self.__sort_by_num_of_variables(
-            self.dag2_mapper.generateAllVariableMappings(number_of_variables=
-                                                         number_of_variables))
-
-        for map1, map2 in self.__iterate_over_sorted_maps(map1_sorted_by_vars,
-                                                          map2_sorted_by_vars):
-            hypergraph_node = (map1.subgraph.root, map2.subgraph.root)
-            hyperedge = (hypergraph_node, ) + tuple(zip(map1.variables,
-                                                        map2.variables))
-            weight = t_cost_default(map1.subgraph.nodes, map2.subgraph.nodes)
-
-            subgraphs = (map1.subgraph, map2.subgraph)
-            self.hypergraph.addHyperedge(hyperedge, subgraphs, weight)
+            self.dag2_mapper.iterAllVariableMappings(number_of_variables=
+                                                     number_of_variables,
+                                                     processes=processes),
+            self.mapping_tables[1])
+
+        # Thanks to its ordering coming from the Mapper class the hypergraph
+        # will be built on a top down fashion.
+        for hyperedge, data, weight in \
+                self.__iterHyperedges(cost_function,
+                                      map1_sorted_by_vars,
+                                      map2_sorted_by_vars):
+            # Add the hyperedge to the graph
+            # The hyperedges are directed and as the algorithm works
+            # there should't be any duplicates so there is no need to
+            # check if it exists.
+            self.hypergraph.addHyperedge(hyperedge, data, weight)
+
+    def __buildLazyHyperGraph(self, cost_function, number_of_variables,
+                              deferred_scoring=False):
+        """
+        Auxiliary function that builds a LazyHypergraph using the given cost
+        function, only the nodes are added. The mappings rooted at each node
+        of the dags are generated once by the mappers, check the function
+        getNodeVariableMappings, and grouped when the first pair containing
+        the node is expanded. If deferred_scoring is True the hyperedges are
+        scored one by one when their weights are requested.
+        """
+        node_mappings = (dict(), dict())
+
+        def expand(node):
+            mappings = []
+            for mapper, n, cache, table in zip((self.dag1_mapper,
+                                                self.dag2_mapper),
+                                               node,
+                                               node_mappings,
+                                               self.mapping_tables):
+                if n not in cache:
+                    cache[n] = self.__sort_by_num_of_variables(
+                        mapper.getNodeVariableMappings(n,
+                                                       number_of_variables),
+                        table)
+                mappings.append(cache[n])
+
+            if deferred_scoring:
+                return self.__iterHyperedges(None, *mappings)
+            return self.__iterHyperedges(cost_function, *mappings)
+
+        def score(hyperedge, data):
+            map1, map2 = self.__getMappings(data)
+
+            return cost_function.scoreMappings([map1], [map2])[0][0]
+
+        if deferred_scoring:
+            self.hypergraph = LazyHypergraph(expand, score)
+        else:
+            self.hypergraph = LazyHypergraph(expand)
+        self.__addNodes(cost_function)
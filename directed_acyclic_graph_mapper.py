@@ -1,9 +1,161 @@
-from collections import defaultdict, deque
+from collections import deque, namedtuple
+from multiprocessing import Pool
 
 from datastructures import DirectedAcyclicSubgraph
 from datastructures import DirectedAcyclicSubgraphWithVariables
+from datastructures import VariableMappingsUpdate
 from utils import stringifyGraph
 
+# This data structure holds the integer positions assigned to the nodes of a
+# dag so sets of nodes can be represented as bitmasks. nodes is the sorted
+# tuple of nodes, positions maps each node to its position and children
+# contains the bitmask of the children of each position.
+NodeIndex = namedtuple('NodeIndex', ['nodes', 'positions', 'children'])
+
+# Mapper used by the processes of the pool when the mappings are generated in
+# parallel, check the function iterAllVariableMappings.
+worker_mapper = None
+
+
+def initialize_worker(dag):
+    """
+    Initializer of the processes of the pool, it builds the mapper of the
+    worker only once.
+    """
+    global worker_mapper
+    worker_mapper = DirectedAcyclicGraphMapper(dag)
+
+
+def generate_chunk_variable_mappings(subgraphs, number_of_variables):
+    """
+    Function executed by the processes of the pool. It returns a list with
+    the list of variable mappings of each one of the given subgraphs.
+    """
+    return [list(worker_mapper.iterVariableMappings(subgraph.root,
+                                                    number_of_variables,
+                                                    subgraph.nodes))
+            for subgraph in subgraphs]
+
+
+class SelectableNodesIndex:
+    """
+    This class indexes the nodes of a source subgraph in which a variable can
+    be placed once a set of nodes has been taken.
+
+    A node is selectable if it can be reached from the root of the dag
+    using only nodes of the subgraph that haven't been taken. All the sets of
+    nodes are bitmasks as produced by the mapper.
+
+    The index stores the nodes reachable when nothing has been taken, the
+    children of the root of the dag and the ancestors of each reachable node
+    inside the subgraph. With them most of the queries are answered without
+    traversing the graph, the rest are traversed once and memoized.
+    """
+
+    def __init__(self, root_position, children, available_nodes):
+        """
+        root_position -> The position of the root of the dag.
+        children -> The bitmasks of children of each position of the dag.
+        available_nodes -> The bitmask of nodes of the subgraph.
+        """
+        self.children = children
+        self.available_nodes = available_nodes
+        self.root_children = children[root_position] & available_nodes
+        self.cache = dict()
+        self.reachable = self.getSelectableNodes(0)
+        self.ancestors = self.__buildAncestors()
+
+    def __buildAncestors(self):
+        """
+        Computes for each reachable node the bitmask of the reachable nodes
+        from which it can be reached. The nodes are processed in topological
+        order so the ancestors of a node are complete before visiting its
+        children.
+        """
+        reachable = self.reachable
+
+        # Number of reachable parents of each reachable node
+        parents = dict()
+        remaining = reachable
+        while remaining:
+            node = remaining & -remaining
+            remaining ^= node
+            parents.setdefault(node, 0)
+            node_children = self.children[node.bit_length() - 1] & reachable
+            while node_children:
+                child = node_children & -node_children
+                node_children ^= child
+                parents[child] = parents.get(child, 0) + 1
+
+        ancestors = dict((node, 0) for node in parents)
+        frontier = [node for node, total in parents.iteritems() if not total]
+        while frontier:
+            node = frontier.pop()
+            node_ancestors = ancestors[node] | node
+            node_children = self.children[node.bit_length() - 1] & reachable
+            while node_children:
+                child = node_children & -node_children
+                node_children ^= child
+                ancestors[child] |= node_ancestors
+                parents[child] -= 1
+                if not parents[child]:
+                    frontier.append(child)
+
+        return ancestors
+
+    def getSelectableNodes(self, taken_nodes):
+        """
+        This functions computes all the possible paths of the graph starting
+        from the root and using only the nodes of the subgraph that haven't
+        been taken. The function returns a bitmask with the reachable nodes,
+        the results are memoized.
+
+        Ex:
+           ---a
+          |  / \
+          |  b-c
+          |  | |
+           --d e
+        Subgraph nodes: "bcde"
+        Taken nodes: "b"
+        Output: "cde"
+        """
+        if taken_nodes in self.cache:
+            return self.cache[taken_nodes]
+
+        children = self.children
+        available_nodes = self.available_nodes & ~taken_nodes
+
+        reachable = 0
+        frontier = self.root_children & available_nodes
+        while frontier:
+            reachable |= frontier
+            next_frontier = 0
+            while frontier:
+                lowest = frontier & -frontier
+                next_frontier |= children[lowest.bit_length() - 1]
+                frontier ^= lowest
+            frontier = next_frontier & available_nodes & ~reachable
+
+        self.cache[taken_nodes] = reachable
+        return reachable
+
+    def isSelectable(self, node, taken_nodes):
+        """
+        Checks if a node (a bitmask with only one node) is selectable once
+        the nodes on taken_nodes have been taken.
+        """
+        if node & taken_nodes or not node & self.reachable:
+            return False
+
+        # The children of the root are always reachable and the rest remain
+        # reachable if none of its ancestors has been taken.
+        if node & self.root_children or \
+           not self.ancestors[node] & taken_nodes:
+            return True
+
+        return bool(self.getSelectableNodes(taken_nodes) & node)
+
 
 class DirectedAcyclicGraphMapper:
     """
@@ -15,62 +167,151 @@ class DirectedAcyclicGraphMapper:
     generateAllVariableCombinations has to be used
     """
 
-    def __init__(self, dag):
+    def __init__(self, dag, cache=None):
+        """
+        cache is optional, if specified it must be a MappingCache and it will
+        be used to store and retrieve the mappings generated by the function
+        iterAllVariableMappings.
+        """
         self.dag = dag
+        self.cache = cache
+        self.successors_table = None
+        self.node_index = None
+        self.tracked_mappings = None
+        self.node_mappings = dict()
 
-    # TODO: Currently a recursive version, create the iterative version
-    def __buildSuccessors(self, node, depth, antecessors, successors):
-        """
-        Auxiliary recursive function that compute all the possible successors
-        of a node in a graph indicating also its minimum distance. The function
-        does the  same recursively for all its descendants.
-        Input:
-         node: The node from which we want to compute the successors.
-         depth: The current depth of the recursion it must start on 0.
-         antecessor: The set of antecessors of the current node. The first call
-                     must use an empty set.
-         successors: A dictionary of dictionaries, it will contain the successors
-                     and the minimum distance to each one from the root.
-                     This parameter will also be the output. The dictionary is
-                     mutated on place so the paramater is a referece. The first
-                     call must use an empty defaultdict(dict).
+    def __topologicalOrder(self, node):
+        """
+        Auxiliary function that returns the nodes reachable from node in
+        reverse topological order, that is, every node appears after all its
+        descendants. The traversal is an iterative depth first search so deep
+        graphs don't hit the recursion limit.
         Ex: For the graph
               a
              / \
              b c
-        It will return on successors
-        defaultdict(<type 'dict'>, {'a': {'c': 1, 'b': 1}})
+        It will return ['b', 'c', 'a']
         """
-
-        for antecessor in antecessors:
-            temp_dict = successors[antecessor]
-            if node not in temp_dict:
-                temp_dict[node] = depth
+        order = []
+        visited = set([node])
+        stack = [(node, iter(self.dag.links[node]))]
+        while stack:
+            current, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(self.dag.links[child])))
+                    break
             else:
-                if depth < temp_dict[node]:
-                    temp_dict[node] = depth
+                stack.pop()
+                order.append(current)
+
+        return order
+
+    def __buildSuccessorsTable(self, node):
+        """
+        Auxiliary function that computes the successors of every node reachable
+        from node along with the minimum distance to each one of them.
+
+        The nodes are visited once in reverse topological order so the
+        successors of a node are built by merging the already computed
+        successors of its children. The cost is proportional to the number of
+        nodes times the number of edges instead of the number of paths of the
+        graph.
+        Output: A dictionary of dictionaries, for each node the dictionary of
+                its successors and the minimum distance to each one of them.
+        Ex: For the graph
+              a
+             / \
+             b c
+        It will return
+        {'a': {'c': 1, 'b': 1}, 'b': {}, 'c': {}}
+        """
+        table = dict()
+        for current in self.__topologicalOrder(node):
+            distances = dict()
+            for child in self.dag.links[current]:
+                distances[child] = 1
+                for successor, distance in table[child].iteritems():
+                    distance += 1
+                    if successor not in distances or \
+                       distance < distances[successor]:
+                        distances[successor] = distance
+            table[current] = distances
+
+        return table
+
+    def __getSuccessorsTable(self):
+        """
+        Returns the table of successors and minimum distances for the nodes
+        reachable from the root of the dag. The table is computed the first
+        time it is requested.
+        """
+        if self.successors_table is None:
+            self.successors_table = self.__buildSuccessorsTable(self.dag.root)
 
-        next_antecessors = antecessors.union(node)
-        for child in self.dag.links[node]:
-            self.__buildSuccessors(child,
-                                   depth + 1,
-                                   next_antecessors,
-                                   successors)
+        return self.successors_table
 
-    def __get_minimum_distance_from_root(self, node, successors):
+    def __get_minimum_distance_from_root(self, node):
         """
         This functions returns the minium distance between a node and the root
         of the dag.
 
-        The distances are precomputed on the successors param
+        The distances are precomputed on the table of successors.
         """
         if node == self.dag.root:
             return 0
 
-        if node in successors[self.dag.root]:
-            return successors[self.dag.root][node]
+        return self.__getSuccessorsTable()[self.dag.root].get(node, -1)
+
+    def __getNodeIndex(self):
+        """
+        Returns the NodeIndex of the dag, it is computed the first time it is
+        requested.
+
+        The nodes are sorted before assigning the positions so iterating over
+        the bits of a bitmask in ascending order gives the nodes sorted.
+        """
+        if self.node_index is None:
+            nodes = tuple(sorted(self.dag.links.iterkeys()))
+            positions = dict((node, position)
+                             for position, node in enumerate(nodes))
+            children = []
+            for node in nodes:
+                mask = 0
+                for child in self.dag.links[node]:
+                    mask |= 1 << positions[child]
+                children.append(mask)
+            self.node_index = NodeIndex(nodes, positions, tuple(children))
+
+        return self.node_index
+
+    def __toBitmask(self, nodes):
+        """
+        Returns the bitmask that represents the given nodes.
+        """
+        positions = self.__getNodeIndex().positions
+        mask = 0
+        for node in nodes:
+            if node not in positions:
+                raise ValueError("The node " + str(node) + " does not " +
+                                 "belong to the graph")
+            mask |= 1 << positions[node]
+
+        return mask
+
+    def __fromBitmask(self, mask):
+        """
+        Returns the sorted tuple of nodes represented by a bitmask.
+        """
+        nodes = self.__getNodeIndex().nodes
+        result = []
+        while mask:
+            lowest = mask & -mask
+            result.append(nodes[lowest.bit_length() - 1])
+            mask ^= lowest
 
-        return -1
+        return tuple(result)
 
     def generateSourceSubgraphs(self, max_depth=float("inf")):
         """
@@ -116,9 +357,6 @@ class DirectedAcyclicGraphMapper:
         solutions = deque()
         frontier = deque()
         processed_roots = set()
-        successors = defaultdict(dict)
-
-        self.__buildSuccessors(self.dag.root, 0, set(), successors)
 
         frontier.append((self.dag.root, 0))
         while len(frontier):
@@ -126,19 +364,11 @@ class DirectedAcyclicGraphMapper:
             # If the current depth is bigger than the minimum length required
             # to reach it from the root we are dealing with an alternative
             # longer path that can lead to incorrect answers so just skip it.
-            if depth > self.__get_minimum_distance_from_root(node, successors)\
-               or node in processed_roots:
+            if depth > self.__get_minimum_distance_from_root(node) or \
+               node in processed_roots:
                 continue
-            # Get the nodes that are below the requested depth
-            nodes = tuple()
-            if successors[node]:
-                node_successors = successors[node]
-                nodes = filter(lambda x: (node_successors[x] - depth) <= max_depth,
-                               node_successors.iterkeys())
-
             if node not in processed_roots:
-                subgraph = DirectedAcyclicSubgraph(node, ((node,) +
-                                                          tuple(nodes)))
+                subgraph = self.__buildSourceSubgraph(node, max_depth)
                 solutions.appendleft(subgraph)
                 processed_roots.add(node)
             depth += 1
@@ -148,38 +378,220 @@ class DirectedAcyclicGraphMapper:
 
         return solutions
 
-    def __getSelectableNodes(self, available_nodes):
+    def __buildSourceSubgraph(self, node, max_depth):
         """
-        This functions computes all the possible paths of the graph
-        starting from the root and using only the nodes in available_nodes.
-        The function returns a set with the reachable nodes.
+        Auxiliary function that builds the source subgraph rooted at a node,
+        formed by the node and its successors below the requested depth.
+        """
+        nodes = tuple()
+        successors = self.__getSuccessorsTable()
+        if successors[node]:
+            node_successors = successors[node]
+            nodes = filter(lambda x: node_successors[x] <= max_depth,
+                           node_successors.iterkeys())
 
-        Auxiliary function used to compute all the valid positions
-        in which we can put a variable.
+        return DirectedAcyclicSubgraph(node, ((node,) + tuple(nodes)))
 
-        Ex:
-           ---a
-          |  / \
-          |  b-c
-          |  | |
-           --d e
-        Available nodes: "cde"
-        Output: set(['d', 'e', 'c'])
+    def generateSourceSubgraph(self, node, max_depth=float("inf")):
+        """
+        This function returns the source subgraph of generateSourceSubgraphs
+        whose root is the given node without generating the rest of them. If
+        the node doesn't belong to the dag it raises an exception.
+        """
+        if max_depth < 0:
+            raise ValueError("The depth has to be a positive integer")
+
+        if node not in self.dag.links:
+            raise ValueError("The node " + str(node) + " does not belong " +
+                             "to the graph")
+
+        return self.__buildSourceSubgraph(node, max_depth)
+
+    def iterNodeVariableMappings(self,
+                                 node,
+                                 number_of_variables=float("inf"),
+                                 max_depth=float("inf")):
+        """
+        This function yields the variable mappings that
+        iterAllVariableMappings generates for the source subgraph rooted at
+        the given node, the mappings of the rest of the source subgraphs are
+        not generated. Used to build the hypergraph on demand.
+        """
+        subgraph = self.generateSourceSubgraph(node, max_depth)
+        for variables in self.iterVariableMappings(subgraph.root,
+                                                   number_of_variables,
+                                                   subgraph.nodes):
+            yield DirectedAcyclicSubgraphWithVariables(self.dag,
+                                                       subgraph,
+                                                       variables)
+
+    def getNodeVariableMappings(self,
+                                node,
+                                number_of_variables=float("inf"),
+                                max_depth=float("inf")):
+        """
+        List version of iterNodeVariableMappings. The mappings are generated
+        the first time they are requested for a node and kept until the dag
+        is edited, so the mappings of a dag compared with many others are
+        generated once.
+        """
+        key = (node, number_of_variables, max_depth)
+        if key not in self.node_mappings:
+            self.node_mappings[key] = \
+                list(self.iterNodeVariableMappings(node,
+                                                   number_of_variables,
+                                                   max_depth))
+
+        return self.node_mappings[key]
+
+    def __isValidPlacement(self, variables, selectable_index, father_children):
+        """
+        Checks if a set of variables, given as a bitmask, can be placed at
+        the same time on a subgraph.
+
+        The variables are valid if they can be ordered in a way that every
+        variable but the first one is still selectable (check the class
+        SelectableNodesIndex) once the previous ones are taken and every
+        variable but the last one is a children of the starting node.
+        selectable_index is the SelectableNodesIndex of the subgraph and
+        father_children the bitmask of children of the starting node.
+
+        If the variables can be ordered a valid last variable can always be
+        taken out first, as taking out variables never makes the others less
+        selectable, so the order is built backwards in a greedy way.
+        """
+        # Only one variable can be placed on a node that is not a children
+        # of the starting node and it must be the last one.
+        non_children = variables & ~father_children
+        if non_children and variables != non_children:
+            if non_children & (non_children - 1):
+                return False
+            variables ^= non_children
+            if not selectable_index.isSelectable(non_children, variables):
+                return False
+
+        # While there are at least two variables look for one that can be
+        # the last one.
+        while variables & (variables - 1):
+            remaining = variables
+            while remaining:
+                node = remaining & -remaining
+                remaining ^= node
+                if selectable_index.isSelectable(node, variables ^ node):
+                    variables ^= node
+                    break
+            else:
+                return False
+
+        return True
+
+    def __prepareSubgraph(self,
+                          starting_node,
+                          total_number_of_variables,
+                          initial_nodes):
+        """
+        Auxiliary function that validates the input of the functions that
+        compute the variable positions of a subgraph and builds the data
+        they require. It returns a tuple with the bitmask of valid positions
+        for the variables, the bitmask of children of the starting node and
+        the SelectableNodesIndex of the subgraph.
+        """
+        # Errors
+        # Incorrect number of variables
+        if total_number_of_variables <= 0:
+            raise ValueError("Incorrect number of variables to assign")
+        # Root not belonging to the graph
+        if starting_node not in self.dag.links:
+            raise ValueError("The root does not belong to the graph")
+
+        node_index = self.__getNodeIndex()
+        starting_position = node_index.positions[starting_node]
+
+        if initial_nodes is None:
+            initial_nodes = (1 << len(node_index.nodes)) - 1
+        else:
+            initial_nodes = self.__toBitmask(initial_nodes)
+
+        # Valid positions for the variables.
+        selectable = initial_nodes & ~(1 << starting_position)
+        # Only the children of the starting node allow to keep adding
+        # variables.
+        father_children = node_index.children[starting_position]
+        # Answers which nodes are still selectable once some have been taken.
+        selectable_index = SelectableNodesIndex(
+            node_index.positions[self.dag.root],
+            node_index.children,
+            selectable)
+
+        return selectable, father_children, selectable_index
+
+    def iterVariableMappings(self,
+                             starting_node,
+                             total_number_of_variables,
+                             initial_nodes=None):
+        """
+        Generator version of generateVariableMappings. It yields each valid
+        variable position (a sorted tuple of nodes) as soon as it is found
+        instead of building the whole set of solutions first.
+
+        The arguments are the same as in generateVariableMappings. The input
+        is validated when the first element is requested.
+
+        Every valid set of variables is generated exactly once and in
+        lexicographic order. As any subset of a valid set of variables is also
+        valid, each set is only extended with nodes that come after its last
+        node, so no deduplication is required. Internally the sets of nodes are
+        handled as bitmasks, check the function __getNodeIndex.
         """
 
-        reachable = set()
+        selectable, father_children, selectable_index = \
+            self.__prepareSubgraph(starting_node,
+                                   total_number_of_variables,
+                                   initial_nodes)
+
+        # The frontier is a stack of tuples of 3 elements as follows:
+        #  A bitmask representing where the variables have been set for the
+        #  current configuration.
+        #  The number of variables of the current configuration.
+        #  A bitmask with the nodes that can extend the configuration, that
+        #  is, the selectable nodes after the last node of the configuration.
+        # The elements are pushed in reverse order to pop them sorted.
+        frontier = []
+        candidates = selectable
+        while candidates:
+            node = candidates & -candidates
+            candidates ^= node
+            frontier.append((node, 1, candidates))
+        frontier.reverse()
 
-        frontier = list(self.dag.links[self.dag.root])
         while frontier:
-            node = frontier.pop()
+            variables, number_of_variables, candidates = frontier.pop()
 
-            if node not in available_nodes:
+            if number_of_variables > 1 and \
+               not self.__isValidPlacement(variables,
+                                           selectable_index,
+                                           father_children):
                 continue
 
-            reachable.add(node)
-            frontier.extend(self.dag.links[node])
+            yield self.__fromBitmask(variables)
 
-        return reachable
+            if number_of_variables >= total_number_of_variables:
+                continue
+
+            # Once a variable is set on a node that is not a children of the
+            # starting node only children of the starting node can be added.
+            if variables & ~father_children:
+                candidates &= father_children
+
+            extensions = []
+            while candidates:
+                node = candidates & -candidates
+                candidates ^= node
+                extensions.append((variables | node,
+                                   number_of_variables + 1,
+                                   candidates))
+            extensions.reverse()
+            frontier.extend(extensions)
 
     def generateVariableMappings(self,
                                  starting_node,
@@ -189,94 +601,243 @@ class DirectedAcyclicGraphMapper:
         This function computes all the valid variable positions for a given
         graph. As input it takes the starting node and the total number of
         variables to set.
-        As an output it returns a list of tuples, each tuple is a sequence of
+        As an output it returns a set of tuples, each tuple is a sequence of
         nodes, each one representing a valid position for a variable,
         initial_nodes is an optional parameter that represent the initial set
         of nodes that we will consider.  This, along the starting node, allows
         us to consider subgraphs using only a set of nodes to represent it.
         """
+        return set(self.iterVariableMappings(starting_node,
+                                             total_number_of_variables,
+                                             initial_nodes))
 
-        solutions = set()
+    def __buildChunks(self, source_subgraphs, processes):
+        """
+        Auxiliary function that splits the source subgraphs in chunks to be
+        processed by a pool of processes.
 
-        # Errors
-        # Incorrect number of variables
-        if total_number_of_variables <= 0:
-            raise ValueError("Incorrect number of variables to assign")
-        # Root not belonging to the graph
-        if starting_node not in self.dag.links:
-            raise ValueError("The root does not belong to the graph")
+        The subgraphs are taken from the biggest to the smallest one and the
+        size of a chunk is measured as the total number of nodes of its
+        subgraphs. The big subgraphs dominate the computation so they are
+        sent alone, the small ones are grouped so the pool isn't flooded
+        with tiny tasks. The chunks are returned biggest first as lists of
+        positions of source_subgraphs.
+        """
+        sizes = [len(subgraph.nodes) for subgraph in source_subgraphs]
+        chunk_size = max(1, sum(sizes) / (processes * 4))
 
-        if initial_nodes is None:
-            initial_nodes = set(self.dag.links.iterkeys())
-        else:
-            initial_nodes = set(initial_nodes)
+        chunks = []
+        current_chunk = []
+        current_size = 0
+        for position in sorted(xrange(len(sizes)),
+                               key=lambda x: sizes[x],
+                               reverse=True):
+            current_chunk.append(position)
+            current_size += sizes[position]
+            if current_size >= chunk_size:
+                chunks.append(current_chunk)
+                current_chunk = []
+                current_size = 0
+        if current_chunk:
+            chunks.append(current_chunk)
 
-        # The frontier is a tuple of 3 elements as follows:
-        #  A set of nodes representing valid positions for the variables.
-        #  A node that represents the father of the last processed node.
-        #  A tuple representing where the variables have been set for the
-        #  current configuration.
-        frontier = [(initial_nodes.difference(starting_node),
-                     starting_node,
-                     tuple())]
-        while frontier:
-            selectable, father, variables = frontier.pop()
-
-            if len(variables) < total_number_of_variables:
-                for node in selectable:
-                    # Get the nodes in which we can put a variable
-                    new_selectable = \
-                            self.__getSelectableNodes(selectable.difference(node))
-                    solution = variables + (node,)
-                    # To store all the possible permutations and not just a
-                    # canonical combination change solutions to a list and
-                    # do not sort the tuple
-                    solutions.add(tuple(sorted(solution)))
-
-                    # If we don't have any selectable node or the current node
-                    # is not a direct children of the previous father do not
-                    # process it. If we don't stop the recursion by controlling
-                    # the father we get incorrect solutions.
-                    if not len(new_selectable) or \
-                       node not in self.dag.links[father]:
+        return chunks
+
+    def __iterParallelVariableMappings(self,
+                                       source_subgraphs,
+                                       number_of_variables,
+                                       processes):
+        """
+        Auxiliary generator that computes the variable mappings of the
+        source subgraphs using a pool of processes. It yields a tuple with
+        each subgraph and its list of variable mappings in the same order as
+        source_subgraphs.
+        """
+        chunks = self.__buildChunks(source_subgraphs, processes)
+
+        pool = Pool(processes, initialize_worker, (self.dag,))
+        try:
+            results = []
+            # Position of the result of each subgraph, that is, its chunk
+            # and its position inside the chunk.
+            result_positions = dict()
+            for chunk in chunks:
+                subgraphs = [source_subgraphs[x] for x in chunk]
+                for offset, position in enumerate(chunk):
+                    result_positions[position] = (len(results), offset)
+                results.append(pool.apply_async(
+                    generate_chunk_variable_mappings,
+                    (subgraphs, number_of_variables)))
+            pool.close()
+
+            for position, subgraph in enumerate(source_subgraphs):
+                chunk, offset = result_positions[position]
+                yield subgraph, results[chunk].get()[offset]
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def countVariableMappings(self,
+                              starting_node,
+                              total_number_of_variables,
+                              initial_nodes=None):
+        """
+        This function counts the valid variable positions for a given graph
+        without generating them. The arguments are the same as in
+        generateVariableMappings. As an output it returns a dictionary with
+        the number of variables as keys and the number of valid positions
+        with that number of variables as values.
+
+        Every variable but the last one must be a children of the starting
+        node, check the function __isValidPlacement. So the count is built
+        with dynamic programming over the subsets of children of the starting
+        node, by number of variables: the subsets that can be ordered are
+        extended with one more children and each extension that can be
+        ordered is counted on its own and with each one of the nodes that are
+        still selectable once it is taken as the last variable. Only the
+        subsets up to the maximum number of variables are visited, so the
+        cost grows with the number of children of the starting node and the
+        number of valid positions instead of with all the subsets of
+        children.
+        """
+
+        selectable, father_children, selectable_index = \
+            self.__prepareSubgraph(starting_node,
+                                   total_number_of_variables,
+                                   initial_nodes)
+
+        counts = dict()
+        if selectable:
+            counts[1] = bin(selectable).count('1')
+
+        children = []
+        remaining = selectable & father_children
+        while remaining:
+            node = remaining & -remaining
+            remaining ^= node
+            children.append(node)
+        non_children = selectable & ~father_children
+
+        # Subsets of children with the current number of variables that can
+        # be ordered, any single children can.
+        ordered = set(children)
+        number_of_variables = 1
+        while ordered:
+            # Add a last variable that is not a children of the starting node
+            if number_of_variables < total_number_of_variables:
+                for subset in ordered:
+                    last_nodes = \
+                        selectable_index.getSelectableNodes(subset) & \
+                        non_children
+                    if last_nodes:
+                        counts[number_of_variables + 1] = \
+                            counts.get(number_of_variables + 1, 0) + \
+                            bin(last_nodes).count('1')
+
+            if number_of_variables >= total_number_of_variables:
+                break
+
+            # A subset can be ordered if removing one of its nodes leaves a
+            # subset that can be ordered where that node is still selectable.
+            extended = set()
+            visited = set()
+            for subset in ordered:
+                for node in children:
+                    candidate = subset | node
+                    if node & subset or candidate in visited:
                         continue
+                    visited.add(candidate)
+                    remaining = candidate
+                    while remaining:
+                        last = remaining & -remaining
+                        remaining ^= last
+                        if candidate ^ last in ordered and \
+                           selectable_index.isSelectable(last,
+                                                         candidate ^ last):
+                            extended.add(candidate)
+                            break
 
-                    frontier.append((new_selectable,
-                                     father,
-                                     solution))
+            number_of_variables += 1
+            ordered = extended
+            if ordered:
+                counts[number_of_variables] = \
+                    counts.get(number_of_variables, 0) + len(ordered)
 
-        return solutions
+        return counts
 
-    def generateAllVariableMappings(self,
-                                    number_of_variables=float("inf"),
-                                    max_depth=float("inf"),
-                                    printMapppings=False):
+    def iterAllVariableMappings(self,
+                                number_of_variables=float("inf"),
+                                max_depth=float("inf"),
+                                printMapppings=False,
+                                processes=None):
         """
-        This function generates all possible variable mappings for all
-        the source subgraphs that can be generated for the dag.
-        As input it takes the maximum number of variables to set on each
-        subgraph and the max_depth to go down on each subgraph, this parameter
-        is optional and by default it explores the hole graph.
-        To generate the source subgraphs it calls the function
-        generateSourceSubgraphs and to generate all the possible mapping for
-        each source subgraph it calls the function generateVariableMappings
+        Generator version of generateAllVariableMappings. The mappings are
+        yielded lazily one source subgraph at a time keeping the ascending
+        order from the leafs of generateSourceSubgraphs, so only the mappings
+        of the subgraph being processed are kept in memory.
+
+        If processes is specified the mappings of the source subgraphs are
+        computed in parallel by a pool with that number of processes, the
+        order of the mappings is the same.
+
+        If the mapper has a cache the mappings are taken from it when
+        possible. Otherwise they are stored on it once all of them have been
+        generated, in that case the mappings are kept in memory until then.
         """
 
-        # Store the solutions
-        solutions = list()
+        if self.cache is not None:
+            subgraphs_mappings = self.cache.load(self.dag,
+                                                 number_of_variables,
+                                                 max_depth)
+            if subgraphs_mappings is not None:
+                for mapping in self.__iterSubgraphsMappings(subgraphs_mappings,
+                                                            printMapppings):
+                    yield mapping
+                return
 
         # Get the source subgraphs
         source_subgraphs = self.generateSourceSubgraphs(max_depth)
 
         # For each subgraph get all valid combination of variables that we
         # can set up to number_of_variables
-        for subgraph in source_subgraphs:
-            # print source_subgraph, source_root
+        if processes:
+            subgraphs_mappings = \
+                self.__iterParallelVariableMappings(list(source_subgraphs),
+                                                    number_of_variables,
+                                                    processes)
+        else:
+            subgraphs_mappings = \
+                ((subgraph, self.iterVariableMappings(subgraph.root,
+                                                      number_of_variables,
+                                                      subgraph.nodes))
+                 for subgraph in source_subgraphs)
+
+        if self.cache is None:
+            for mapping in self.__iterSubgraphsMappings(subgraphs_mappings,
+                                                        printMapppings):
+                yield mapping
+        else:
+            generated_mappings = []
+            for subgraph, mappings in subgraphs_mappings:
+                generated_mappings.append((subgraph, list(mappings)))
+                for mapping in self.__iterSubgraphsMappings(
+                        generated_mappings[-1:], printMapppings):
+                    yield mapping
+
+            self.cache.store(self.dag,
+                             number_of_variables,
+                             max_depth,
+                             generated_mappings)
+
+    def __iterSubgraphsMappings(self, subgraphs_mappings, printMapppings):
+        """
+        Auxiliary generator that builds the mappings from an iterable of
+        tuples formed by a subgraph and its variable mappings.
+        """
+        for subgraph, mappings in subgraphs_mappings:
             # If the graph is composed by just one node it doesn't
             # return anything
-            for variables in self.generateVariableMappings(subgraph.root,
-                                                           number_of_variables,
-                                                           subgraph.nodes):
+            for variables in mappings:
                 # Print the string version of the graph
                 if printMapppings:
                     print stringifyGraph(self.dag,
@@ -284,8 +845,289 @@ class DirectedAcyclicGraphMapper:
                                          variables,
                                          subgraph.nodes)
 
-                solutions.append(DirectedAcyclicSubgraphWithVariables(self.dag,
-                                                                      subgraph,
-                                                                      variables))
+                yield DirectedAcyclicSubgraphWithVariables(self.dag,
+                                                           subgraph,
+                                                           variables)
 
-        return solutions
+    def generateAllVariableMappings(self,
+                                    number_of_variables=float("inf"),
+                                    max_depth=float("inf"),
+                                    printMapppings=False,
+                                    processes=None):
+        """
+        This function generates all possible variable mappings for all
+        the source subgraphs that can be generated for the dag.
+        As input it takes the maximum number of variables to set on each
+        subgraph and the max_depth to go down on each subgraph, this parameter
+        is optional and by default it explores the hole graph.
+        To generate the source subgraphs it calls the function
+        generateSourceSubgraphs and to generate all the possible mapping for
+        each source subgraph it calls the function generateVariableMappings.
+        The mappings are returned as a list, use iterAllVariableMappings to
+        generate them lazily. processes is optional, if specified the
+        mappings are computed in parallel using a pool of processes.
+        """
+        return list(self.iterAllVariableMappings(number_of_variables,
+                                                 max_depth,
+                                                 printMapppings,
+                                                 processes))
+
+    def countAllVariableMappings(self,
+                                 number_of_variables=float("inf"),
+                                 max_depth=float("inf")):
+        """
+        This function counts the variable mappings that the function
+        generateAllVariableMappings would generate without generating them.
+        It returns a list of tuples formed by each source subgraph, in the
+        same order as generateSourceSubgraphs, and the dictionary of counts
+        by number of variables (check the function countVariableMappings).
+        """
+        return [(subgraph, self.countVariableMappings(subgraph.root,
+                                                      number_of_variables,
+                                                      subgraph.nodes))
+                for subgraph in self.generateSourceSubgraphs(max_depth)]
+
+    def trackVariableMappings(self,
+                              number_of_variables=float("inf"),
+                              max_depth=float("inf")):
+        """
+        This function generates all the variable mappings of the dag, as
+        generateAllVariableMappings does, and keeps them so they can be
+        updated incrementally when the dag is edited with the function
+        applyEdit. It returns the list of mappings.
+        """
+        entries = []
+        for subgraph in self.generateSourceSubgraphs(max_depth):
+            mappings = self.__generateSubgraphMappings(subgraph,
+                                                       number_of_variables)
+            entries.append((self.__getSubgraphSignature(subgraph), mappings))
+        self.tracked_mappings = (number_of_variables, max_depth, entries)
+
+        return self.getTrackedVariableMappings()
+
+    def getTrackedVariableMappings(self):
+        """
+        This function returns the list of tracked mappings in the same order
+        as generateAllVariableMappings. If the mappings are not being tracked
+        it raises an exception.
+        """
+        if self.tracked_mappings is None:
+            raise ValueError("The variable mappings are not being tracked")
+
+        return [mapping
+                for _, mappings in self.tracked_mappings[2]
+                for mapping in mappings]
+
+    def __generateSubgraphMappings(self, subgraph, number_of_variables):
+        """
+        Auxiliary function that returns the list of mappings of a subgraph.
+        """
+        return [DirectedAcyclicSubgraphWithVariables(self.dag,
+                                                     subgraph,
+                                                     variables)
+                for variables in self.iterVariableMappings(subgraph.root,
+                                                           number_of_variables,
+                                                           subgraph.nodes)]
+
+    def __getSubgraphSignature(self, subgraph):
+        """
+        Auxiliary function that returns the data the variable mappings of a
+        subgraph depend on: the subgraph itself and the edges that end on one
+        of its nodes and start on one of its nodes or on the root of the dag.
+        If the signature of a subgraph doesn't change after an edit its
+        mappings don't change either.
+        """
+        nodes = set(subgraph.nodes)
+        edges = []
+        for node in nodes.union([self.dag.root]):
+            for child in self.dag.links[node]:
+                if child in nodes:
+                    edges.append((node, child))
+
+        return (subgraph, frozenset(edges))
+
+    def __recomputeSuccessors(self, nodes):
+        """
+        Auxiliary function that rebuilds the rows of the table of successors
+        of the given nodes from the rows of their children. Every node whose
+        successors have changed must be included.
+        """
+        table = self.successors_table
+
+        # A node has more successors among the given nodes than any of its
+        # descendants so sorting them by that number gives a reverse
+        # topological order.
+        nodes = set(nodes)
+        order = sorted(nodes,
+                       key=lambda x: len(nodes.intersection(table.get(x, ()))))
+        for current in order:
+            distances = dict()
+            for child in self.dag.links[current]:
+                distances[child] = 1
+                for successor, distance in table[child].iteritems():
+                    distance += 1
+                    if successor not in distances or \
+                       distance < distances[successor]:
+                        distances[successor] = distance
+            table[current] = distances
+
+    def __getAntecessors(self, node):
+        """
+        Auxiliary function that returns the nodes of the table of successors
+        from which node can be reached.
+        """
+        return set(antecessor
+                   for antecessor, successors in
+                   self.successors_table.iteritems()
+                   if node in successors)
+
+    def __applyEditToGraph(self, edit):
+        """
+        Auxiliary function that applies an edit to the dag, the dictionary of
+        links is modified in place, and updates the table of successors.
+        """
+        links = self.dag.links
+        table = self.successors_table
+        operation, source, target = edit
+
+        if operation == 'add_node':
+            if source in links:
+                raise ValueError("The node already exists on the graph")
+            links[source] = tuple()
+            if table is not None:
+                table[source] = dict()
+
+        elif operation == 'remove_node':
+            if source not in links:
+                raise ValueError("The node does not belong to the graph")
+            if source == self.dag.root:
+                raise ValueError("The root of the graph can't be removed")
+            antecessors = None
+            if table is not None:
+                antecessors = self.__getAntecessors(source)
+            for node, children in links.iteritems():
+                if source in children:
+                    links[node] = tuple(x for x in children if x != source)
+            del links[source]
+            if table is not None:
+                table.pop(source, None)
+                self.__recomputeSuccessors(antecessors)
+
+        elif operation == 'add_edge':
+            if source not in links or target not in links:
+                raise ValueError("The edge contains a node that does not " +
+                                 "belong to the graph")
+            if target in links[source]:
+                raise ValueError("The edge already exists on the graph")
+            if table is not None:
+                # Build the rows of the nodes that were not reachable.
+                for node, successors in \
+                        self.__buildSuccessorsTable(target).iteritems():
+                    table.setdefault(node, successors)
+                target_successors = table[target]
+            else:
+                target_successors = self.__buildSuccessorsTable(target)[target]
+            if source == target or source in target_successors:
+                raise ValueError("The edge would create a cycle")
+
+            links[source] = tuple(links[source]) + (target,)
+            if table is not None:
+                antecessors = self.__getAntecessors(source)
+                antecessors.add(source)
+                for antecessor in antecessors:
+                    successors = table[antecessor]
+                    distance = successors.get(source, 0) + 1
+                    reached = [(target, distance)]
+                    reached.extend((x, distance + d)
+                                   for x, d in target_successors.iteritems())
+                    for successor, distance in reached:
+                        if successor not in successors or \
+                           distance < successors[successor]:
+                            successors[successor] = distance
+
+        elif operation == 'remove_edge':
+            if source not in links or target not in links[source]:
+                raise ValueError("The edge does not belong to the graph")
+            links[source] = tuple(x for x in links[source] if x != target)
+            if table is not None and source in table:
+                antecessors = self.__getAntecessors(source)
+                antecessors.add(source)
+                self.__recomputeSuccessors(antecessors)
+
+        elif operation == 'relabel':
+            if source not in links:
+                raise ValueError("The node does not belong to the graph")
+            if target in links:
+                raise ValueError("The new label already exists on the graph")
+            for node, children in links.iteritems():
+                if source in children:
+                    links[node] = tuple(target if x == source else x
+                                        for x in children)
+            links[target] = links.pop(source)
+            if source == self.dag.root:
+                self.dag = self.dag._replace(root=target)
+            if table is not None and source in table:
+                for antecessor in self.__getAntecessors(source):
+                    successors = table[antecessor]
+                    successors[target] = successors.pop(source)
+                table[target] = table.pop(source)
+
+        else:
+            raise ValueError("Unknown edit operation: " + str(operation))
+
+        # The positions and children of the nodes are rebuilt when needed
+        self.node_index = None
+        self.node_mappings = dict()
+
+    def applyEdit(self, edit):
+        """
+        This function applies an edit, a DirectedAcyclicGraphEdit as specified
+        on the file datastructures.py, to the dag of the mapper. The links of
+        the dag are modified in place.
+
+        The table of successors is updated only for the nodes from which the
+        edited nodes can be reached. If the mappings are being tracked (check
+        the function trackVariableMappings) only the source subgraphs whose
+        nodes or edges have changed generate their mappings again. The
+        function returns a VariableMappingsUpdate with the mappings that have
+        been removed and added, if the mappings are not being tracked both
+        lists are empty.
+        """
+        dag = self.dag
+        self.__applyEditToGraph(edit)
+
+        if self.tracked_mappings is None:
+            return VariableMappingsUpdate([], [])
+
+        number_of_variables, max_depth, entries = self.tracked_mappings
+        previous_entries = dict((signature[0].root, (signature, mappings))
+                                for signature, mappings in entries)
+
+        removed = []
+        added = []
+        new_entries = []
+        for subgraph in self.generateSourceSubgraphs(max_depth):
+            signature = self.__getSubgraphSignature(subgraph)
+            previous_signature, mappings = \
+                previous_entries.pop(subgraph.root, (None, []))
+
+            if signature == previous_signature:
+                # The root of the dag has been relabeled, update the dag
+                # referenced by the mappings.
+                if dag is not self.dag:
+                    mappings = [x._replace(graph=self.dag) for x in mappings]
+            else:
+                removed.extend(mappings)
+                mappings = self.__generateSubgraphMappings(subgraph,
+                                                           number_of_variables)
+                added.extend(mappings)
+
+            new_entries.append((signature, mappings))
+
+        # Subgraphs that don't exist anymore
+        for _, mappings in previous_entries.itervalues():
+            removed.extend(mappings)
+
+        self.tracked_mappings = (number_of_variables, max_depth, new_entries)
+
+        return VariableMappingsUpdate(removed, added)
@@ -1,3 +1,4 @@
+from array import array
 from collections import defaultdict, namedtuple
 import cPickle as pickle
 
@@ -5,9 +6,48 @@ from utils import DEBUG_MODE
 
 NodeData = namedtuple("NodeData", ["weight", "hyperedges"])
 HyperedgeLabel = namedtuple("HyperedgeLabel", ["data", "weight"])
+# The tails and the weight of a hyperedge that starts on a node, check the
+# function getOutgoingHyperedges.
+OutgoingHyperedge = namedtuple("OutgoingHyperedge", ["tails", "weight"])
 
 
-class Hypergraph:
+class HypergraphSink:
+    """
+    Base class of the objects that receive the nodes and the hyperedges of a
+    hypergraph while it is built, check the option sink of the function
+    buildHyperGraph of the comparator. The hypergraphs are sinks that store
+    them in memory, check also the HypergraphFileWriter.
+    """
+
+    def addNode(self, node, weight):
+        """
+        This function receives a node of the hypergraph and its weight.
+        """
+        raise NotImplementedError
+
+    def addHyperedge(self, hyperedge, data, weight):
+        """
+        This function receives a hyperedge of the hypergraph, its data and
+        its weight. The nodes of the hyperedge have already been received.
+        """
+        raise NotImplementedError
+
+    def finalize(self):
+        """
+        This function is called once all the nodes and hyperedges have been
+        received, it returns the resulting hypergraph.
+        """
+        return self
+
+    def discard(self):
+        """
+        This function is called instead of finalize when the hypergraph
+        can't be completed, it releases the resources of the sink.
+        """
+        pass
+
+
+class Hypergraph(HypergraphSink):
     """
     This class represents  a simple hypergraph
     It functions by specifying the nodes that forms the hypergraph and
@@ -15,13 +55,21 @@ class Hypergraph:
     So far it is quite simple and only adding functions have been
     implemented but the algorithim doesn't require to remove any data
     Both the nodes and the hyperedges can be labeled with data.
+
+    The hyperedges that start on each node are indexed along their weights
+    as they are added, check the function getOutgoingHyperedges.
     """
 
     def __init__(self):
         self.last_hyperedge = 0
         self.nodes = defaultdict(NodeData)
         self.hyperedges = dict()
-        self.positions_to_hyperedges = dict()
+        # The hyperedges are numbered consecutively as they are added, so the
+        # position of each one is its index on this list.
+        self.positions_to_hyperedges = list()
+        # The hyperedges that start on each node, their weights are read
+        # from their labels so updating a label doesn't modify the index.
+        self.outgoing_hyperedges = dict()
 
     def addNode(self, node, weight):
         """
@@ -72,21 +120,25 @@ class Hypergraph:
         it raises an exception.
         hyperedge -> a tuple of nodes if a node doesn't exists it raises an
                      exception.
-        data -> must be a tuple of two DirectedAcyclicGraphs
+        data -> the data associated with the hyperedge, the comparator stores
+                the id of the pair of mappings that forms it.
         weight -> the weight of the hyperedge
         """
         if hyperedge not in self.hyperedges:
-            current_position = self.last_hyperedge
-            self.last_hyperedge += 1
-
             for node in hyperedge:
                 if node not in self.nodes:
                     raise ValueError("The hyperedge contains a node that " +
                                      "doesn't exist on the hypergraph")
 
+            current_position = self.last_hyperedge
+            self.last_hyperedge += 1
+
+            for node in hyperedge:
                 self.nodes[node].hyperedges.append(current_position)
 
-            self.positions_to_hyperedges[current_position] = hyperedge
+            self.positions_to_hyperedges.append(hyperedge)
+            self.outgoing_hyperedges.setdefault(hyperedge[0],
+                                                []).append(hyperedge)
         else:
             raise ValueError("The hyperedge already exists on the hypergraph")
 
@@ -118,7 +170,7 @@ class Hypergraph:
         hyperedge. If it doesn't exists it raises an exception
         hyperedge -> a tuple of nodes if a node doesn't exists it raises an
                      exception.
-        data -> must be a tuple of two DirectedAcyclicGraphs
+        data -> the data associated with the hyperedge.
         weight -> the weight of the hyperedge
         """
         if hyperedge not in self.hyperedges:
@@ -126,6 +178,19 @@ class Hypergraph:
 
         self.hyperedges[hyperedge] = HyperedgeLabel(data, weight)
 
+    def getOutgoingHyperedges(self, node):
+        """
+        This function returns the list with the tails and the weight of the
+        hyperedges that start on a node, in the order they were added. If the
+        node doesn't exist on the hypergraph it raises an exception.
+        """
+        if node not in self.nodes:
+            raise ValueError("The node doesn't exists on the hypergraph")
+
+        hyperedges = self.hyperedges
+        return [OutgoingHyperedge(hyperedge[1:], hyperedges[hyperedge].weight)
+                for hyperedge in self.outgoing_hyperedges.get(node, ())]
+
     def getHyperedgesFromNode(self, node):
         """
         This function returns the hyperedges that a node belongs to. If the
@@ -151,8 +216,7 @@ class Hypergraph:
         for hyperedge, label in self.hyperedges.iteritems():
             print i, hyperedge, label.weight
             if DEBUG_MODE:
-                print "   ", label.data[0]
-                print "   ", label.data[1]
+                print "   ", label.data
 
             i += 1
 
@@ -167,3 +231,537 @@ class Hypergraph:
         hypergraph = pickle.load(f)
         f.close()
         return hypergraph
+
+    # The hypergraphs saved before the hyperedges were indexed by their first
+    # node are indexed when they are loaded, the ones saved with the weights
+    # on the index drop them.
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.pop('outgoing_weights', None)
+        if 'outgoing_hyperedges' not in state:
+            self.outgoing_hyperedges = dict()
+            for position in xrange(self.last_hyperedge):
+                hyperedge = self.positions_to_hyperedges[position]
+                self.outgoing_hyperedges.setdefault(hyperedge[0],
+                                                    []).append(hyperedge)
+
+
+class LazyHypergraph(Hypergraph):
+    """
+    This class represents a hypergraph whose hyperedges are generated on
+    demand. The nodes are added as usual but the hyperedges that start on a
+    node are only generated the first time the node is expanded (check the
+    function expandNode), after that they are stored as in a Hypergraph.
+
+    expand -> A function that given a node returns an iterable of tuples
+              (hyperedge, data, weight) with the hyperedges that start on
+              that node, check the function addHyperedge.
+    score -> Optional, a function that given a hyperedge and its data
+             returns its weight. If specified the weights yielded by expand
+             can be None, in that case the hyperedge is scored the first
+             time its label is requested.
+    """
+
+    def __init__(self, expand, score=None):
+        Hypergraph.__init__(self)
+        self.expand = expand
+        self.score = score
+        self.expanded_nodes = dict()
+
+    def expandNode(self, node):
+        """
+        This function returns the list of hyperedges that start on a node,
+        they are generated and added to the hypergraph the first time the
+        node is expanded. If the node doesn't exist on the hypergraph it
+        raises an exception.
+        """
+        if node not in self.nodes:
+            raise ValueError("The node doesn't exists on the hypergraph")
+
+        if node not in self.expanded_nodes:
+            if self.expand is None:
+                raise ValueError("The hypergraph can't expand new nodes")
+
+            hyperedges = []
+            for hyperedge, data, weight in self.expand(node):
+                self.addHyperedge(hyperedge, data, weight)
+                hyperedges.append(hyperedge)
+            self.expanded_nodes[node] = hyperedges
+
+        return self.expanded_nodes[node]
+
+    def getHyperedgeLabel(self, hyperedge):
+        """
+        This function returns the label associated with a hyperedge, if the
+        hyperedge hasn't been scored yet it is scored first.
+        """
+        label = Hypergraph.getHyperedgeLabel(self, hyperedge)
+        if label.weight is None and self.score is not None:
+            self.updateHyperedgeLabel(hyperedge, label.data,
+                                      self.score(hyperedge, label.data))
+            label = self.hyperedges[hyperedge]
+
+        return label
+
+    def isExpanded(self, node):
+        """
+        This function checks if the hyperedges of the node have already been
+        generated.
+        """
+        return node in self.expanded_nodes
+
+    # The expand and score functions can't be pickled, a hypergraph loaded
+    # from a file only contains the nodes that were expanded when it was
+    # saved.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['expand'] = None
+        state['score'] = None
+        return state
+
+
+# Initial number of slots of the table used by the ArrayHypergraph to find
+# the hyperedges, it must be a power of two.
+INITIAL_TABLE_SIZE = 8
+# Value of the empty slots of the table.
+EMPTY_SLOT = -1
+# Constants of the hash function of the table, check hash_node_ids.
+HASH_SEED = 0x345678
+HASH_MULTIPLIER = 1000003
+HASH_MASK = 0xFFFFFFFF
+
+
+def hash_node_ids(node_ids):
+    """
+    Returns the hash of the tuple of ids of the nodes of a hyperedge used by
+    the table of the ArrayHypergraph. Unlike the built-in hash it doesn't
+    depend on the platform, so the table can be stored on a file.
+    """
+    h = HASH_SEED
+    for node_id in node_ids:
+        h = ((h ^ node_id) * HASH_MULTIPLIER) & HASH_MASK
+
+    return h ^ (h >> 16)
+
+
+class HyperedgesView:
+    """
+    Read only view of the hyperedges of an ArrayHypergraph that behaves as
+    the dictionary hyperedges of a Hypergraph, the hyperedges can be iterated
+    and their labels are accessed by indexing.
+    """
+
+    def __init__(self, hypergraph):
+        self.hypergraph = hypergraph
+
+    def __len__(self):
+        return len(self.hypergraph.hyperedge_heads)
+
+    def __iter__(self):
+        for position in xrange(len(self.hypergraph.hyperedge_heads)):
+            yield self.hypergraph.getHyperedge(position)
+
+    def __contains__(self, hyperedge):
+        return self.hypergraph.containsHyperedge(hyperedge)
+
+    def __getitem__(self, hyperedge):
+        if hyperedge not in self:
+            raise KeyError(hyperedge)
+
+        return self.hypergraph.getHyperedgeLabel(hyperedge)
+
+
+class ArrayHypergraph(HypergraphSink):
+    """
+    This class represents a hypergraph with the same functions as the
+    Hypergraph but stored on flat arrays instead of dictionaries of tuples,
+    it uses far less memory for hypergraphs with millions of hyperedges.
+
+    Each node gets an integer id in the order it is added and the hyperedges
+    are numbered by their positions. The weights are stored as doubles (a
+    weight of None is stored as NaN) and the hyperedges as the array of ids
+    of their first nodes plus the tails in compressed sparse row format, that
+    is the ids of the rest of the nodes of all the hyperedges one after the
+    other and the offset where each hyperedge starts. The hyperedges of each
+    node, and of the hyperedges that start on each node, are stored on the
+    same format, those indexes are built the first time they are required
+    after adding hyperedges.
+
+    The hyperedges are found using a hash table with open addressing stored
+    on an array, each slot contains the position of a hyperedge or
+    EMPTY_SLOT. The data of the hyperedges is stored on an array while all of
+    them are integers, as the ids of the comparator, otherwise on a list.
+    """
+
+    def __init__(self):
+        self.node_ids = dict()
+        self.node_list = list()
+        self.node_weights = array('d')
+        self.hyperedge_heads = array('l')
+        self.tail_offsets = array('l', [0])
+        self.tails = array('l')
+        self.hyperedge_weights = array('d')
+        self.hyperedge_data = array('l')
+        self.table = array('l', [EMPTY_SLOT]) * INITIAL_TABLE_SIZE
+        self.incidence_offsets = None
+        self.incidence = None
+        self.head_offsets = None
+        self.head_positions = None
+        # Same interface as the attributes of the Hypergraph.
+        self.nodes = self.node_ids
+        self.hyperedges = HyperedgesView(self)
+
+    def __getNodeIds(self, hyperedge):
+        """
+        Auxiliary function that returns the tuple with the ids of the nodes
+        of a hyperedge, if a node doesn't exist on the hypergraph it returns
+        None.
+        """
+        node_ids = []
+        for node in hyperedge:
+            node_id = self.node_ids.get(node)
+            if node_id is None:
+                return None
+            node_ids.append(node_id)
+
+        return tuple(node_ids)
+
+    def __getStoredNodeIds(self, position):
+        """
+        Auxiliary function that returns the tuple with the ids of the nodes
+        of the hyperedge stored on a position.
+        """
+        return (self.hyperedge_heads[position], ) + \
+            tuple(self.tails[self.tail_offsets[position]:
+                             self.tail_offsets[position + 1]])
+
+    def __findSlot(self, node_ids):
+        """
+        Auxiliary function that returns the slot of the table that contains
+        the hyperedge with the given ids, or the empty slot where it would
+        be stored. The collisions are solved by linear probing.
+        """
+        mask = len(self.table) - 1
+        slot = hash_node_ids(node_ids) & mask
+        while True:
+            position = self.table[slot]
+            if position == EMPTY_SLOT or \
+               self.__getStoredNodeIds(position) == node_ids:
+                return slot
+            slot = (slot + 1) & mask
+
+    def __growTable(self):
+        """
+        Auxiliary function that doubles the size of the table and stores the
+        hyperedges again.
+        """
+        self.table = array('l', [EMPTY_SLOT]) * (2 * len(self.table))
+        self.__fillTable()
+
+    def __fillTable(self):
+        """
+        Auxiliary function that stores all the hyperedges on an empty table,
+        if a hyperedge is repeated it raises an exception.
+        """
+        for position in xrange(len(self.hyperedge_heads)):
+            slot = self.__findSlot(self.__getStoredNodeIds(position))
+            if self.table[slot] != EMPTY_SLOT:
+                raise ValueError("The hyperedge already exists on the " +
+                                 "hypergraph")
+            self.table[slot] = position
+
+    def __getPosition(self, hyperedge):
+        """
+        Auxiliary function that returns the position of a hyperedge, if it
+        doesn't exist on the hypergraph it returns EMPTY_SLOT.
+        """
+        node_ids = self.__getNodeIds(hyperedge)
+        if node_ids is None:
+            return EMPTY_SLOT
+
+        return self.table[self.__findSlot(node_ids)]
+
+    def __getExistingPosition(self, hyperedge):
+        """
+        Auxiliary function that returns the position of a hyperedge, if it
+        doesn't exist on the hypergraph it raises an exception.
+        """
+        position = self.__getPosition(hyperedge)
+        if position == EMPTY_SLOT:
+            raise ValueError("The hyperedge doesn't exists on the hypergraph")
+
+        return position
+
+    def __setData(self, position, data):
+        """
+        Auxiliary function that stores the data of a hyperedge, the data is
+        moved to a list the first time it isn't an integer.
+        """
+        if isinstance(self.hyperedge_data, array):
+            try:
+                if position == len(self.hyperedge_data):
+                    self.hyperedge_data.append(data)
+                else:
+                    self.hyperedge_data[position] = data
+                return
+            except (TypeError, OverflowError):
+                self.hyperedge_data = list(self.hyperedge_data)
+
+        if position == len(self.hyperedge_data):
+            self.hyperedge_data.append(data)
+        else:
+            self.hyperedge_data[position] = data
+
+    def addNode(self, node, weight):
+        """
+        This function adds a node to the hypergraph.
+        If the node already exists it raises an exeception.
+        Node -> The node of the hypergraph must be inmutable.
+        Weight -> The weight associated with the node.
+        """
+        if node in self.node_ids:
+            raise ValueError("The node already exists on the hypergraph")
+
+        self.node_ids[node] = len(self.node_list)
+        self.node_list.append(node)
+        self.node_weights.append(weight)
+        self.incidence = self.head_positions = None
+
+    def updateNode(self, node, weight):
+        """
+        This functions updates the weight associated with a node of
+        the hypergraph. If the node doesn't exists raises an exception
+        Node -> The node of the hypergraph must be inmutable.
+        Weight -> The weight associated with the node.
+        """
+        if node not in self.node_ids:
+            raise ValueError("The node doesn't exists on the hypergraph")
+
+        self.node_weights[self.node_ids[node]] = weight
+
+    def containsNode(self, node):
+        """
+        This function checks if the node exist on the hypergraph.
+        Node -> The node of the hypergraph must be inmutable.
+        """
+        return node in self.node_ids
+
+    def getNodeWeight(self, node):
+        """
+        This function returns the weight associated with a node. If the node
+        doesn't exists raises an exception
+        Node -> The node of the hypergraph must be inmutable.
+        """
+        if node not in self.node_ids:
+            raise ValueError("The node doesn't exists on the hypergraph")
+
+        return self.node_weights[self.node_ids[node]]
+
+    def addHyperedge(self, hyperedge, data, weight):
+        """
+        This function adds a hyperedges to the hypergraph. If it already exists
+        it raises an exception.
+        hyperedge -> a tuple of nodes if a node doesn't exists it raises an
+                     exception.
+        data -> the data associated with the hyperedge.
+        weight -> the weight of the hyperedge
+        """
+        node_ids = self.__getNodeIds(hyperedge)
+        if node_ids is None:
+            raise ValueError("The hyperedge contains a node that " +
+                             "doesn't exist on the hypergraph")
+        slot = self.__findSlot(node_ids)
+        if self.table[slot] != EMPTY_SLOT:
+            raise ValueError("The hyperedge already exists on the hypergraph")
+
+        position = len(self.hyperedge_heads)
+        self.__setData(position, data)
+        self.hyperedge_heads.append(node_ids[0])
+        self.tails.extend(node_ids[1:])
+        self.tail_offsets.append(len(self.tails))
+        self.hyperedge_weights.append(float('nan') if weight is None
+                                      else weight)
+        self.table[slot] = position
+        self.incidence = self.head_positions = None
+
+        # Keep at least half of the slots of the table empty.
+        if 2 * len(self.hyperedge_heads) > len(self.table):
+            self.__growTable()
+
+    def containsHyperedge(self, hyperedge):
+        """
+        This function checks if the hyperedge exist on the hypergraph.
+        hyperedge -> a tuple of nodes.
+        """
+        return self.__getPosition(hyperedge) != EMPTY_SLOT
+
+    def getHyperedge(self, position):
+        """
+        This function returns the hyperedge stored on a position.
+        """
+        start = self.tail_offsets[position]
+        end = self.tail_offsets[position + 1]
+
+        return (self.node_list[self.hyperedge_heads[position]], ) + \
+            tuple([self.node_list[x] for x in self.tails[start:end]])
+
+    def getHyperedgeLabel(self, hyperedge):
+        """
+        This function returns the label associated with a hyperedge of the
+        hyperedge. If it doesn't exists it raises an exception
+        hyperedges -> a tuple of nodes if a node doesn't exists it raises an
+                      exception.
+        """
+        position = self.__getExistingPosition(hyperedge)
+        weight = self.hyperedge_weights[position]
+        if weight != weight:
+            weight = None
+
+        return HyperedgeLabel(self.hyperedge_data[position], weight)
+
+    def updateHyperedgeLabel(self, hyperedge, data, weight):
+        """
+        This function updates the label associated with a hyperedge of the
+        hyperedge. If it doesn't exists it raises an exception
+        hyperedge -> a tuple of nodes if a node doesn't exists it raises an
+                     exception.
+        data -> the data associated with the hyperedge.
+        weight -> the weight of the hyperedge
+        """
+        position = self.__getExistingPosition(hyperedge)
+        self.__setData(position, data)
+        self.hyperedge_weights[position] = float('nan') if weight is None \
+            else weight
+
+    def getIncidence(self):
+        """
+        This function returns the tuple (incidence_offsets, incidence), the
+        index with the positions of the hyperedges of each node. The
+        positions of the node with id i are
+        incidence[incidence_offsets[i]:incidence_offsets[i + 1]].
+        """
+        if self.incidence is None:
+            self.incidence_offsets = self.__countIndex(False)
+            self.incidence = array('l', [0]) * self.incidence_offsets[-1]
+            self.__fillIndex(self.incidence_offsets, self.incidence, False)
+
+        return self.incidence_offsets, self.incidence
+
+    def getHeadIndex(self):
+        """
+        This function returns the tuple (head_offsets, head_positions), the
+        index with the positions of the hyperedges that start on each node,
+        on the same format as getIncidence.
+        """
+        if self.head_positions is None:
+            self.head_offsets = self.__countIndex(True)
+            self.head_positions = array('l', [0]) * self.head_offsets[-1]
+            self.__fillIndex(self.head_offsets, self.head_positions, True)
+
+        return self.head_offsets, self.head_positions
+
+    def __countIndex(self, heads_only):
+        """
+        Auxiliary function that returns the offsets of an index of the
+        hyperedges of each node, if heads_only is True only the first node of
+        each hyperedge is indexed.
+        """
+        counts = array('l', [0]) * (len(self.node_list) + 1)
+        for node_id in self.hyperedge_heads:
+            counts[node_id + 1] += 1
+        if not heads_only:
+            for node_id in self.tails:
+                counts[node_id + 1] += 1
+        for i in xrange(1, len(counts)):
+            counts[i] += counts[i - 1]
+
+        return counts
+
+    def __fillIndex(self, offsets, positions, heads_only):
+        """
+        Auxiliary function that stores the positions of the hyperedges on an
+        index whose offsets have already been computed.
+        """
+        cursors = array('l', offsets)
+        for position, head in enumerate(self.hyperedge_heads):
+            positions[cursors[head]] = position
+            cursors[head] += 1
+            if heads_only:
+                continue
+            for i in xrange(self.tail_offsets[position],
+                            self.tail_offsets[position + 1]):
+                positions[cursors[self.tails[i]]] = position
+                cursors[self.tails[i]] += 1
+
+    def fillIndexes(self):
+        """
+        This function stores the hyperedges on the table and on the indexes
+        of the nodes, their arrays must already have the right sizes: the
+        table full of EMPTY_SLOT and the offsets of the indexes computed. If
+        a hyperedge is repeated it raises an exception.
+
+        It is used to build the indexes of the arrays stored on a file, check
+        the HypergraphFileWriter.
+        """
+        self.__fillTable()
+        self.__fillIndex(self.incidence_offsets, self.incidence, False)
+        self.__fillIndex(self.head_offsets, self.head_positions, True)
+
+    def getHyperedgesFromNode(self, node):
+        """
+        This function returns the hyperedges that a node belongs to. If the
+        node doesn't exist on the hypergraph it raises an exception.
+        """
+        if node not in self.node_ids:
+            raise ValueError("The node doesn't exists on the hypergraph")
+
+        incidence_offsets, incidence = self.getIncidence()
+        node_id = self.node_ids[node]
+        return [self.getHyperedge(position) for position in
+                incidence[incidence_offsets[node_id]:
+                          incidence_offsets[node_id + 1]]]
+
+    def getOutgoingHyperedges(self, node):
+        """
+        This function returns the list with the tails and the weight of the
+        hyperedges that start on a node. If the node doesn't exist on the
+        hypergraph it raises an exception.
+        """
+        if node not in self.node_ids:
+            raise ValueError("The node doesn't exists on the hypergraph")
+
+        head_offsets, head_positions = self.getHeadIndex()
+        node_id = self.node_ids[node]
+        answer = []
+        for position in head_positions[head_offsets[node_id]:
+                                       head_offsets[node_id + 1]]:
+            tails = self.getHyperedge(position)[1:]
+            weight = self.hyperedge_weights[position]
+            if weight != weight:
+                weight = None
+            answer.append(OutgoingHyperedge(tails, weight))
+
+        return answer
+
+    def printNodes(self):
+        for node_id, node in enumerate(self.node_list):
+            print node_id + 1, node, self.node_weights[node_id]
+
+    def printHyperedges(self):
+        for position in xrange(len(self.hyperedge_heads)):
+            print position + 1, self.getHyperedge(position), \
+                self.hyperedge_weights[position]
+            if DEBUG_MODE:
+                print "   ", self.hyperedge_data[position]
+
+    def saveToFile(self, filename):
+        f = file(filename, "w+")
+        pickle.dump(self, f)
+        f.close()
+
+    @staticmethod
+    def loadFromFile(filename):
+        f = file(filename, "r")
+        hypergraph = pickle.load(f)
+        f.close()
+        return hypergraph
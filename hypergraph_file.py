@@ -0,0 +1,513 @@
+from array import array
+from ast import literal_eval
+
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+from hypergraph import ArrayHypergraph
+from hypergraph import EMPTY_SLOT
+from hypergraph import HyperedgesView
+from hypergraph import HypergraphSink
+from hypergraph import INITIAL_TABLE_SIZE
+
+# Binary format of the hypergraph files. The file starts with a header
+# followed by the sections with the arrays of an ArrayHypergraph, all of them
+# stored as little endian values of 8 bytes:
+#   node weights (doubles, one for each node)
+#   hyperedge heads (integers, one for each hyperedge)
+#   tail offsets (integers, one for each hyperedge plus one)
+#   tails (integers)
+#   hyperedge weights (doubles, one for each hyperedge, NaN if unscored)
+#   table (integers, the hash table used to find the hyperedges)
+#   incidence offsets (integers, one for each node plus one)
+#   incidence (integers)
+#   head offsets (integers, one for each node plus one)
+#   head positions (integers, one for each hyperedge)
+#   node labels (a label table)
+#   hyperedge data (integers, or a label table, check DATA_INTEGERS)
+# A label table is formed by the offsets of each label (one for each element
+# plus one) followed by the repr of the elements, padded to 8 bytes.
+FILE_MAGIC = "\x93HGRAPH\x00"
+FILE_VERSION = 2
+HEADER_FORMAT = "<8sHHqqqqqq"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+ITEM_SIZE = 8
+INTEGER_FORMAT = "q"
+DOUBLE_FORMAT = "d"
+
+# Kinds of data of the hyperedges.
+DATA_INTEGERS = 0
+DATA_LABELS = 1
+
+# Number of elements packed at once when the arrays are written.
+CHUNK_SIZE = 1 << 16
+
+
+def padding(size):
+    """
+    Returns the number of bytes required to align size to ITEM_SIZE.
+    """
+    return -size % ITEM_SIZE
+
+
+def write_array(f, values, item_format):
+    """
+    Writes a sequence of values as little endian items of ITEM_SIZE bytes.
+    """
+    for start in xrange(0, len(values), CHUNK_SIZE):
+        chunk = values[start:start + CHUNK_SIZE]
+        f.write(struct.pack("<%d%s" % (len(chunk), item_format), *chunk))
+
+
+def write_repeated(f, value, count, item_format):
+    """
+    Writes count times a value as little endian items of ITEM_SIZE bytes.
+    """
+    chunk = struct.pack("<%d%s" % (min(count, CHUNK_SIZE), item_format),
+                        *([value] * min(count, CHUNK_SIZE)))
+    for start in xrange(0, count, CHUNK_SIZE):
+        f.write(chunk[:min(count - start, CHUNK_SIZE) * ITEM_SIZE])
+
+
+def encode_labels(labels):
+    """
+    Returns the tuple (offsets, bytes) of the label table of a sequence of
+    labels. If a label can't be restored from its repr it raises an
+    exception.
+    """
+    offsets = array('l', [0])
+    encoded = []
+    for label in labels:
+        text = repr(label)
+        try:
+            valid = literal_eval(text) == label
+        except (SyntaxError, ValueError):
+            valid = False
+        if not valid:
+            raise ValueError("The label " + text + " can't be stored on " +
+                             "the file")
+        encoded.append(text)
+        offsets.append(offsets[-1] + len(text))
+
+    return offsets, "".join(encoded)
+
+
+def to_array_hypergraph(hypergraph):
+    """
+    Returns an ArrayHypergraph with the same nodes and hyperedges as a
+    hypergraph, if it is already an ArrayHypergraph it is returned as it is.
+    """
+    if isinstance(hypergraph, ArrayHypergraph):
+        return hypergraph
+
+    answer = ArrayHypergraph()
+    for node in hypergraph.nodes:
+        answer.addNode(node, hypergraph.getNodeWeight(node))
+    # The hyperedges are added by position to keep their order.
+    for position in xrange(hypergraph.last_hyperedge):
+        hyperedge = hypergraph.positions_to_hyperedges[position]
+        label = hypergraph.getHyperedgeLabel(hyperedge)
+        answer.addHyperedge(hyperedge, label.data, label.weight)
+
+    return answer
+
+
+def save_hypergraph(hypergraph, filename):
+    """
+    Stores a hypergraph (a Hypergraph, a LazyHypergraph with the nodes
+    expanded so far or an ArrayHypergraph) on a file with the binary format,
+    it can be opened with MappedHypergraph.
+
+    The nodes, and the data of the hyperedges unless they are integers, must
+    be restored by literal_eval from their repr, as the tuples of strings
+    used by the comparator. Otherwise it raises an exception.
+    """
+    hypergraph = to_array_hypergraph(hypergraph)
+
+    incidence_offsets, incidence = hypergraph.getIncidence()
+    head_offsets, head_positions = hypergraph.getHeadIndex()
+    node_offsets, node_labels = encode_labels(hypergraph.node_list)
+    if isinstance(hypergraph.hyperedge_data, array):
+        data_kind = DATA_INTEGERS
+        data_labels = ""
+    else:
+        data_kind = DATA_LABELS
+        data_offsets, data_labels = encode_labels(hypergraph.hyperedge_data)
+
+    with open(filename, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT,
+                            FILE_MAGIC,
+                            FILE_VERSION,
+                            data_kind,
+                            len(hypergraph.node_list),
+                            len(hypergraph.hyperedge_heads),
+                            len(hypergraph.tails),
+                            len(hypergraph.table),
+                            len(node_labels),
+                            len(data_labels)))
+        f.write("\x00" * padding(HEADER_SIZE))
+
+        write_array(f, hypergraph.node_weights, DOUBLE_FORMAT)
+        write_array(f, hypergraph.hyperedge_heads, INTEGER_FORMAT)
+        write_array(f, hypergraph.tail_offsets, INTEGER_FORMAT)
+        write_array(f, hypergraph.tails, INTEGER_FORMAT)
+        write_array(f, hypergraph.hyperedge_weights, DOUBLE_FORMAT)
+        write_array(f, hypergraph.table, INTEGER_FORMAT)
+        write_array(f, incidence_offsets, INTEGER_FORMAT)
+        write_array(f, incidence, INTEGER_FORMAT)
+        write_array(f, head_offsets, INTEGER_FORMAT)
+        write_array(f, head_positions, INTEGER_FORMAT)
+        write_array(f, node_offsets, INTEGER_FORMAT)
+        f.write(node_labels + "\x00" * padding(len(node_labels)))
+        if data_kind == DATA_INTEGERS:
+            write_array(f, hypergraph.hyperedge_data, INTEGER_FORMAT)
+        else:
+            write_array(f, data_offsets, INTEGER_FORMAT)
+            f.write(data_labels + "\x00" * padding(len(data_labels)))
+
+
+class MappedArray:
+    """
+    Read only array of little endian items of ITEM_SIZE bytes stored on a
+    memory mapped file, the items are unpacked when they are accessed.
+    """
+
+    def __init__(self, data, offset, length, item_format):
+        self.data = data
+        self.offset = offset
+        self.length = length
+        self.item_format = item_format
+        self.item = struct.Struct("<" + item_format)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(self.length)
+            if stop <= start:
+                return ()
+            return struct.unpack_from("<%d%s" % (stop - start,
+                                                 self.item_format),
+                                      self.data,
+                                      self.offset + start * ITEM_SIZE)
+
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("array index out of range")
+
+        return self.item.unpack_from(self.data,
+                                     self.offset + index * ITEM_SIZE)[0]
+
+    def __setitem__(self, index, value):
+        if not 0 <= index < self.length:
+            raise IndexError("array index out of range")
+
+        self.item.pack_into(self.data, self.offset + index * ITEM_SIZE, value)
+
+    def __iter__(self):
+        for start in xrange(0, self.length, CHUNK_SIZE):
+            for value in self[start:start + CHUNK_SIZE]:
+                yield value
+
+
+class MappedLabels:
+    """
+    Read only table of labels stored on a memory mapped file, the labels are
+    decoded when they are accessed.
+    """
+
+    def __init__(self, data, offsets, start):
+        self.data = data
+        self.offsets = offsets
+        self.start = start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError("label index out of range")
+
+        return literal_eval(self.data[self.start + self.offsets[index]:
+                                      self.start + self.offsets[index + 1]])
+
+
+class MappedHypergraph(ArrayHypergraph):
+    """
+    This class represents a read only ArrayHypergraph stored on a file with
+    the binary format (check the function save_hypergraph), the file is
+    memory mapped so only the parts that are accessed are read.
+
+    Opening the file only decodes the labels of the nodes, the hyperedges are
+    read from the mapped file on demand. It can be used as any other
+    hypergraph, for example by the TransitionsIterator.
+    """
+
+    def __init__(self, filename, writable=False):
+        """
+        filename -> The file that stores the hypergraph. If it doesn't
+                    contain a hypergraph or it was stored with a different
+                    version of the format it raises an exception.
+        writable -> Optional, if True the arrays can be modified, it is used
+                    to build the indexes of the files written by the
+                    HypergraphFileWriter.
+        """
+        self.file = open(filename, "r+b" if writable else "rb")
+        self.data = None
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0,
+                                  access=mmap.ACCESS_WRITE if writable
+                                  else mmap.ACCESS_READ)
+            self.__readSections()
+        except (ValueError, mmap.error):
+            self.close()
+            raise ValueError("The file doesn't contain a hypergraph " +
+                             "with a supported format")
+
+        self.nodes = self.node_ids
+        self.hyperedges = HyperedgesView(self)
+
+    def __readSections(self):
+        """
+        Auxiliary function that reads the header of the file and locates its
+        sections, if the file is not valid it raises an exception.
+        """
+        if len(self.data) < HEADER_SIZE:
+            raise ValueError("The file doesn't contain a hypergraph")
+        (magic, version, data_kind, nodes, hyperedges, tails, table_size,
+         node_labels_size, data_labels_size) = \
+            struct.unpack_from(HEADER_FORMAT, self.data)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError("The file doesn't contain a hypergraph")
+
+        self.offset = HEADER_SIZE + padding(HEADER_SIZE)
+        self.node_weights = self.__nextArray(nodes, DOUBLE_FORMAT)
+        self.hyperedge_heads = self.__nextArray(hyperedges, INTEGER_FORMAT)
+        self.tail_offsets = self.__nextArray(hyperedges + 1, INTEGER_FORMAT)
+        self.tails = self.__nextArray(tails, INTEGER_FORMAT)
+        self.hyperedge_weights = self.__nextArray(hyperedges, DOUBLE_FORMAT)
+        self.table = self.__nextArray(table_size, INTEGER_FORMAT)
+        self.incidence_offsets = self.__nextArray(nodes + 1, INTEGER_FORMAT)
+        self.incidence = self.__nextArray(self.incidence_offsets[nodes],
+                                          INTEGER_FORMAT)
+        self.head_offsets = self.__nextArray(nodes + 1, INTEGER_FORMAT)
+        self.head_positions = self.__nextArray(hyperedges, INTEGER_FORMAT)
+        node_labels = self.__nextLabels(nodes, node_labels_size)
+        if data_kind == DATA_INTEGERS:
+            self.hyperedge_data = self.__nextArray(hyperedges,
+                                                   INTEGER_FORMAT)
+        else:
+            self.hyperedge_data = self.__nextLabels(hyperedges,
+                                                    data_labels_size)
+
+        self.node_list = [node_labels[i] for i in xrange(nodes)]
+        self.node_ids = dict((node, node_id)
+                             for node_id, node in enumerate(self.node_list))
+
+    def __nextArray(self, length, item_format):
+        """
+        Auxiliary function that returns the array of the next section of the
+        file, if the file is too short it raises an exception.
+        """
+        if length < 0 or self.offset + length * ITEM_SIZE > len(self.data):
+            raise ValueError("The file doesn't contain a hypergraph")
+
+        answer = MappedArray(self.data, self.offset, length, item_format)
+        self.offset += length * ITEM_SIZE
+
+        return answer
+
+    def __nextLabels(self, length, labels_size):
+        """
+        Auxiliary function that returns the label table of the next section
+        of the file.
+        """
+        offsets = self.__nextArray(length + 1, INTEGER_FORMAT)
+        answer = MappedLabels(self.data, offsets, self.offset)
+        self.offset += labels_size + padding(labels_size)
+        if self.offset > len(self.data):
+            raise ValueError("The file doesn't contain a hypergraph")
+
+        return answer
+
+    def __readOnly(self, *args):
+        raise ValueError("The hypergraph is read only")
+
+    addNode = updateNode = addHyperedge = updateHyperedgeLabel = __readOnly
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+
+class HypergraphFileWriter(HypergraphSink):
+    """
+    This class is a HypergraphSink that writes a hypergraph on a file with
+    the binary format as it is built, so its size is limited by the disk
+    instead of the memory.
+
+    Only the nodes are kept in memory, the hyperedges are appended to
+    temporary files in chunks of CHUNK_SIZE elements. Once all of them are
+    received the function finalize writes the file and builds its table and
+    indexes in place over the memory mapped file.
+
+    The data of the hyperedges must be integers, as the ids of the
+    comparator. As the hyperedges are not kept the repeated ones are only
+    detected by finalize.
+    """
+
+    # The arrays of the hyperedges appended to the temporary files.
+    SECTIONS = (("heads", 'l', INTEGER_FORMAT),
+                ("tail_offsets", 'l', INTEGER_FORMAT),
+                ("tails", 'l', INTEGER_FORMAT),
+                ("weights", 'd', DOUBLE_FORMAT),
+                ("data", 'l', INTEGER_FORMAT))
+
+    def __init__(self, filename):
+        """
+        filename -> The file where the hypergraph is written, the temporary
+                    files are created on the same directory.
+        """
+        self.filename = filename
+        self.node_ids = dict()
+        self.node_list = list()
+        self.node_weights = array('d')
+        self.node_counts = array('l')
+        self.head_counts = array('l')
+        self.hyperedges = 0
+        self.tails = 0
+
+        self.directory = tempfile.mkdtemp(
+            dir=os.path.dirname(os.path.abspath(filename)))
+        self.files = dict()
+        self.buffers = dict()
+        for name, typecode, _ in self.SECTIONS:
+            self.files[name] = open(os.path.join(self.directory, name),
+                                    "w+b")
+            self.buffers[name] = array(typecode)
+        self.buffers["tail_offsets"].append(0)
+
+    def addNode(self, node, weight):
+        if node in self.node_ids:
+            raise ValueError("The node already exists on the hypergraph")
+
+        self.node_ids[node] = len(self.node_list)
+        self.node_list.append(node)
+        self.node_weights.append(weight)
+        self.node_counts.append(0)
+        self.head_counts.append(0)
+
+    def addHyperedge(self, hyperedge, data, weight):
+        if not isinstance(data, (int, long)):
+            raise ValueError("The data of the hyperedges must be integers")
+        for node in hyperedge:
+            if node not in self.node_ids:
+                raise ValueError("The hyperedge contains a node that " +
+                                 "doesn't exist on the hypergraph")
+
+        head = self.node_ids[hyperedge[0]]
+        self.head_counts[head] += 1
+        self.buffers["heads"].append(head)
+        for node in hyperedge:
+            self.node_counts[self.node_ids[node]] += 1
+        for node in hyperedge[1:]:
+            self.buffers["tails"].append(self.node_ids[node])
+        self.tails += len(hyperedge) - 1
+        self.buffers["tail_offsets"].append(self.tails)
+        self.buffers["weights"].append(float('nan') if weight is None
+                                       else weight)
+        self.buffers["data"].append(data)
+        self.hyperedges += 1
+
+        if self.hyperedges % CHUNK_SIZE == 0:
+            self.__flush()
+
+    def __flush(self):
+        """
+        Auxiliary function that appends the buffered hyperedges to the
+        temporary files.
+        """
+        for name, typecode, item_format in self.SECTIONS:
+            write_array(self.files[name], self.buffers[name], item_format)
+            self.buffers[name] = array(typecode)
+
+    def __copy(self, f, name):
+        """
+        Auxiliary function that copies a temporary file to the file of the
+        hypergraph.
+        """
+        self.files[name].seek(0)
+        shutil.copyfileobj(self.files[name], f)
+
+    def discard(self):
+        """
+        This function closes and removes the temporary files, finalize calls
+        it once the file of the hypergraph is written.
+        """
+        if self.directory is None:
+            return
+
+        for temporary in self.files.itervalues():
+            temporary.close()
+        shutil.rmtree(self.directory)
+        self.directory = None
+
+    def finalize(self):
+        """
+        This function writes the file of the hypergraph, builds its table and
+        indexes and returns it as a MappedHypergraph. If a hyperedge is
+        repeated it raises an exception.
+        """
+        self.__flush()
+
+        table_size = INITIAL_TABLE_SIZE
+        while 2 * self.hyperedges > table_size:
+            table_size *= 2
+        node_offsets, node_labels = encode_labels(self.node_list)
+
+        try:
+            with open(self.filename, "wb") as f:
+                f.write(struct.pack(HEADER_FORMAT,
+                                    FILE_MAGIC,
+                                    FILE_VERSION,
+                                    DATA_INTEGERS,
+                                    len(self.node_list),
+                                    self.hyperedges,
+                                    self.tails,
+                                    table_size,
+                                    len(node_labels),
+                                    0))
+                f.write("\x00" * padding(HEADER_SIZE))
+
+                write_array(f, self.node_weights, DOUBLE_FORMAT)
+                self.__copy(f, "heads")
+                self.__copy(f, "tail_offsets")
+                self.__copy(f, "tails")
+                self.__copy(f, "weights")
+                write_repeated(f, EMPTY_SLOT, table_size, INTEGER_FORMAT)
+                for counts in (self.node_counts, self.head_counts):
+                    offsets = array('l', [0])
+                    for count in counts:
+                        offsets.append(offsets[-1] + count)
+                    write_array(f, offsets, INTEGER_FORMAT)
+                    write_repeated(f, 0, offsets[-1], INTEGER_FORMAT)
+                write_array(f, node_offsets, INTEGER_FORMAT)
+                f.write(node_labels + "\x00" * padding(len(node_labels)))
+                self.__copy(f, "data")
+        finally:
+            self.discard()
+
+        hypergraph = MappedHypergraph(self.filename, writable=True)
+        try:
+            hypergraph.fillIndexes()
+        finally:
+            hypergraph.close()
+
+        return MappedHypergraph(self.filename)
@@ -6,17 +6,15 @@ from datetime import datetime
 
 from datastructures import DirectedAcyclicGraph
 from directed_acyclic_graph_comparator import DirectedAcyclicGraphComparator
-from transitions_iterator import TransitionsIterator
-from itertools import count
+from hypergraph_file import HypergraphFileWriter
+from mapping_cache import MappingCache
+from transitions_iterator import TransitionsIterator, derivation_score
 
 from utils import DEBUG_MODE
 
 
 def compute_best_score(best_derivation):
-    b = best_derivation[0]
-    score = b[1] + sum(map(lambda x: x[1], b[0]))
-
-    return score
+    return derivation_score(best_derivation)
 
 
 def print_info(comparator, best, total_transitions, t1, t2, t3):
@@ -29,7 +27,7 @@ def print_info(comparator, best, total_transitions, t1, t2, t3):
     print " => Time spent building the Hypergraph (dag-dag mapping):", \
           str((t2 - t1).total_seconds()) + "s"
     if total_transitions:
-        print " =>", total_transitions, "total transitions generated"
+        print " =>", total_transitions, "possible transitions"
     print " => Total time spent generating transitions: ", \
           str((t3 - t2).total_seconds()) + "s"
     print " => Best transition:"
@@ -38,32 +36,52 @@ def print_info(comparator, best, total_transitions, t1, t2, t3):
     print " => Total time spent: ", str((t3 - t1).total_seconds()) + "s"
 
 
-def perform_execution(dag1, dag2, number_of_variables, just_best_mapping=True):
+def perform_execution(dag1, dag2, number_of_variables, just_best_mapping=True,
+                      processes=None, cache=None, cost_functions=None,
+                      lazy=None, compact=False, stream=None):
     total_transitions = 0
 
+    # By default when only the best mapping is requested the hypergraph is
+    # built on demand, so the hyperedges unreachable from the roots are never
+    # generated. The processes, the cache, the compact hypergraph and the
+    # stream only apply to the whole hypergraph.
+    if lazy is None:
+        lazy = just_best_mapping and not processes and cache is None and \
+            not compact and not stream
+    if lazy and compact:
+        raise ValueError("Only the whole hypergraph can be compact")
+    if lazy and stream:
+        raise ValueError("Only the whole hypergraph can be streamed to a " +
+                         "file")
+
     # Build the hypergraph
     t1 = datetime.now()
-    comparator = DirectedAcyclicGraphComparator(dag1, dag2)
-    comparator.buildHyperGraph(number_of_variables)
-
-    # Enumerate all the possible transitions
-    best = None
+    comparator = DirectedAcyclicGraphComparator(dag1, dag2, cache)
+    if cost_functions:
+        comparator.costAssembler(cost_functions)
+    sink = None
+    if stream:
+        sink = HypergraphFileWriter(stream)
+    comparator.buildHyperGraph(number_of_variables, processes, lazy,
+                               best_only=lazy and just_best_mapping,
+                               compact=compact, sink=sink)
+
+    # When only the best mapping is requested the transitions that can't be
+    # part of it are pruned using the bounds of the cost function.
+    bounds = None
+    if just_best_mapping:
+        bounds = comparator.getNodeBounds()
+
+    # Compute the best transition, the number of possible transitions is
+    # computed without enumerating them
     t2 = datetime.now()
-    transitions = TransitionsIterator(comparator.hypergraph, (dag1.root, dag2.root))
-    for pos in count(start=1):
-        if pos == 1:
-            best = transitions.next()
-            if just_best_mapping:
-                break
-        else:
-            try:
-                transitions.next(False)
-            except StopIteration:
-                break
-    t3 = datetime.now()
-
+    transitions = TransitionsIterator(comparator.hypergraph,
+                                      (dag1.root, dag2.root),
+                                      bounds)
+    best = transitions.next()
     if not just_best_mapping:
-        total_transitions = pos
+        total_transitions = transitions.countDerivations()
+    t3 = datetime.now()
 
     return comparator, best, total_transitions, t1, t2, t3
 
@@ -84,6 +102,41 @@ if __name__ == '__main__':
                              "(10 by default if the number is negative as" +
                              "many variabes as possible)")
 
+    parser.add_argument("--processes", dest="processes",
+                        type=int,
+                        help="Generate the mappings of the dags in " +
+                             "parallel using PROCESSES processes")
+
+    parser.add_argument("--cache", dest="cache",
+                        type=str,
+                        help="Directory used to cache the mappings of the " +
+                             "dags between executions")
+
+    parser.add_argument("--cost", dest="costs",
+                        type=str,
+                        action="append",
+                        metavar="NAME[:WEIGHT]",
+                        help="Add a cost function to score the hypergraph " +
+                             "(edit_distance by default), it can be " +
+                             "specified several times to combine them")
+
+    parser.add_argument("--eager", dest="eager",
+                        action="store_true",
+                        help="Build the whole hypergraph even if only the " +
+                             "best mapping is computed")
+
+    parser.add_argument("--compact", dest="compact",
+                        action="store_true",
+                        help="Store the whole hypergraph on flat arrays, " +
+                             "it uses less memory (implies --eager)")
+
+    parser.add_argument("--stream", dest="stream",
+                        type=str,
+                        metavar="FILE",
+                        help="Write the whole hypergraph to FILE while it " +
+                             "is built instead of keeping it in memory " +
+                             "(implies --eager)")
+
     parser.add_argument("--dag1", dest="dag1",
                         type=str,
                         help="Specify the file that contains the data for" +
@@ -251,9 +304,24 @@ if __name__ == '__main__':
     if args.size:
         compute_just_best = False
 
+    cache = None
+    if args.cache:
+        cache = MappingCache(args.cache)
+
+    cost_functions = None
+    if args.costs:
+        cost_functions = []
+        for cost in args.costs:
+            name, _, weight = cost.partition(':')
+            cost_functions.append((name, float(weight) if weight else 1))
+
     # Perform the execution
     comparator, best, total_transitions, t1, t2, t3 = \
-        perform_execution(dag1, dag2, num_of_vars, compute_just_best)
+        perform_execution(dag1, dag2, num_of_vars, compute_just_best,
+                          args.processes, cache, cost_functions,
+                          False if args.eager or args.compact or args.stream
+                          else None,
+                          args.compact, args.stream)
 
     # Print the statistics and related information to the computation
     print_info(comparator, best, total_transitions, t1, t2, t3)
@@ -0,0 +1,204 @@
+from hashlib import sha1
+
+import errno
+import marshal
+import os
+import zlib
+
+from datastructures import DirectedAcyclicSubgraph
+
+# Identifies the files of the cache, the version has to be increased each time
+# the format or the way the mappings are generated changes.
+CACHE_MAGIC = "DAGMAP"
+CACHE_VERSION = 1
+CACHE_EXTENSION = ".map"
+
+
+class MappingCache:
+    """
+    This class implements a persistent cache for the source subgraphs and the
+    variable mappings generated by the DirectedAcyclicGraphMapper.
+
+    Each entry is stored on its own file inside a directory. The name of the
+    file is a digest of the dag (root and links), the number of variables and
+    the maximum depth used to generate the mappings, so the same dag always
+    hits the same entry no matter the object that holds it.
+
+    The entries are stored in a compact binary format, the nodes are stored
+    once in a table and the subgraphs and variables refer to them by their
+    position. When the total size of the entries exceeds max_size bytes the
+    least recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        """
+        directory -> The directory that stores the entries of the cache, it
+                     is created if it doesn't exist.
+        max_size -> The maximum size in bytes of all the entries.
+        """
+        if max_size <= 0:
+            raise ValueError("The size of the cache has to be positive")
+
+        self.directory = directory
+        self.max_size = max_size
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def getKey(self, dag, number_of_variables, max_depth):
+        """
+        This function returns the digest that identifies the mappings of a
+        dag. The links are sorted so the digest doesn't depend on the order
+        of the dictionary, the order of the children is kept as it changes
+        the order of the generated mappings.
+        """
+        links = tuple(sorted((node, tuple(children))
+                             for node, children in dag.links.iteritems()))
+        content = repr((CACHE_VERSION,
+                        dag.root,
+                        links,
+                        number_of_variables,
+                        max_depth))
+
+        return sha1(content).hexdigest()
+
+    def __getFilename(self, key):
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    def __encode(self, subgraphs_mappings):
+        """
+        Auxiliary function that builds the binary representation of a list
+        of tuples (subgraph, list of variables).
+        """
+        nodes = dict()
+        for subgraph, _ in subgraphs_mappings:
+            for node in subgraph.nodes:
+                nodes.setdefault(node, len(nodes))
+
+        table = [None] * len(nodes)
+        for node, position in nodes.iteritems():
+            table[position] = node
+
+        entries = []
+        for subgraph, mappings in subgraphs_mappings:
+            entries.append((nodes[subgraph.root],
+                            tuple(nodes[x] for x in subgraph.nodes),
+                            tuple(tuple(nodes[x] for x in variables)
+                                  for variables in mappings)))
+
+        payload = zlib.compress(marshal.dumps((tuple(table), tuple(entries))))
+
+        return CACHE_MAGIC + chr(CACHE_VERSION) + payload
+
+    def __decode(self, data):
+        """
+        Auxiliary function that rebuilds the list of tuples (subgraph, list of
+        variables) from its binary representation. If the data doesn't have
+        the right format it returns None.
+        """
+        header = CACHE_MAGIC + chr(CACHE_VERSION)
+        if not data.startswith(header):
+            return None
+
+        table, entries = marshal.loads(zlib.decompress(data[len(header):]))
+
+        subgraphs_mappings = []
+        for root, subgraph_nodes, mappings in entries:
+            subgraph = DirectedAcyclicSubgraph(table[root],
+                                               tuple(table[x]
+                                                     for x in subgraph_nodes))
+            subgraphs_mappings.append((subgraph,
+                                       [tuple(table[x] for x in variables)
+                                        for variables in mappings]))
+
+        return subgraphs_mappings
+
+    def load(self, dag, number_of_variables, max_depth):
+        """
+        This function returns the list of tuples (subgraph, list of variables)
+        stored for the dag or None if they are not on the cache.
+        """
+        filename = self.__getFilename(self.getKey(dag,
+                                                  number_of_variables,
+                                                  max_depth))
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+        except IOError:
+            return None
+
+        try:
+            subgraphs_mappings = self.__decode(data)
+        except (ValueError, EOFError, TypeError, IndexError, zlib.error):
+            subgraphs_mappings = None
+
+        try:
+            if subgraphs_mappings is None:
+                os.remove(filename)
+                return None
+
+            # Mark the entry as the most recently used
+            os.utime(filename, None)
+        except OSError as e:
+            # Another process evicted the entry after it was read
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+
+        return subgraphs_mappings
+
+    def store(self, dag, number_of_variables, max_depth, subgraphs_mappings):
+        """
+        This function stores the list of tuples (subgraph, list of variables)
+        generated for the dag. subgraphs_mappings must follow the order of
+        the source subgraphs. Once stored the cache is trimmed to its
+        maximum size.
+        """
+        filename = self.__getFilename(self.getKey(dag,
+                                                  number_of_variables,
+                                                  max_depth))
+        data = self.__encode(subgraphs_mappings)
+
+        # Write on a temporary file so a reader never sees a partial entry
+        temporary_filename = filename + "." + str(os.getpid())
+        with open(temporary_filename, "wb") as f:
+            f.write(data)
+        os.rename(temporary_filename, filename)
+
+        self.__evict()
+
+    def __evict(self):
+        """
+        Auxiliary function that removes the least recently used entries until
+        the total size of the cache is below its maximum size.
+        """
+        entries = []
+        total_size = 0
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(CACHE_EXTENSION):
+                continue
+            filename = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+            total_size += stat.st_size
+
+        entries.sort()
+        for _, size, filename in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """
+        This function removes all the entries of the cache.
+        """
+        for filename in os.listdir(self.directory):
+            if filename.endswith(CACHE_EXTENSION):
+                os.remove(os.path.join(self.directory, filename))
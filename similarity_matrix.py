@@ -0,0 +1,275 @@
+from ast import literal_eval
+from multiprocessing import Pool
+
+import mmap
+import os
+import struct
+
+from batch_comparator import BatchComparator
+from cost_functions import EditDistanceCost
+from directed_acyclic_graph_mapper import DirectedAcyclicGraphMapper
+
+# The matrix is stored using the format of the NumPy .npy files (version 1.0)
+# so it can be loaded with numpy.load(filename, mmap_mode='r').
+NPY_MAGIC = "\x93NUMPY"
+NPY_VERSION = "\x01\x00"
+NPY_ALIGNMENT = 64
+CELL_FORMAT = "<d"
+CELL_SIZE = struct.calcsize(CELL_FORMAT)
+
+# Value of the cells that haven't been computed yet.
+PENDING = float('nan')
+# Value of the cells whose dags don't have any derivation, check the function
+# compare of the BatchComparator.
+NO_DERIVATION = float('-inf')
+
+# Comparator used by the processes of the pool, check the function
+# initialize_all_pairs_worker.
+all_pairs_worker = None
+
+
+def initialize_all_pairs_worker(comparator):
+    """
+    Initializer of the processes of the pool used by the AllPairsComparator,
+    the dags and their mappers are received once by each process.
+    """
+    global all_pairs_worker
+    all_pairs_worker = comparator
+
+
+def compare_row(task):
+    """
+    Compares the dag of a row with the dags of the given columns, it returns
+    the row and the list of tuples (column, best score).
+    """
+    row, columns = task
+
+    return row, all_pairs_worker.compareRow(row, columns)
+
+
+class SimilarityMatrix:
+    """
+    This class represents a square matrix of scores stored on a file that is
+    memory mapped, so each cell is saved as soon as it is set.
+
+    The file follows the format of the NumPy .npy files, a header followed by
+    the cells as little endian doubles in row major order. The cells that
+    haven't been computed yet contain NaN.
+    """
+
+    def __init__(self, filename, size=None):
+        """
+        filename -> The file that stores the matrix. If it exists the matrix
+                    is loaded from it, otherwise it is created with all its
+                    cells pending.
+        size -> The number of rows and columns of the matrix, it is required
+                to create the file. If the file exists and the size doesn't
+                match it raises an exception.
+        """
+        if os.path.exists(filename):
+            with open(filename, "rb") as f:
+                stored_size, offset = self.__readHeader(f)
+            if size is not None and size != stored_size:
+                raise ValueError("The matrix stored on the file has a " +
+                                 "different size")
+            size = stored_size
+        else:
+            if size is None or size < 0:
+                raise ValueError("The size of the matrix is required")
+            offset = self.__create(filename, size)
+
+        self.filename = filename
+        self.size = size
+        self.offset = offset
+        self.file = open(filename, "r+b")
+        self.data = None
+        if size:
+            self.data = mmap.mmap(self.file.fileno(), 0)
+
+    def __readHeader(self, f):
+        """
+        Auxiliary function that reads the header of the file, it returns the
+        size of the matrix and the position of the first cell.
+        """
+        if f.read(len(NPY_MAGIC)) != NPY_MAGIC or \
+           f.read(len(NPY_VERSION)) != NPY_VERSION:
+            raise ValueError("The file doesn't contain a matrix")
+
+        header_length, = struct.unpack("<H", f.read(2))
+        try:
+            header = literal_eval(f.read(header_length))
+        except (SyntaxError, ValueError):
+            raise ValueError("The file doesn't contain a matrix")
+
+        shape = header.get('shape')
+        if header.get('descr') != CELL_FORMAT or header.get('fortran_order') \
+           or len(shape) != 2 or shape[0] != shape[1]:
+            raise ValueError("The file doesn't contain a matrix")
+
+        return shape[0], len(NPY_MAGIC) + len(NPY_VERSION) + 2 + header_length
+
+    def __create(self, filename, size):
+        """
+        Auxiliary function that creates the file of a matrix with all its
+        cells pending, it returns the position of the first cell.
+        """
+        header = "{'descr': '%s', 'fortran_order': False, " \
+                 "'shape': (%d, %d), }" % (CELL_FORMAT, size, size)
+        prefix_length = len(NPY_MAGIC) + len(NPY_VERSION) + 2
+        padding = -(prefix_length + len(header) + 1) % NPY_ALIGNMENT
+        header += " " * padding + "\n"
+
+        with open(filename, "wb") as f:
+            f.write(NPY_MAGIC + NPY_VERSION)
+            f.write(struct.pack("<H", len(header)))
+            f.write(header)
+            row = struct.pack(CELL_FORMAT, PENDING) * size
+            for _ in xrange(size):
+                f.write(row)
+
+        return prefix_length + len(header)
+
+    def __getPosition(self, row, column):
+        if not (0 <= row < self.size and 0 <= column < self.size):
+            raise ValueError("The cell is out of the matrix")
+
+        return self.offset + (row * self.size + column) * CELL_SIZE
+
+    def getScore(self, row, column):
+        """
+        This function returns the score of a cell, NaN if it is pending.
+        """
+        return struct.unpack_from(CELL_FORMAT, self.data,
+                                  self.__getPosition(row, column))[0]
+
+    def setScore(self, row, column, score):
+        """
+        This function sets the score of a cell.
+        """
+        struct.pack_into(CELL_FORMAT, self.data,
+                         self.__getPosition(row, column), score)
+
+    def isComputed(self, row, column):
+        """
+        This function checks if the score of a cell has been set.
+        """
+        score = self.getScore(row, column)
+
+        return score == score
+
+    def flush(self):
+        """
+        This function writes the modified cells to the file.
+        """
+        if self.data is not None:
+            self.data.flush()
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+
+class AllPairsComparator:
+    """
+    This class computes the matrix with the best scores of every pair of dags
+    of a collection.
+
+    The mapper of each dag is built once, along the mappings rooted at its
+    nodes, and reused in all the comparisons of the dag. The comparisons of
+    each row share the data precomputed for the dag of the row, check the
+    BatchComparator. If the cost function is symmetric only the upper half of
+    the matrix is compared, the best score of a pair doesn't depend on the
+    order of its dags (check the TransitionsIterator).
+    """
+
+    def __init__(self, dags, number_of_variables=float('inf'),
+                 cost_function=None):
+        """
+        dags -> The sequence of DirectedAcyclicGraphs to compare, the rows and
+                columns of the matrix follow its order.
+        number_of_variables -> The maximum number of variables of the
+                               mappings.
+        cost_function -> Optional, the CostFunction used to compare the dags,
+                         the edit distance is used by default.
+        """
+        if cost_function is None:
+            cost_function = EditDistanceCost()
+
+        self.mappers = [DirectedAcyclicGraphMapper(dag) for dag in dags]
+        self.number_of_variables = number_of_variables
+        self.cost_function = cost_function
+
+    def compareRow(self, row, columns):
+        """
+        This function compares the dag of a row with the dags of the given
+        columns. It returns a list of tuples (column, best score), the score
+        is None if the dags don't have any derivation.
+        """
+        batch = BatchComparator(self.mappers[row],
+                                self.number_of_variables,
+                                self.cost_function)
+
+        return [(column, batch.compare(self.mappers[column])[0])
+                for column in columns]
+
+    def __getPendingRows(self, matrix):
+        """
+        Auxiliary function that returns the list of tuples (row, columns)
+        with the cells of each row that still have to be compared.
+        """
+        size = len(self.mappers)
+        tasks = []
+        for row in xrange(size):
+            if self.cost_function.symmetric:
+                columns = [column for column in xrange(row, size)
+                           if not matrix.isComputed(row, column) or
+                           not matrix.isComputed(column, row)]
+            else:
+                columns = [column for column in xrange(size)
+                           if not matrix.isComputed(row, column)]
+            if columns:
+                tasks.append((row, columns))
+
+        return tasks
+
+    def computeMatrix(self, filename, processes=None):
+        """
+        This function computes the matrix of best scores and returns it as a
+        SimilarityMatrix stored on filename.
+
+        The cells are written to the file as soon as each row is compared, if
+        the file already exists only the pending cells are compared, so an
+        interrupted computation can be resumed. The pairs without derivation
+        get the score NO_DERIVATION.
+
+        processes is optional, if specified the rows are compared in parallel
+        using a pool with that number of processes.
+        """
+        matrix = SimilarityMatrix(filename, len(self.mappers))
+        tasks = self.__getPendingRows(matrix)
+
+        pool = None
+        if processes:
+            pool = Pool(processes, initialize_all_pairs_worker, (self, ))
+            results = pool.imap_unordered(compare_row, tasks)
+        else:
+            results = ((row, self.compareRow(row, columns))
+                       for row, columns in tasks)
+
+        try:
+            for row, scores in results:
+                for column, score in scores:
+                    if score is None:
+                        score = NO_DERIVATION
+                    matrix.setScore(row, column, score)
+                    if self.cost_function.symmetric:
+                        matrix.setScore(column, row, score)
+                matrix.flush()
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        return matrix
@@ -0,0 +1,111 @@
+import unittest
+
+from batch_comparator import BatchComparator
+from datastructures import DirectedAcyclicGraph
+from directed_acyclic_graph_comparator import DirectedAcyclicGraphComparator
+from transitions_iterator import TransitionsIterator, derivation_score
+
+
+class testBatchComparator(unittest.TestCase):
+    def setUp(self):
+        root = "a"
+        links = {
+            "a": tuple("bcd"),
+            "b": tuple("ej"),
+            "c": tuple("f"),
+            "d": tuple("hi"),
+            "e": tuple(""),
+            "j": tuple(""),
+            "f": tuple(""),
+            "h": tuple(""),
+            "i": tuple("")
+        }
+        self.query = DirectedAcyclicGraph(root, links)
+
+        self.corpus = []
+        root = "A"
+        links = {
+            "A": tuple("BD"),
+            "B": tuple("CEF"),
+            "D": tuple("HIJ"),
+            "C": tuple(""),
+            "E": tuple(""),
+            "F": tuple(""),
+            "H": tuple(""),
+            "I": tuple(""),
+            "J": tuple("")
+        }
+        self.corpus.append(("medium", DirectedAcyclicGraph(root, links)))
+
+        root = "A"
+        links = {
+            "A": tuple("BC"),
+            "B": tuple("D"),
+            "C": tuple(),
+            "D": tuple()
+        }
+        self.corpus.append(("small", DirectedAcyclicGraph(root, links)))
+
+        root = "a"
+        links = {
+            "a": tuple("bc"),
+            "b": tuple("d"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        self.corpus.append(("lowercase", DirectedAcyclicGraph(root, links)))
+
+        root = "A"
+        links = {
+            "A": tuple()
+        }
+        self.corpus.append(("single", DirectedAcyclicGraph(root, links)))
+
+    def bestScore(self, dag):
+        comparator = DirectedAcyclicGraphComparator(self.query, dag)
+        comparator.buildHyperGraph(3)
+        try:
+            transitions = TransitionsIterator(comparator.hypergraph,
+                                              (self.query.root, dag.root))
+        except ValueError:
+            return None
+
+        return derivation_score(transitions.next())
+
+    def test_sameScoresAsComparator(self):
+        batch = BatchComparator(self.query, 3)
+        results = list(batch.compareCorpus(iter(self.corpus)))
+
+        self.assertEqual([x[0] for x in results],
+                         [x[0] for x in self.corpus])
+        for (_, dag), (_, score, derivation) in zip(self.corpus, results):
+            self.assertEqual(score, self.bestScore(dag))
+            if score is not None:
+                self.assertEqual(score, derivation_score(derivation))
+
+    def test_singleNodeDag(self):
+        batch = BatchComparator(self.query, 3)
+
+        self.assertEqual(batch.compare(self.corpus[-1][1]), (None, None))
+
+    def test_parallelSameAsSerial(self):
+        batch = BatchComparator(self.query, 3)
+        serial = [x[:2] for x in batch.compareCorpus(self.corpus)]
+        parallel = [x[:2] for x in batch.compareCorpus(self.corpus,
+                                                       processes=2)]
+
+        self.assertEqual(serial, parallel)
+
+    def test_queryMappingsAreGeneratedOnce(self):
+        batch = BatchComparator(self.query, 3)
+        batch.compare(self.corpus[0][1])
+        mappings = dict(batch.query_mapper.node_mappings)
+        batch.compare(self.corpus[1][1])
+
+        for key, value in mappings.iteritems():
+            self.assertTrue(batch.query_mapper.node_mappings[key] is value)
+
+
+if __name__ == '__main__':
+    unittest.main()
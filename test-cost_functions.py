@@ -0,0 +1,203 @@
+import unittest
+
+from cost_functions import CostFunction
+from cost_functions import DefaultCost
+from cost_functions import EditDistanceCost
+from cost_functions import WeightedCost
+from cost_functions import get_cost_function
+from cost_functions import register_cost_function
+from cost_functions import COST_FUNCTIONS
+import cost_functions
+from datastructures import DirectedAcyclicGraph
+from directed_acyclic_graph_comparator import DirectedAcyclicGraphComparator
+from directed_acyclic_graph_mapper import DirectedAcyclicGraphMapper
+from utils import t_cost_default
+from utils import t_cost_edit_distance_graphs_no_vars
+from utils import t_cost_edit_distance_graphs_with_vars
+
+
+class ConstantCost(CostFunction):
+    def scoreNodes(self, dag1, dag2):
+        return dict(((n1, n2), 1)
+                    for n1 in dag1.links.iterkeys()
+                    for n2 in dag2.links.iterkeys())
+
+    def scoreMappings(self, mappings1, mappings2):
+        return [[1] * len(mappings2) for _ in mappings1]
+
+
+class testCostFunctions(unittest.TestCase):
+    def setUp(self):
+        # First graph:
+        #       a
+        #      / \
+        #      b c
+        #      | |
+        #      d e
+        root = "a"
+        links = {
+            "a": tuple("bc"),
+            "b": tuple("d"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        self.dag1 = DirectedAcyclicGraph(root, links)
+
+        # Second graph:
+        #       A
+        #      / \
+        #      B C
+        #      |
+        #      D
+        root = "A"
+        links = {
+            "A": tuple("BC"),
+            "B": tuple("D"),
+            "C": tuple(),
+            "D": tuple()
+        }
+        self.dag2 = DirectedAcyclicGraph(root, links)
+
+        self.mappings1 = [m for m in DirectedAcyclicGraphMapper(self.dag1)
+                          .generateAllVariableMappings()
+                          if len(m.variables) == 1]
+        self.mappings2 = [m for m in DirectedAcyclicGraphMapper(self.dag2)
+                          .generateAllVariableMappings()
+                          if len(m.variables) == 1]
+
+    def test_editDistanceNodes(self):
+        scores = EditDistanceCost().scoreNodes(self.dag1, self.dag2)
+
+        self.assertEqual(len(scores), 5 * 4)
+        for (n1, n2), score in scores.iteritems():
+            self.assertEqual(score,
+                             t_cost_edit_distance_graphs_no_vars(self.dag1,
+                                                                 n1,
+                                                                 self.dag2,
+                                                                 n2))
+
+    def test_editDistanceMappings(self):
+        scores = EditDistanceCost().scoreMappings(self.mappings1,
+                                                  self.mappings2)
+
+        self.assertEqual(len(scores), len(self.mappings1))
+        for map1, row in zip(self.mappings1, scores):
+            self.assertEqual(len(row), len(self.mappings2))
+            for map2, score in zip(self.mappings2, row):
+                self.assertEqual(score,
+                                 t_cost_edit_distance_graphs_with_vars(map1,
+                                                                       map2))
+
+    def test_editDistanceMappingsOneByOne(self):
+        # The mappings of a comparison are processed once even if they are
+        # scored one pair at a time, as the deferred scoring does.
+        calls = []
+        mapping_effective_nodes = cost_functions.mapping_effective_nodes
+
+        def counted_effective_nodes(mapping):
+            calls.append(mapping)
+            return mapping_effective_nodes(mapping)
+        cost_functions.mapping_effective_nodes = counted_effective_nodes
+        try:
+            cost_function = EditDistanceCost()
+            for _ in xrange(2):
+                for map1 in self.mappings1:
+                    for map2 in self.mappings2:
+                        self.assertEqual(
+                            cost_function.scoreMappings([map1], [map2]),
+                            [[t_cost_edit_distance_graphs_with_vars(map1,
+                                                                    map2)]])
+        finally:
+            cost_functions.mapping_effective_nodes = mapping_effective_nodes
+
+        self.assertEqual(len(calls),
+                         len(self.mappings1) + len(self.mappings2))
+
+    def test_defaultMappings(self):
+        scores = DefaultCost().scoreMappings(self.mappings1, self.mappings2)
+
+        for map1, row in zip(self.mappings1, scores):
+            for map2, score in zip(self.mappings2, row):
+                self.assertEqual(score,
+                                 t_cost_default(map1.subgraph.nodes,
+                                                map2.subgraph.nodes))
+
+    def test_emptyMappings(self):
+        self.assertEqual(EditDistanceCost().scoreMappings([],
+                                                          self.mappings2),
+                         [])
+        self.assertEqual(EditDistanceCost().scoreMappings(self.mappings1,
+                                                          []),
+                         [[]] * len(self.mappings1))
+
+    def test_weightedCost(self):
+        edit_distance = EditDistanceCost()
+        cost_function = WeightedCost([(edit_distance, 2),
+                                      (ConstantCost(), 0.5)])
+
+        nodes = edit_distance.scoreNodes(self.dag1, self.dag2)
+        for pair, score in cost_function.scoreNodes(self.dag1,
+                                                    self.dag2).iteritems():
+            self.assertEqual(score, 2 * nodes[pair] + 0.5)
+
+        mappings = edit_distance.scoreMappings(self.mappings1, self.mappings2)
+        for row, weighted_row in zip(mappings,
+                                     cost_function.scoreMappings(
+                                         self.mappings1, self.mappings2)):
+            self.assertEqual(weighted_row, [2 * x + 0.5 for x in row])
+
+    def test_bounds(self):
+        edit_distance = EditDistanceCost()
+
+        self.assertEqual(edit_distance.boundNodes(self.dag1, self.dag2),
+                         edit_distance.scoreNodes(self.dag1, self.dag2))
+        self.assertEqual(DefaultCost().boundNodes(self.dag1, self.dag2), None)
+
+        bounds = WeightedCost([(edit_distance, 2)]).boundNodes(self.dag1,
+                                                               self.dag2)
+        for pair, bound in edit_distance.boundNodes(self.dag1,
+                                                    self.dag2).iteritems():
+            self.assertEqual(bounds[pair], 2 * bound)
+
+        self.assertEqual(WeightedCost([(edit_distance, -1)])
+                         .boundNodes(self.dag1, self.dag2), None)
+        self.assertEqual(WeightedCost([(edit_distance, 1),
+                                       (DefaultCost(), 1)])
+                         .boundNodes(self.dag1, self.dag2), None)
+
+    def test_weightedCostWithoutComponents(self):
+        self.assertRaises(ValueError, WeightedCost, [])
+
+    def test_registry(self):
+        self.assertTrue(isinstance(get_cost_function('edit_distance'),
+                                   EditDistanceCost))
+        self.assertRaises(ValueError, get_cost_function, 'constant')
+
+        register_cost_function('constant', ConstantCost)
+        try:
+            self.assertTrue(isinstance(get_cost_function('constant'),
+                                       ConstantCost))
+        finally:
+            del COST_FUNCTIONS['constant']
+
+    def test_costAssembler(self):
+        comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        comparator.costAssembler([('edit_distance', 1),
+                                  (ConstantCost(), -1)])
+        comparator.buildHyperGraph()
+
+        reference = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        reference.buildHyperGraph()
+
+        for node in reference.hypergraph.nodes:
+            self.assertEqual(comparator.hypergraph.getNodeWeight(node),
+                             reference.hypergraph.getNodeWeight(node) - 1)
+        for hyperedge in reference.hypergraph.hyperedges:
+            self.assertEqual(
+                comparator.hypergraph.getHyperedgeLabel(hyperedge).weight,
+                reference.hypergraph.getHyperedgeLabel(hyperedge).weight - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
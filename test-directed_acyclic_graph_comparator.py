@@ -1,8 +1,13 @@
 import unittest
 
 from datastructures import DirectedAcyclicGraph
+from datastructures import DirectedAcyclicSubgraphWithVariables
 
 from directed_acyclic_graph_comparator import DirectedAcyclicGraphComparator
+import directed_acyclic_graph_comparator
+
+from utils import t_cost_edit_distance_graphs_no_vars
+from utils import t_cost_edit_distance_graphs_with_vars
 
 
 class testBuildHypergraph(unittest.TestCase):
@@ -41,6 +46,12 @@ class testBuildHypergraph(unittest.TestCase):
         self.assertEqual(number,
                          len(self.comparator.hypergraph.hyperedges))
 
+    def test_countHyperedges(self):
+        number = 30
+
+        self.assertEqual(number,
+                         self.comparator.countHyperedges())
+
     def test_aANodeScore(self):
         node = ('a', 'A')
         score = 1.0
@@ -106,5 +117,108 @@ class testBuildHypergraph(unittest.TestCase):
         self.assertEquals(self.comparator.hypergraph.containsHyperedge(hyperedge),
                           False)
 
+
+class testBuildHypergraphEditDistance(unittest.TestCase):
+    def setUp(self):
+        root = "a"
+        links = {
+            "a": tuple("bcd"),
+            "b": tuple("cd"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        self.dag1 = DirectedAcyclicGraph(root, links)
+
+        root = "A"
+        links = {
+            "A": tuple("BC"),
+            "B": tuple(),
+            "C": tuple("Dd"),
+            "D": tuple(),
+            "d": tuple()
+        }
+        self.dag2 = DirectedAcyclicGraph(root, links)
+
+        self.comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        self.comparator.buildHyperGraph()
+
+    def test_nodeScores(self):
+        for n1 in self.dag1.links:
+            for n2 in self.dag2.links:
+                score = t_cost_edit_distance_graphs_no_vars(self.dag1, n1,
+                                                            self.dag2, n2)
+                self.assertEqual(score,
+                                 self.comparator.hypergraph.getNodeWeight((n1,
+                                                                           n2)))
+
+    def test_hyperedgeScores(self):
+        hypergraph = self.comparator.hypergraph
+        for hyperedge in hypergraph.hyperedges:
+            label = hypergraph.getHyperedgeLabel(hyperedge)
+            subgraph1, subgraph2 = \
+                self.comparator.getHyperedgeSubgraphs(hyperedge)
+            map1 = DirectedAcyclicSubgraphWithVariables(
+                self.dag1, subgraph1, tuple(x[0] for x in hyperedge[1:]))
+            map2 = DirectedAcyclicSubgraphWithVariables(
+                self.dag2, subgraph2, tuple(x[1] for x in hyperedge[1:]))
+
+            self.assertEqual(self.comparator.getHyperedgeMappings(hyperedge),
+                             (map1, map2))
+
+            self.assertEqual(t_cost_edit_distance_graphs_with_vars(map1, map2),
+                             label.weight)
+
+    def test_compactHypergraph(self):
+        comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        comparator.buildHyperGraph(compact=True)
+        compact = comparator.hypergraph
+        hypergraph = self.comparator.hypergraph
+
+        self.assertEqual(sorted(compact.hyperedges),
+                         sorted(hypergraph.hyperedges))
+        for node in hypergraph.nodes:
+            self.assertEqual(compact.getNodeWeight(node),
+                             hypergraph.getNodeWeight(node))
+        for hyperedge in hypergraph.hyperedges:
+            self.assertEqual(compact.getHyperedgeLabel(hyperedge).weight,
+                             hypergraph.getHyperedgeLabel(hyperedge).weight)
+            self.assertEqual(comparator.getHyperedgeSubgraphs(hyperedge),
+                             self.comparator.getHyperedgeSubgraphs(hyperedge))
+
+    def test_lazyCompactHypergraph(self):
+        comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+
+        self.assertRaises(ValueError, comparator.buildHyperGraph,
+                          lazy=True, compact=True)
+        self.assertRaises(ValueError, comparator.buildHyperGraph,
+                          best_only=True, compact=True)
+
+    def test_lazyHypergraph(self):
+        comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        comparator.buildHyperGraph(lazy=True)
+        lazy = comparator.hypergraph
+        hypergraph = self.comparator.hypergraph
+
+        self.assertEqual(len(lazy.hyperedges), 0)
+        self.assertEqual(set(lazy.nodes), set(hypergraph.nodes))
+
+        expected = [h for h in hypergraph.hyperedges if h[0] == ('b', 'C')]
+        self.assertEqual(sorted(lazy.expandNode(('b', 'C'))), sorted(expected))
+        self.assertEqual(len(lazy.hyperedges), len(expected))
+        for hyperedge in expected:
+            self.assertEqual(lazy.getHyperedgeLabel(hyperedge).weight,
+                             hypergraph.getHyperedgeLabel(hyperedge).weight)
+
+    def test_tooManyMappings(self):
+        mapping_id_mask = directed_acyclic_graph_comparator.MAPPING_ID_MASK
+        directed_acyclic_graph_comparator.MAPPING_ID_MASK = 3
+        try:
+            comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+            self.assertRaises(ValueError, comparator.buildHyperGraph)
+        finally:
+            directed_acyclic_graph_comparator.MAPPING_ID_MASK = \
+                mapping_id_mask
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,11 @@
 import unittest
 
-from collections import defaultdict, deque
+from collections import deque
 
 from datastructures import DirectedAcyclicGraph
+from datastructures import DirectedAcyclicGraphEdit
 from directed_acyclic_graph_mapper import DirectedAcyclicGraphMapper
+from directed_acyclic_graph_mapper import SelectableNodesIndex
 
 
 class testGenerateVariableMappings(unittest.TestCase):
@@ -152,6 +154,91 @@ class testGenerateVariableMappings(unittest.TestCase):
         solution = all(map(lambda x: len(x) <= num_variables, solution))
         self.assertTrue(solution)
 
+    def test_Set2VariablesMulticharacterNodes(self):
+        graph = {
+            "root": ("left", "right"),
+            "left": tuple(),
+            "right": tuple()
+        }
+        dag_mapper = DirectedAcyclicGraphMapper(DirectedAcyclicGraph("root",
+                                                                     graph))
+        valid_solution = set([('left',), ('right',), ('left', 'right')])
+        solution = dag_mapper.generateVariableMappings("root", 2)
+
+        self.assertEqual(valid_solution, solution)
+
+    def test_countVariableMappingsGraph1(self):
+        for num_variables in (1, 2, 3, float('inf')):
+            solution = self.dag_mapper1.generateVariableMappings(self.dag1.root,
+                                                                 num_variables)
+            counts = dict()
+            for variables in solution:
+                counts[len(variables)] = counts.get(len(variables), 0) + 1
+
+            self.assertEqual(counts,
+                             self.dag_mapper1.countVariableMappings(
+                                 self.dag1.root, num_variables))
+
+    def test_countVariableMappingsWideRoot(self):
+        # 2^60 subsets of children, only the ones with up to 2 variables
+        # are visited.
+        links = {"root": tuple(str(x) for x in xrange(60))}
+        for x in xrange(60):
+            links[str(x)] = tuple()
+        dag_mapper = DirectedAcyclicGraphMapper(DirectedAcyclicGraph("root",
+                                                                     links))
+
+        calls = []
+        is_selectable = SelectableNodesIndex.isSelectable
+
+        def counted_is_selectable(index, node, taken):
+            calls.append(node)
+            return is_selectable(index, node, taken)
+        SelectableNodesIndex.isSelectable = counted_is_selectable
+        try:
+            counts = dag_mapper.countVariableMappings("root", 2)
+        finally:
+            SelectableNodesIndex.isSelectable = is_selectable
+
+        self.assertEqual(counts, {1: 60, 2: 60 * 59 / 2})
+        self.assertLessEqual(len(calls), 60 * 59)
+        self.assertEqual(len(dag_mapper.generateVariableMappings("root", 2)),
+                         60 + 60 * 59 / 2)
+
+    def test_countAllVariableMappingsGraph2(self):
+        solution = [(subgraph.root, counts) for subgraph, counts in
+                    self.dag_mapper2.countAllVariableMappings(2)]
+
+        self.assertEqual(solution, [('c', {}), ('b', {}),
+                                    ('a', {1: 2, 2: 1})])
+
+    def test_iterVariableMappingsIsLazy(self):
+        mappings = self.dag_mapper1.iterVariableMappings(self.dag1.root, 2)
+        first = next(mappings)
+
+        self.assertIn(first,
+                      self.dag_mapper1.generateVariableMappings(self.dag1.root,
+                                                                2))
+
+    def test_iterVariableMappingsCanonicalOrder(self):
+        solution = list(self.dag_mapper1.iterVariableMappings(self.dag1.root,
+                                                              float('inf')))
+
+        self.assertEqual(solution, sorted(set(solution)))
+
+    def test_iterAllVariableMappingsSameAsGenerateAll(self):
+        mappings = self.dag_mapper1.iterAllVariableMappings(3)
+
+        self.assertEqual(list(mappings),
+                         self.dag_mapper1.generateAllVariableMappings(3))
+
+    def test_parallelVariableMappingsSameAsSerial(self):
+        mappings = self.dag_mapper1.generateAllVariableMappings(3,
+                                                                processes=2)
+
+        self.assertEqual(mappings,
+                         self.dag_mapper1.generateAllVariableMappings(3))
+
 
 class testBuildSuccessors(unittest.TestCase):
     def setUp(self):
@@ -186,56 +273,111 @@ class testBuildSuccessors(unittest.TestCase):
         self.dag_mapper2 = DirectedAcyclicGraphMapper(self.dag2)
 
     def test_successorsFromRootGraph1(self):
-        solutions = dict({'a': {'c': 1, 'b': 1, 'e': 2, 'd': 1}, 'c': {'e': 2}, 'b': {'c': 2, 'e': 3, 'd': 2}})
-        successors = defaultdict(dict)
+        solutions = {'a': {'b': 1, 'c': 1, 'd': 1, 'e': 2},
+                     'b': {'c': 1, 'd': 1, 'e': 2},
+                     'c': {'e': 1},
+                     'd': {},
+                     'e': {}}
 
-        self.dag_mapper1._DirectedAcyclicGraphMapper__buildSuccessors(self.dag1.root,
-                                                                      0,
-                                                                      set(),
-                                                                      successors)
+        successors = self.dag_mapper1.\
+            _DirectedAcyclicGraphMapper__buildSuccessorsTable(self.dag1.root)
 
         self.assertEqual(solutions, successors)
 
     def test_successorsFromNodeBGraph1(self):
-        solutions = dict({'c': {'e': 2}, 'b': {'c': 1, 'e': 2, 'd': 1}})
-        successors = defaultdict(dict)
+        solutions = {'b': {'c': 1, 'd': 1, 'e': 2},
+                     'c': {'e': 1},
+                     'd': {},
+                     'e': {}}
 
-        self.dag_mapper1._DirectedAcyclicGraphMapper__buildSuccessors('b',
-                                                                      0,
-                                                                      set(),
-                                                                      successors)
+        successors = self.dag_mapper1.\
+            _DirectedAcyclicGraphMapper__buildSuccessorsTable('b')
 
         self.assertEqual(solutions, successors)
 
     def test_succesorsFromLeafGraph1(self):
-        solutions = dict()
-        successors = defaultdict(dict)
+        solutions = {'d': {}}
+
+        successors = self.dag_mapper1.\
+            _DirectedAcyclicGraphMapper__buildSuccessorsTable('d')
 
-        self.dag_mapper1._DirectedAcyclicGraphMapper__buildSuccessors('d',
-                                                                      0,
-                                                                      set(),
-                                                                      successors)
         self.assertEqual(solutions, successors)
 
     def test_successorsFromRootGraph2(self):
-        solutions = {'a': {'c': 1, 'b': 1}}
-        successors = defaultdict(dict)
-        self.dag_mapper2._DirectedAcyclicGraphMapper__buildSuccessors(self.dag2.root,
-                                                                      0,
-                                                                      set(),
-                                                                      successors)
+        solutions = {'a': {'c': 1, 'b': 1}, 'b': {}, 'c': {}}
+
+        successors = self.dag_mapper2.\
+            _DirectedAcyclicGraphMapper__buildSuccessorsTable(self.dag2.root)
+
         self.assertEqual(successors, solutions)
 
     def test_successorsFromLeafGraph2(self):
-        solutions = {}
-        successors = defaultdict(dict)
-        self.dag_mapper2._DirectedAcyclicGraphMapper__buildSuccessors('b',
-                                                                      0,
-                                                                      set(),
-                                                                      successors)
+        solutions = {'b': {}}
+
+        successors = self.dag_mapper2.\
+            _DirectedAcyclicGraphMapper__buildSuccessorsTable('b')
 
         self.assertEqual(successors, solutions)
 
+    def test_successorsDeeperThanRecursionLimit(self):
+        # A path a0 -> a1 -> ... longer than the default recursion limit
+        length = 1200
+        graph = dict((i, (i + 1,)) for i in xrange(length))
+        graph[length] = tuple()
+        dag_mapper = DirectedAcyclicGraphMapper(DirectedAcyclicGraph(0, graph))
+
+        subgraphs = dag_mapper.generateSourceSubgraphs(1)
+
+        self.assertEqual(len(subgraphs), length + 1)
+        self.assertEqual(subgraphs[-1], (0, (0, 1)))
+
+
+class testSelectableNodesIndex(unittest.TestCase):
+    def setUp(self):
+        # First graph:
+        #    ---a
+        #   |  / \
+        #   |  b-c
+        #   |  | |
+        #    --d e
+        root = "a"
+        graph = {
+            "a": tuple("bcd"),
+            "b": tuple("cd"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        self.dag1 = DirectedAcyclicGraph(root, graph)
+        self.dag_mapper1 = DirectedAcyclicGraphMapper(self.dag1)
+        self.node_index = \
+            self.dag_mapper1._DirectedAcyclicGraphMapper__getNodeIndex()
+        self.index = SelectableNodesIndex(self.node_index.positions["a"],
+                                          self.node_index.children,
+                                          self.toBitmask("bcde"))
+
+    def toBitmask(self, nodes):
+        return sum(1 << self.node_index.positions[x] for x in nodes)
+
+    def test_selectableNodesNothingTaken(self):
+        self.assertEqual(self.index.getSelectableNodes(0),
+                         self.toBitmask("bcde"))
+
+    def test_selectableNodesTakenC(self):
+        self.assertEqual(self.index.getSelectableNodes(self.toBitmask("c")),
+                         self.toBitmask("bd"))
+
+    def test_isSelectableDescendantOfTakenNode(self):
+        self.assertFalse(self.index.isSelectable(self.toBitmask("e"),
+                                                 self.toBitmask("c")))
+        self.assertTrue(self.index.isSelectable(self.toBitmask("e"),
+                                                self.toBitmask("b")))
+
+    def test_isSelectableTakenNode(self):
+        self.assertFalse(self.index.isSelectable(self.toBitmask("d"),
+                                                 self.toBitmask("d")))
+
+
 class testGenerateSourceSubgraphs(unittest.TestCase):
     def setUp(self):
         # First graph:
@@ -344,6 +486,110 @@ class testGenerateSourceSubgraphs(unittest.TestCase):
 
         self.assertEquals(solutions, subgraphs)
 
+    def test_sourceSubgraphSameAsSourceSubgraphs(self):
+        for depth in (0, 1, float('inf')):
+            for subgraph in self.dag_mapper1.generateSourceSubgraphs(depth):
+                self.assertEquals(
+                    self.dag_mapper1.generateSourceSubgraph(subgraph.root,
+                                                            depth),
+                    subgraph)
+
+    def test_sourceSubgraphUnknownNode(self):
+        self.assertRaises(ValueError,
+                          self.dag_mapper1.generateSourceSubgraph,
+                          'z')
+
+    def test_nodeVariableMappings(self):
+        mappings = [m for m in self.dag_mapper1.generateAllVariableMappings(2)
+                    if m.subgraph.root == 'b']
+
+        self.assertEquals(
+            list(self.dag_mapper1.iterNodeVariableMappings('b', 2)),
+            mappings)
+
+
+class testApplyEdit(unittest.TestCase):
+    def setUp(self):
+        # First graph:
+        #    ---a
+        #   |  / \
+        #   |  b-c
+        #   |  | |
+        #    --d e
+        root = "a"
+        graph = {
+            "a": tuple("bcd"),
+            "b": tuple("cd"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        self.dag1 = DirectedAcyclicGraph(root, graph)
+        self.dag_mapper1 = DirectedAcyclicGraphMapper(self.dag1)
+        self.mappings = self.dag_mapper1.trackVariableMappings(3)
+
+    def toSet(self, mappings):
+        return set((x.subgraph.root, frozenset(x.subgraph.nodes), x.variables)
+                   for x in mappings)
+
+    def checkTrackedMappings(self, update):
+        dag = DirectedAcyclicGraph(self.dag_mapper1.dag.root,
+                                   dict(self.dag_mapper1.dag.links))
+        solution = DirectedAcyclicGraphMapper(dag).generateAllVariableMappings(3)
+        mappings = self.dag_mapper1.getTrackedVariableMappings()
+
+        self.assertEqual(self.toSet(solution), self.toSet(mappings))
+        self.assertEqual(self.toSet(self.mappings)
+                         .difference(self.toSet(update.removed))
+                         .union(self.toSet(update.added)),
+                         self.toSet(mappings))
+
+    def test_addEdge(self):
+        edit = DirectedAcyclicGraphEdit('add_edge', 'd', 'e')
+        update = self.dag_mapper1.applyEdit(edit)
+
+        self.checkTrackedMappings(update)
+        # The subgraphs rooted on c and e don't change
+        self.assertFalse(any(x.subgraph.root in "ce" for x in update.removed))
+
+    def test_removeEdge(self):
+        edit = DirectedAcyclicGraphEdit('remove_edge', 'b', 'c')
+        update = self.dag_mapper1.applyEdit(edit)
+
+        self.checkTrackedMappings(update)
+
+    def test_addAndRemoveNode(self):
+        self.dag_mapper1.applyEdit(DirectedAcyclicGraphEdit('add_node',
+                                                            'f',
+                                                            None))
+        update = self.dag_mapper1.applyEdit(
+            DirectedAcyclicGraphEdit('add_edge', 'c', 'f'))
+        self.checkTrackedMappings(update)
+
+        self.mappings = self.dag_mapper1.getTrackedVariableMappings()
+        update = self.dag_mapper1.applyEdit(
+            DirectedAcyclicGraphEdit('remove_node', 'c', None))
+        self.checkTrackedMappings(update)
+
+    def test_relabel(self):
+        edit = DirectedAcyclicGraphEdit('relabel', 'e', 'z')
+        update = self.dag_mapper1.applyEdit(edit)
+
+        self.checkTrackedMappings(update)
+        self.assertTrue(all('e' not in x.subgraph.nodes
+                            for x in self.dag_mapper1
+                            .getTrackedVariableMappings()))
+
+    def test_addEdgeCycle(self):
+        edit = DirectedAcyclicGraphEdit('add_edge', 'e', 'b')
+
+        self.assertRaises(ValueError, self.dag_mapper1.applyEdit, edit)
+
+    def test_removeRoot(self):
+        edit = DirectedAcyclicGraphEdit('remove_node', 'a', None)
+
+        self.assertRaises(ValueError, self.dag_mapper1.applyEdit, edit)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 
+from hypergraph import ArrayHypergraph
 from hypergraph import Hypergraph
+from hypergraph import LazyHypergraph
 
 
 class TestHypergraph(unittest.TestCase):
@@ -106,6 +108,105 @@ class TestHypergraph(unittest.TestCase):
 
         self.assertEqual(self.a.getHyperedgesFromNode('b'), solution)
 
+    def test_outgoingHyperedges(self):
+        self.a.addNode('a', 1)
+        self.a.addNode('b', 2)
+        self.a.addNode('c', 3)
+
+        self.a.addHyperedge(('a', 'b', 'c'), 0, 0.5)
+        self.a.addHyperedge(('a', 'c'), 1, 1.5)
+        self.a.addHyperedge(('b', 'c'), 2, 2.5)
+        self.a.updateHyperedgeLabel(('a', 'c'), 1, 3.5)
+
+        self.assertEqual(self.a.getOutgoingHyperedges('a'),
+                         [(('b', 'c'), 0.5), (('c', ), 3.5)])
+        self.assertEqual(self.a.getOutgoingHyperedges('c'), [])
+        self.assertRaises(ValueError, self.a.getOutgoingHyperedges, 'z')
+
+
+class TestArrayHypergraph(TestHypergraph):
+    def setUp(self):
+        self.a = ArrayHypergraph()
+
+    def test_manyHyperedges(self):
+        for node in xrange(30):
+            self.a.addNode(node, node)
+        hyperedges = [(x, y) for x in xrange(30) for y in xrange(x + 1, 30)]
+        for position, hyperedge in enumerate(hyperedges):
+            self.a.addHyperedge(hyperedge, position, -position)
+
+        self.assertEqual(len(self.a.hyperedges), len(hyperedges))
+        self.assertEqual(list(self.a.hyperedges), hyperedges)
+        for position, hyperedge in enumerate(hyperedges):
+            self.assertEqual(self.a.getHyperedgeLabel(hyperedge),
+                             (position, -position))
+        self.assertFalse(self.a.containsHyperedge((1, 0)))
+        self.assertEqual(self.a.getHyperedgesFromNode(29),
+                         [h for h in hyperedges if 29 in h])
+        self.assertRaises(ValueError, self.a.addHyperedge, (0, 1), 0, 0)
+
+    def test_unscoredHyperedge(self):
+        self.a.addNode('a', 1)
+        self.a.addNode('b', 2)
+        self.a.addHyperedge(('a', 'b'), 1, None)
+
+        self.assertEqual(self.a.getHyperedgeLabel(('a', 'b')).weight, None)
+        self.a.updateHyperedgeLabel(('a', 'b'), 1, 0.5)
+        self.assertEqual(self.a.getHyperedgeLabel(('a', 'b')).weight, 0.5)
+
+
+class TestLazyHypergraph(unittest.TestCase):
+    def setUp(self):
+        self.expanded = []
+        self.a = LazyHypergraph(self.expand)
+        self.a.addNode('a', 1)
+        self.a.addNode('b', 2)
+        self.a.addNode('c', 3)
+
+    def expand(self, node):
+        self.expanded.append(node)
+        if node == 'a':
+            return [(('a', 'b'), "ab", 1), (('a', 'b', 'c'), "abc", 2)]
+        return []
+
+    def test_hyperedgesAreGeneratedOnDemand(self):
+        self.assertEqual(len(self.a.hyperedges), 0)
+        self.assertFalse(self.a.isExpanded('a'))
+
+        self.assertEqual(self.a.expandNode('a'), [('a', 'b'), ('a', 'b', 'c')])
+        self.assertTrue(self.a.isExpanded('a'))
+        self.assertEqual(self.a.getHyperedgeLabel(('a', 'b', 'c')).weight, 2)
+        self.assertEqual(self.a.getHyperedgesFromNode('c'), [('a', 'b', 'c')])
+
+    def test_expandNodeOnce(self):
+        self.a.expandNode('a')
+        self.a.expandNode('a')
+        self.a.expandNode('b')
+
+        self.assertEqual(self.expanded, ['a', 'b'])
+        self.assertEqual(self.a.expandNode('b'), [])
+
+    def test_expandUnknownNode(self):
+        self.assertRaises(ValueError, self.a.expandNode, 'z')
+
+    def test_deferredScoring(self):
+        scored = []
+
+        def score(hyperedge, data):
+            scored.append(hyperedge)
+            return len(data)
+
+        a = LazyHypergraph(lambda node: [((node, 'b'), "ab", None)], score)
+        a.addNode('a', 1)
+        a.addNode('b', 2)
+        a.expandNode('a')
+
+        self.assertEqual(scored, [])
+        self.assertEqual(a.getHyperedgeLabel(('a', 'b')).weight, 2)
+        self.assertEqual(a.getHyperedgeLabel(('a', 'b')).weight, 2)
+        self.assertEqual(scored, [('a', 'b')])
+        self.assertEqual(a.getOutgoingHyperedges('a'), [(('b', ), 2)])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cost_functions import EditDistanceCost
+from datastructures import DirectedAcyclicGraph
+from directed_acyclic_graph_comparator import DirectedAcyclicGraphComparator
+from hypergraph import Hypergraph
+from hypergraph_file import HypergraphFileWriter
+from hypergraph_file import MappedHypergraph
+from hypergraph_file import save_hypergraph
+import hypergraph_file
+from transitions_iterator import TransitionsIterator, derivation_score
+
+
+class testHypergraphFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "hypergraph.bin")
+
+        # First graph:
+        #       a
+        #      / \
+        #      b c
+        #      | |
+        #      d e
+        root = "a"
+        links = {
+            "a": tuple("bc"),
+            "b": tuple("d"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        self.dag1 = DirectedAcyclicGraph(root, links)
+
+        # Second graph:
+        #       A
+        #      / \
+        #      B C
+        #      |
+        #      D
+        root = "A"
+        links = {
+            "A": tuple("BC"),
+            "B": tuple("D"),
+            "C": tuple(),
+            "D": tuple()
+        }
+        self.dag2 = DirectedAcyclicGraph(root, links)
+
+        self.comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        self.comparator.buildHyperGraph()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameHypergraph(self, hypergraph, other):
+        self.assertEqual(set(hypergraph.nodes), set(other.nodes))
+        self.assertEqual(sorted(hypergraph.hyperedges),
+                         sorted(other.hyperedges))
+        for node in hypergraph.nodes:
+            self.assertEqual(hypergraph.getNodeWeight(node),
+                             other.getNodeWeight(node))
+            self.assertEqual(hypergraph.getHyperedgesFromNode(node),
+                             other.getHyperedgesFromNode(node))
+        for hyperedge in hypergraph.hyperedges:
+            self.assertEqual(hypergraph.getHyperedgeLabel(hyperedge),
+                             other.getHyperedgeLabel(hyperedge))
+
+    def test_roundTripAsPickle(self):
+        pickled = os.path.join(self.directory, "hypergraph.pkl")
+        self.comparator.hypergraph.saveToFile(pickled)
+        save_hypergraph(self.comparator.hypergraph, self.filename)
+
+        mapped = MappedHypergraph(self.filename)
+        self.assertSameHypergraph(Hypergraph.loadFromFile(pickled), mapped)
+        self.assertFalse(mapped.containsHyperedge((('a', 'A'), ('a', 'A'))))
+        mapped.close()
+
+    def test_compactRoundTrip(self):
+        comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        comparator.buildHyperGraph(compact=True)
+        save_hypergraph(comparator.hypergraph, self.filename)
+
+        mapped = MappedHypergraph(self.filename)
+        self.assertSameHypergraph(comparator.hypergraph, mapped)
+        mapped.close()
+
+    def test_transitionsOverMappedFile(self):
+        save_hypergraph(self.comparator.hypergraph, self.filename)
+        mapped = MappedHypergraph(self.filename)
+
+        roots = (self.dag1.root, self.dag2.root)
+        expected = [derivation_score(x) for x in
+                    TransitionsIterator(self.comparator.hypergraph, roots)]
+        scores = [derivation_score(x) for x in
+                  TransitionsIterator(mapped, roots)]
+
+        self.assertEqual(max(scores), max(expected))
+        self.assertEqual(sorted(scores), sorted(expected))
+        mapped.close()
+
+    def test_labelsData(self):
+        hypergraph = Hypergraph()
+        hypergraph.addNode('a', 1)
+        hypergraph.addNode('b', 2.5)
+        hypergraph.addHyperedge(('a', 'b'), ("ab", 1), None)
+        save_hypergraph(hypergraph, self.filename)
+
+        mapped = MappedHypergraph(self.filename)
+        self.assertSameHypergraph(hypergraph, mapped)
+        self.assertRaises(ValueError, mapped.addNode, 'c', 3)
+        mapped.close()
+
+    def test_unsupportedLabels(self):
+        hypergraph = Hypergraph()
+        hypergraph.addNode(object(), 1)
+
+        self.assertRaises(ValueError, save_hypergraph, hypergraph,
+                          self.filename)
+
+    def test_invalidFile(self):
+        with open(self.filename, "wb") as f:
+            f.write("not a hypergraph")
+        self.assertRaises(ValueError, MappedHypergraph, self.filename)
+
+        save_hypergraph(self.comparator.hypergraph, self.filename)
+        with open(self.filename, "rb") as f:
+            data = f.read()
+        with open(self.filename, "wb") as f:
+            f.write(data[:len(data) / 2])
+        self.assertRaises(ValueError, MappedHypergraph, self.filename)
+
+    def test_streamedHypergraph(self):
+        comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        comparator.buildHyperGraph(sink=HypergraphFileWriter(self.filename))
+
+        self.assertTrue(isinstance(comparator.hypergraph, MappedHypergraph))
+        self.assertSameHypergraph(self.comparator.hypergraph,
+                                  comparator.hypergraph)
+        self.assertEqual(os.listdir(self.directory), ["hypergraph.bin"])
+
+        roots = (self.dag1.root, self.dag2.root)
+        expected = TransitionsIterator(self.comparator.hypergraph, roots)
+        best = TransitionsIterator(comparator.hypergraph, roots).next()
+        self.assertEqual(derivation_score(best),
+                         derivation_score(expected.next()))
+        comparator.hypergraph.close()
+
+    def test_lazySink(self):
+        writer = HypergraphFileWriter(self.filename)
+        comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+
+        self.assertRaises(ValueError, comparator.buildHyperGraph,
+                          lazy=True, sink=writer)
+        self.assertRaises(ValueError, comparator.buildHyperGraph,
+                          best_only=True, sink=writer)
+        writer.discard()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_failedBuildDiscardsTheSink(self):
+        class FailingCost(EditDistanceCost):
+            def scoreMappings(self, mappings1, mappings2):
+                raise RuntimeError("The mappings can't be scored")
+
+        comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2,
+                                                    cost_function=
+                                                    FailingCost())
+        self.assertRaises(RuntimeError, comparator.buildHyperGraph,
+                          sink=HypergraphFileWriter(self.filename))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_severalChunks(self):
+        chunk_size = hypergraph_file.CHUNK_SIZE
+        hypergraph_file.CHUNK_SIZE = 4
+        try:
+            writer = HypergraphFileWriter(self.filename)
+            hypergraph = Hypergraph()
+            for node in xrange(10):
+                writer.addNode(node, node)
+                hypergraph.addNode(node, node)
+            for x in xrange(10):
+                for y in xrange(x + 1, 10):
+                    writer.addHyperedge((x, y), x * y, x - y)
+                    hypergraph.addHyperedge((x, y), x * y, x - y)
+            mapped = writer.finalize()
+        finally:
+            hypergraph_file.CHUNK_SIZE = chunk_size
+
+        self.assertSameHypergraph(hypergraph, mapped)
+        self.assertEqual(mapped.getOutgoingHyperedges(8), [((9, ), -1)])
+        mapped.close()
+
+    def test_repeatedHyperedge(self):
+        writer = HypergraphFileWriter(self.filename)
+        writer.addNode('a', 1)
+        writer.addNode('b', 2)
+        writer.addHyperedge(('a', 'b'), 0, 1)
+        writer.addHyperedge(('a', 'b'), 1, 1)
+
+        self.assertRaises(ValueError, writer.finalize)
+
+    def test_invalidHyperedges(self):
+        writer = HypergraphFileWriter(self.filename)
+        writer.addNode('a', 1)
+
+        self.assertRaises(ValueError, writer.addNode, 'a', 1)
+        self.assertRaises(ValueError, writer.addHyperedge, ('a', 'b'), 0, 1)
+        self.assertRaises(ValueError, writer.addHyperedge, ('a', ), "a", 1)
+        writer.finalize().close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from datastructures import DirectedAcyclicGraph
+from directed_acyclic_graph_mapper import DirectedAcyclicGraphMapper
+from mapping_cache import MappingCache
+
+
+class testMappingCache(unittest.TestCase):
+    def setUp(self):
+        # First graph:
+        #    ---a
+        #   |  / \
+        #   |  b-c
+        #   |  | |
+        #    --d e
+        root = "a"
+        graph = {
+            "a": tuple("bcd"),
+            "b": tuple("cd"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        self.dag1 = DirectedAcyclicGraph(root, graph)
+
+        # Trivial example
+        #       a
+        #      / \
+        #      b c
+        root = "a"
+        graph = {
+            "a": tuple("bc"),
+            "b": tuple(""),
+            "c": tuple("")
+        }
+        self.dag2 = DirectedAcyclicGraph(root, graph)
+
+        self.directory = tempfile.mkdtemp()
+        self.cache = MappingCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_missingEntry(self):
+        self.assertEqual(self.cache.load(self.dag1, 3, float('inf')), None)
+
+    def test_sameContentSameKey(self):
+        dag = DirectedAcyclicGraph("a", dict(self.dag1.links))
+
+        self.assertEqual(self.cache.getKey(self.dag1, 3, float('inf')),
+                         self.cache.getKey(dag, 3, float('inf')))
+
+    def test_differentParametersDifferentKey(self):
+        self.assertNotEqual(self.cache.getKey(self.dag1, 3, float('inf')),
+                            self.cache.getKey(self.dag1, 2, float('inf')))
+        self.assertNotEqual(self.cache.getKey(self.dag1, 3, float('inf')),
+                            self.cache.getKey(self.dag1, 3, 1))
+
+    def test_cachedMappingsSameAsGenerated(self):
+        mappings = DirectedAcyclicGraphMapper(self.dag1)\
+            .generateAllVariableMappings(3)
+
+        cold = DirectedAcyclicGraphMapper(self.dag1, self.cache)\
+            .generateAllVariableMappings(3)
+        warm = DirectedAcyclicGraphMapper(self.dag1, self.cache)\
+            .generateAllVariableMappings(3)
+
+        self.assertEqual(mappings, cold)
+        self.assertEqual(mappings, warm)
+        self.assertNotEqual(self.cache.load(self.dag1, 3, float('inf')), None)
+
+    def test_evictLeastRecentlyUsed(self):
+        DirectedAcyclicGraphMapper(self.dag1, self.cache)\
+            .generateAllVariableMappings()
+        filename = os.path.join(self.directory, os.listdir(self.directory)[0])
+        size = os.path.getsize(filename)
+        # Make sure the entry is the oldest one
+        os.utime(filename, (0, 0))
+
+        # Only room for one entry
+        self.cache.max_size = size
+        DirectedAcyclicGraphMapper(self.dag2, self.cache)\
+            .generateAllVariableMappings()
+
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertNotEqual(self.cache.load(self.dag2, float('inf'),
+                                            float('inf')),
+                            None)
+
+    def test_corruptedEntryIsDiscarded(self):
+        DirectedAcyclicGraphMapper(self.dag1, self.cache)\
+            .generateAllVariableMappings()
+        filename = os.path.join(self.directory, os.listdir(self.directory)[0])
+        with open(filename, "wb") as f:
+            f.write("corrupted")
+
+        self.assertEqual(self.cache.load(self.dag1, float('inf'),
+                                         float('inf')),
+                         None)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_concurrentlyEvictedEntryIsMissing(self):
+        DirectedAcyclicGraphMapper(self.dag1, self.cache)\
+            .generateAllVariableMappings()
+        filename = os.path.join(self.directory, os.listdir(self.directory)[0])
+
+        # Another process removes the entry once it has been read
+        utime = os.utime
+
+        def evicted_utime(path, times):
+            os.remove(filename)
+            utime(path, times)
+        os.utime = evicted_utime
+        try:
+            self.assertEqual(self.cache.load(self.dag1, float('inf'),
+                                             float('inf')),
+                             None)
+        finally:
+            os.utime = utime
+
+        with open(filename, "wb") as f:
+            f.write("corrupted")
+        remove = os.remove
+
+        def evicted_remove(path):
+            remove(path)
+            remove(path)
+        os.remove = evicted_remove
+        try:
+            self.assertEqual(self.cache.load(self.dag1, float('inf'),
+                                             float('inf')),
+                             None)
+        finally:
+            os.remove = remove
+
+
+if __name__ == '__main__':
+    unittest.main()
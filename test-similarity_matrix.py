@@ -0,0 +1,194 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from batch_comparator import BatchComparator
+from cost_functions import WeightedCost
+from cost_functions import EditDistanceCost
+from datastructures import DirectedAcyclicGraph
+from similarity_matrix import AllPairsComparator
+from similarity_matrix import NO_DERIVATION
+from similarity_matrix import SimilarityMatrix
+
+
+class testSimilarityMatrix(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "matrix.npy")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_newMatrixIsPending(self):
+        matrix = SimilarityMatrix(self.filename, 3)
+
+        for row in xrange(3):
+            for column in xrange(3):
+                self.assertFalse(matrix.isComputed(row, column))
+        matrix.close()
+
+    def test_scoresArePersisted(self):
+        matrix = SimilarityMatrix(self.filename, 3)
+        matrix.setScore(0, 2, -1.5)
+        matrix.setScore(2, 1, NO_DERIVATION)
+        matrix.close()
+
+        matrix = SimilarityMatrix(self.filename)
+        self.assertEqual(matrix.size, 3)
+        self.assertEqual(matrix.getScore(0, 2), -1.5)
+        self.assertEqual(matrix.getScore(2, 1), NO_DERIVATION)
+        self.assertFalse(matrix.isComputed(1, 1))
+        matrix.close()
+
+    def test_npyHeader(self):
+        SimilarityMatrix(self.filename, 5).close()
+
+        with open(self.filename, "rb") as f:
+            data = f.read()
+        header_length = len(data) - 5 * 5 * 8
+
+        self.assertTrue(data.startswith("\x93NUMPY\x01\x00"))
+        self.assertEqual(header_length % 64, 0)
+        self.assertTrue("'shape': (5, 5)" in data[:header_length])
+
+    def test_differentSize(self):
+        SimilarityMatrix(self.filename, 3).close()
+
+        self.assertRaises(ValueError, SimilarityMatrix, self.filename, 4)
+
+    def test_cellOutOfTheMatrix(self):
+        matrix = SimilarityMatrix(self.filename, 3)
+
+        self.assertRaises(ValueError, matrix.getScore, 3, 0)
+        matrix.close()
+
+
+class testAllPairsComparator(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "matrix.npy")
+
+        self.dags = []
+        root = "a"
+        links = {
+            "a": tuple("bc"),
+            "b": tuple("d"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        self.dags.append(DirectedAcyclicGraph(root, links))
+
+        root = "A"
+        links = {
+            "A": tuple("BC"),
+            "B": tuple("D"),
+            "C": tuple(),
+            "D": tuple()
+        }
+        self.dags.append(DirectedAcyclicGraph(root, links))
+
+        root = "a"
+        links = {
+            "a": tuple("bcd"),
+            "b": tuple("cd"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        self.dags.append(DirectedAcyclicGraph(root, links))
+
+        root = "A"
+        links = {
+            "A": tuple()
+        }
+        self.dags.append(DirectedAcyclicGraph(root, links))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sameScoresAsBatchComparator(self):
+        matrix = AllPairsComparator(self.dags, 2).computeMatrix(self.filename)
+
+        for row, dag in enumerate(self.dags):
+            batch = BatchComparator(dag, 2)
+            for column, other in enumerate(self.dags):
+                score = batch.compare(other)[0]
+                if score is None:
+                    score = NO_DERIVATION
+                self.assertEqual(matrix.getScore(row, column), score)
+        matrix.close()
+
+    def test_parallelSameAsSerial(self):
+        serial = AllPairsComparator(self.dags, 2).computeMatrix(self.filename)
+        parallel = AllPairsComparator(self.dags, 2).computeMatrix(
+            os.path.join(self.directory, "parallel.npy"), processes=2)
+
+        for row in xrange(len(self.dags)):
+            for column in xrange(len(self.dags)):
+                self.assertEqual(serial.getScore(row, column),
+                                 parallel.getScore(row, column))
+        serial.close()
+        parallel.close()
+
+    def test_resumeOnlyComputesPendingCells(self):
+        matrix = SimilarityMatrix(self.filename, len(self.dags))
+        for row in xrange(len(self.dags)):
+            for column in xrange(len(self.dags)):
+                matrix.setScore(row, column, 1)
+        matrix.setScore(0, 1, float('nan'))
+        matrix.close()
+
+        matrix = AllPairsComparator(self.dags, 2).computeMatrix(self.filename)
+
+        self.assertNotEqual(matrix.getScore(0, 1), 1)
+        self.assertEqual(matrix.getScore(1, 0), matrix.getScore(0, 1))
+        self.assertEqual(matrix.getScore(2, 3), 1)
+        matrix.close()
+
+    def test_swappedDagsHaveTheSameScore(self):
+        # The best continuations of some nodes tie on their accumulated
+        # weight but not on the weight of their hyperedges.
+        root = "e"
+        links = {
+            "b": tuple("f"),
+            "c": tuple(),
+            "e": tuple("b"),
+            "f": tuple("c")
+        }
+        dag1 = DirectedAcyclicGraph(root, links)
+
+        root = "h"
+        links = {
+            "a": tuple(),
+            "b": tuple(),
+            "f": tuple("b"),
+            "g": tuple("ba"),
+            "h": tuple("fg")
+        }
+        dag2 = DirectedAcyclicGraph(root, links)
+
+        self.assertEqual(BatchComparator(dag1, 1).compare(dag2)[0], -5)
+        self.assertEqual(BatchComparator(dag2, 1).compare(dag1)[0], -5)
+
+        matrix = AllPairsComparator([dag1, dag2], 1)\
+            .computeMatrix(self.filename)
+        self.assertEqual(matrix.getScore(0, 1), -5)
+        self.assertEqual(matrix.getScore(1, 0), -5)
+        matrix.close()
+
+    def test_asymmetricCostComputesEveryCell(self):
+        cost_function = WeightedCost([(EditDistanceCost(), 1)])
+        cost_function.symmetric = False
+        matrix = AllPairsComparator(self.dags, 2, cost_function)\
+            .computeMatrix(self.filename)
+
+        for row in xrange(len(self.dags)):
+            for column in xrange(len(self.dags)):
+                self.assertTrue(matrix.isComputed(row, column))
+        matrix.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
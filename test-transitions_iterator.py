@@ -2,7 +2,10 @@ import unittest
 
 from datastructures import DirectedAcyclicGraph
 from directed_acyclic_graph_comparator import DirectedAcyclicGraphComparator
+from hypergraph import Hypergraph
 from transitions_iterator import TransitionsIterator, Continuation
+from transitions_iterator import Transition
+from transitions_iterator import derivation_score, expand_derivation
 
 
 class mappingsBigGraphTestCase(unittest.TestCase):
@@ -154,6 +157,7 @@ class mappingsSmallGraphTestCase(unittest.TestCase):
 
         comparator = DirectedAcyclicGraphComparator(dag1, dag2)
         comparator.buildHyperGraphDebug()
+        cls.comparator = comparator
 
         it = TransitionsIterator(comparator.hypergraph, ('a', 'A'))
 
@@ -162,6 +166,10 @@ class mappingsSmallGraphTestCase(unittest.TestCase):
             cls.derivations.append(x)
         cls.number = pos
 
+        it = TransitionsIterator(comparator.hypergraph, ('a', 'A'),
+                                 best_first=True)
+        cls.best_first_derivations = list(it)
+
     def test_ThereMustBe18Derivations(self):
         self.assertEqual(self.number, 18)
 
@@ -180,5 +188,283 @@ class mappingsSmallGraphTestCase(unittest.TestCase):
                    last[0][0])) + last[0][1]
         self.assertGreater(max, last)
 
+    def test_derivationsAreNotModified(self):
+        it = TransitionsIterator(self.comparator.hypergraph, ('a', 'A'))
+        derivations = []
+        solutions = []
+        for derivation in iter(it.nextDerivation, None):
+            derivations.append(derivation)
+            solutions.append(expand_derivation(derivation))
+
+        self.assertEqual(len(derivations), 18)
+        self.assertEqual(map(expand_derivation, derivations), solutions)
+        self.assertEqual(map(derivation_score, derivations),
+                         map(derivation_score, solutions))
+
+    def test_countDerivations(self):
+        it = TransitionsIterator(self.comparator.hypergraph, ('a', 'A'))
+        self.assertEqual(it.countDerivations(), 18)
+
+        it = TransitionsIterator(self.comparator.hypergraph, ('a', 'A'),
+                                 best_first=True)
+        self.assertEqual(it.countDerivations(), 18)
+
+    def test_bestFirstGeneratesAllTheDerivations(self):
+        shapes = set(tuple(tuple(c.continuation_node for c in step[0])
+                           for step in derivation)
+                     for derivation in self.best_first_derivations)
+        self.assertEqual(len(self.best_first_derivations), 18)
+        self.assertEqual(len(shapes), 18)
+
+    def test_bestFirstScoresAreSorted(self):
+        scores = map(derivation_score, self.best_first_derivations)
+        self.assertAlmostEqual(scores[0], 3.8)
+        self.assertAlmostEqual(scores[-1], 1.68)
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+class mappingsBestFirstTestCase(unittest.TestCase):
+    def setUp(self):
+        # Hyperedges: a -> b (10), a -> c (0), c -> d e (1)
+        self.hypergraph = Hypergraph()
+        for node, weight in zip("abcde", (0, 1, 2, 3, 4)):
+            self.hypergraph.addNode(node, weight)
+        self.hypergraph.addHyperedge(('a', 'b'), None, 10)
+        self.hypergraph.addHyperedge(('a', 'c'), None, 0)
+        self.hypergraph.addHyperedge(('c', 'd', 'e'), None, 1)
+
+    def test_derivationsInOrder(self):
+        it = TransitionsIterator(self.hypergraph, 'a', best_first=True)
+
+        best = it.next()
+        self.assertEqual(best, (([Continuation('b', 1)], 10),
+                                ((Continuation(None, 1), ), 0)))
+        self.assertEqual(derivation_score(best), 11)
+
+        second = it.next()
+        self.assertEqual(second, (([Continuation('c', 8)], 0),
+                                  ([Continuation('d', 3),
+                                    Continuation('e', 4)], 1),
+                                  ((Continuation(None, 3), ), 0),
+                                  ((Continuation(None, 4), ), 0)))
+        self.assertEqual(derivation_score(second), 8)
+        self.assertRaises(StopIteration, it.next)
+
+    def test_lazyHypergraph(self):
+        root = "a"
+        links = {
+            "a": tuple("bc"),
+            "b": tuple("d"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple("")
+        }
+        dag1 = DirectedAcyclicGraph(root, links)
+
+        root = "A"
+        links = {
+            "A": tuple("BC"),
+            "B": tuple("D"),
+            "C": tuple(),
+            "D": tuple()
+        }
+        dag2 = DirectedAcyclicGraph(root, links)
+
+        eager = DirectedAcyclicGraphComparator(dag1, dag2)
+        eager.buildHyperGraph()
+        lazy = DirectedAcyclicGraphComparator(dag1, dag2)
+        lazy.buildHyperGraph(lazy=True)
+
+        expected = map(derivation_score,
+                       TransitionsIterator(eager.hypergraph, ('a', 'A'),
+                                           best_first=True))
+        scores = map(derivation_score,
+                     TransitionsIterator(lazy.hypergraph, ('a', 'A'),
+                                         best_first=True))
+        self.assertEqual(scores, expected)
+
+
+class mappingsDeepHypergraphTestCase(unittest.TestCase):
+    def setUp(self):
+        # The hypergraph is a path deeper than the recursion limit.
+        self.path = Hypergraph()
+        for node in xrange(5000):
+            self.path.addNode(node, 1)
+        for node in xrange(4999):
+            self.path.addHyperedge((node, node + 1), None, 1)
+
+    def test_cacheOfADeepHypergraph(self):
+        it = TransitionsIterator(self.path, 0)
+
+        self.assertEqual(len(it.transitions_cache), 5000)
+        self.assertEqual(it.transitions_cache[0],
+                         Transition(([Continuation(1, 4999)], ), 1))
+        self.assertEqual(it.transitions_cache[4999],
+                         Transition(((Continuation(None, 1), ), ), 0))
+        self.assertEqual(it.countDerivations(), 1)
+
+        solution = it.next()
+        self.assertEqual(len(solution), 5000)
+        self.assertEqual(solution[0], ([Continuation(1, 4999)], 1))
+        self.assertEqual(solution[-1], ((Continuation(None, 1), ), 0))
+        self.assertEqual(derivation_score(solution), 5000)
+        self.assertRaises(StopIteration, it.next)
+
+    def test_bestFirstOnADeepHypergraph(self):
+        it = TransitionsIterator(self.path, 0, best_first=True)
+
+        solution = it.next()
+        self.assertEqual(len(solution), 5000)
+        self.assertEqual(solution[0], ([Continuation(1, 4999)], 1))
+        self.assertEqual(solution[-1], ((Continuation(None, 1), ), 0))
+        self.assertEqual(derivation_score(solution), 5000)
+        self.assertRaises(StopIteration, it.next)
+
+    def test_countManyDerivations(self):
+        # Each node reaches the next one through two different nodes.
+        hypergraph = Hypergraph()
+        hypergraph.addNode(0, 1)
+        for node in xrange(100):
+            for middle in ("a", "b"):
+                hypergraph.addNode((middle, node), 1)
+                hypergraph.addHyperedge((node, (middle, node)), None, 1)
+            hypergraph.addNode(node + 1, 1)
+            for middle in ("a", "b"):
+                hypergraph.addHyperedge(((middle, node), node + 1), None, 1)
+
+        it = TransitionsIterator(hypergraph, 0)
+        self.assertEqual(it.countDerivations(), 2 ** 100)
+
+
+class mappingsLazyGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        root = "a"
+        links = {
+            "a": tuple("bc"),
+            "b": tuple("d"),
+            "c": tuple("e"),
+            "d": tuple(""),
+            "e": tuple(""),
+            "f": tuple("")
+        }
+        self.dag1 = DirectedAcyclicGraph(root, links)
+
+        root = "A"
+        links = {
+            "A": tuple("BC"),
+            "B": tuple("D"),
+            "C": tuple(),
+            "D": tuple()
+        }
+        self.dag2 = DirectedAcyclicGraph(root, links)
+
+    def test_sameDerivationsAsEager(self):
+        eager = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        eager.buildHyperGraph()
+        lazy = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        lazy.buildHyperGraph(lazy=True)
+
+        eager_derivations = list(TransitionsIterator(eager.hypergraph,
+                                                     ('a', 'A')))
+        lazy_derivations = list(TransitionsIterator(lazy.hypergraph,
+                                                    ('a', 'A')))
+
+        self.assertEqual(len(eager_derivations), len(lazy_derivations))
+
+    def test_unreachablePairsAreNotExpanded(self):
+        lazy = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        lazy.buildHyperGraph(lazy=True)
+        TransitionsIterator(lazy.hypergraph, ('b', 'B')).next()
+
+        self.assertTrue(lazy.hypergraph.isExpanded(('b', 'B')))
+        self.assertFalse(lazy.hypergraph.isExpanded(('a', 'A')))
+        for hyperedge in lazy.hypergraph.hyperedges:
+            self.assertEqual(hyperedge[0], ('b', 'B'))
+
+    def test_iteratorsOnlyReadReachableNodes(self):
+        comparator = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        comparator.buildHyperGraph()
+        hypergraph = comparator.hypergraph
+        requested = []
+
+        def getOutgoingHyperedges(node):
+            requested.append(node)
+            return Hypergraph.getOutgoingHyperedges(hypergraph, node)
+        hypergraph.getOutgoingHyperedges = getOutgoingHyperedges
+
+        TransitionsIterator(hypergraph, ('b', 'B')).next()
+        self.assertEqual(set(requested), set([('b', 'B'), ('d', 'D')]))
+
+
+class mappingsBoundedGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        root = "a"
+        links = {
+            "a": tuple("bcd"),
+            "b": tuple("ej"),
+            "c": tuple("f"),
+            "d": tuple("hi"),
+            "e": tuple(""),
+            "j": tuple(""),
+            "f": tuple(""),
+            "h": tuple(""),
+            "i": tuple("")
+        }
+        self.dag1 = DirectedAcyclicGraph(root, links)
+
+        root = "A"
+        links = {
+            "A": tuple("BD"),
+            "B": tuple("CEF"),
+            "D": tuple("HIJ"),
+            "C": tuple(""),
+            "E": tuple(""),
+            "F": tuple(""),
+            "H": tuple(""),
+            "I": tuple(""),
+            "J": tuple("")
+        }
+        self.dag2 = DirectedAcyclicGraph(root, links)
+
+    def score(self, derivation):
+        return sum(map(lambda x: x.accumulated_weight,
+                       derivation[0][0])) + derivation[0][1]
+
+    def test_sameBestScoreAsExhaustive(self):
+        eager = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        eager.buildHyperGraph(3)
+        best = TransitionsIterator(eager.hypergraph, ('a', 'A')).next()
+
+        bounded = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        bounded.buildHyperGraph(3, best_only=True)
+        it = TransitionsIterator(bounded.hypergraph, ('a', 'A'),
+                                 bounded.getNodeBounds())
+
+        self.assertAlmostEqual(self.score(it.next()), self.score(best))
+        self.assertLess(len(bounded.hypergraph.hyperedges),
+                        len(eager.hypergraph.hyperedges))
+
+    def test_countPrunedDerivations(self):
+        bounded = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        bounded.buildHyperGraph(3, best_only=True)
+        bounds = bounded.getNodeBounds()
+
+        it = TransitionsIterator(bounded.hypergraph, ('a', 'A'), bounds)
+        self.assertEqual(it.countDerivations(),
+                         len(list(TransitionsIterator(bounded.hypergraph,
+                                                      ('a', 'A'), bounds))))
+
+    def test_onlySelectedHyperedgesAreScored(self):
+        bounded = DirectedAcyclicGraphComparator(self.dag1, self.dag2)
+        bounded.buildHyperGraph(3, best_only=True)
+        TransitionsIterator(bounded.hypergraph, ('a', 'A'),
+                            bounded.getNodeBounds()).next()
+
+        scored = [h for h, label in bounded.hypergraph.hyperedges.iteritems()
+                  if label.weight is not None]
+        self.assertLessEqual(len(scored),
+                             len(bounded.hypergraph.expanded_nodes))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,13 @@
-from collections import defaultdict, namedtuple
-from copy import deepcopy
+from array import array
+from collections import namedtuple
+from heapq import heappop, heappush
 
-# This data type will contain the information to represent the
-# hyperedges of the hypergraph as transitions. Check the
-# function __resetStates for more information.
-TransitionData = namedtuple("TransitionData", ["continuation_nodes",
-                                               "weight"])
+from hypergraph import ArrayHypergraph, LazyHypergraph
+
+# Margin used when pruning transitions with the bounds so the rounding errors
+# of the floating point sums never discard a transition that ties with the
+# best one.
+PRUNING_TOLERANCE = 1e-9
 
 # This data type represents a continuation, that is given a path
 # which is the next node that we can take. This node has an associated
@@ -51,6 +53,94 @@ Transition = namedtuple("Transition", ["continuations",
                                        "weight"])
 
 
+# This data type represents a node whose transition is being built, check the
+# function __build_transitions_cache of the TransitionsIterator.
+# The transitions are the ones of the node that are explored in order, the
+# position is the one of the transition being explored and the continuations
+# are the ones of its continuation nodes found so far. The explored
+# transitions are kept on transition_continuations along the accumulated
+# weight of their continuations.
+class PendingNode:
+    def __init__(self, node, transitions):
+        self.node = node
+        self.transitions = transitions
+        self.position = 0
+        self.continuations = []
+        self.transition_continuations = []
+        self.weights = []
+        self.best_accumulated_weight = None
+
+
+# This data type represents a derivation as a tree of back pointers. The
+# continuation_nodes are the nodes reached by its first transition, whose
+# weight is weight, and the children are the derivations of each
+# continuation node (empty when the derivation ends on a node, then the
+# continuation_nodes are (None, )). The accumulated_weight is the weight of
+# the derivation when it is a continuation of another one.
+# The derivations are immutable and the ones generated one after another by
+# the TransitionsIterator share the children that don't change, so they can
+# be kept without copying them. Check the function expand_derivation to get
+# the solution with all its transitions.
+Derivation = namedtuple("Derivation", ["continuation_nodes",
+                                       "weight",
+                                       "children",
+                                       "accumulated_weight"])
+
+
+# This data type represents the state of the enumeration of the derivations
+# of a node, check the function __enumerate_transitions of the
+# TransitionsIterator. The position is the one of the continuation of the
+# transition of the node being enumerated, the derivation is the current one
+# and the children are the EnumerationNodes of its continuation nodes. Like
+# the derivations they are immutable so they can be shared.
+EnumerationNode = namedtuple("EnumerationNode", ["node",
+                                                 "position",
+                                                 "derivation",
+                                                 "children"])
+
+
+def expand_derivation(derivation):
+    """
+    Returns the solution of a Derivation, the tuple with its transitions in
+    depth-first order. Each transition is a tuple with the list of its
+    continuations and its weight, the continuations of the transitions where
+    the derivation ends are the tuple (Continuation(None, node weight), ).
+    """
+    solution = []
+    pending = [derivation]
+    while pending:
+        derivation = pending.pop()
+        if not derivation.children:
+            continuations = (Continuation(None,
+                                          derivation.accumulated_weight), )
+        else:
+            continuations = [Continuation(node, child.accumulated_weight)
+                             for node, child in
+                             zip(derivation.continuation_nodes,
+                                 derivation.children)]
+            pending.extend(reversed(derivation.children))
+        solution.append((continuations, derivation.weight))
+
+    return tuple(solution)
+
+
+def derivation_score(derivation):
+    """
+    Returns the score of a derivation generated by the TransitionsIterator,
+    that is the weight of its first transition plus the accumulated weights
+    of its continuations. The derivation can be a Derivation or its solution.
+    """
+    if isinstance(derivation, Derivation):
+        if not derivation.children:
+            return derivation.accumulated_weight
+        return derivation.weight + sum(child.accumulated_weight
+                                       for child in derivation.children)
+
+    continuations, weight = derivation[0]
+
+    return weight + sum(map(lambda x: x.accumulated_weight, continuations))
+
+
 class TransitionsIterator:
     """
     Iterator class that enumerates the possibles paths of the hypergraph.
@@ -85,46 +175,145 @@ class TransitionsIterator:
         l.insert(insert_position,
                  state)
 
-    def __sort_continuations(self, continuations):
+    def __get_node_transitions(self, hypergraph, node):
+        """
+        This function returns the transitions of a node, the list with the
+        tails (the continuation nodes) and the weight of each hyperedge that
+        starts on it. They are read from the index of the hypergraph the first
+        time the node is requested (check the function getOutgoingHyperedges
+        of the hypergraphs), so only the reachable nodes are visited. If the
+        hypergraph is lazy the node is expanded first.
+        Example
+            Hyperedge ('aA', 'bB', 'cC') with a cost 0.5
+            produces for the node 'aA'
+            [OutgoingHyperedge(tails=('bB', 'cC'), weight=0.5)]
         """
-        Auxiliary function used to sort continuations.
+        if node not in self.node_transitions and \
+           hypergraph.containsNode(node):
+            if self.lazy:
+                # The weights of the hyperedges whose scoring is deferred are
+                # None until they are requested, check LazyHypergraph.
+                hypergraph.expandNode(node)
+            self.node_transitions[node] = \
+                hypergraph.getOutgoingHyperedges(node)
+
+        return self.node_transitions.get(node)
+
+    def __bound_transition(self, transition):
+        """
+        Auxiliary function that returns the upper bound of the accumulated
+        weight of the continuation nodes of a transition.
+        """
+        return sum(self.bounds.get(n, float('inf'))
+                   for n in transition.tails)
 
-        It sorts the continuations decreasingly by the accumulated weight of
-        the continuation nodes of the transition and its associated weight.
+    def __add_transition(self, node, transition, accumulated_weight):
+        """
+        Auxiliary function that adds the transition of a node to the
+        transitions cache along its accumulated weight.
         """
-        computed_weights = []
-        for continuation in continuations:
-            value = sum(map(lambda x: x.accumulated_weight,
-                            continuation))
-            computed_weights.append(value)
+        self.transitions_cache[node] = transition
+        self.node_positions[node] = len(self.accumulated_weights)
+        self.accumulated_weights.append(accumulated_weight)
 
-        sorting_list = zip(computed_weights, continuations)
-        return map(lambda x: x[1], sorted(sorting_list,
-                                          reverse=True))
+    def __start_node(self, hypergraph, node):
+        """
+        Auxiliary function that starts building the transition of a node. If
+        the node doesn't have transitions it is added to the transitions
+        cache and None is returned, otherwise it returns its PendingNode.
+        """
+        node_transitions = self.__get_node_transitions(hypergraph, node)
+        if not node_transitions:
+            weight = hypergraph.getNodeWeight(node)
+            c = Continuation(None, weight)
+            self.__add_transition(node, Transition(((c,),), 0), weight)
+            return None
 
-    def __resetStates(self, hypergraph):
+        if self.bounds is not None:
+            node_transitions = sorted(node_transitions,
+                                      key=self.__bound_transition,
+                                      reverse=True)
+
+        return PendingNode(node, node_transitions)
+
+    def __explore_transitions(self, pending):
+        """
+        Auxiliary function that explores the transitions of a PendingNode
+        until it finds a continuation node that is not in the transitions
+        cache, it returns that node or None if the exploration is finished.
         """
-        This functions builds the transitions dictionary for a given hypergraph.
+        while pending.position < len(pending.transitions):
+            transition = pending.transitions[pending.position]
+            if pending.best_accumulated_weight is not None and \
+               self.__bound_transition(transition) + \
+               PRUNING_TOLERANCE < pending.best_accumulated_weight:
+                break
 
-        The transitions dictionary has as keys the firt element of a hyperedge
-        and as values transition data elements. The transition data is formed
-        by a list of continuation nodes, which are the rest of the nodes that
-        form the hyperedge, and the weight associated with that hyperedge.
-        Example
-            Hyperedge ('aA', 'bB', 'cC') with a cost 0.5
-            produces
-            {'aA': TransitionData(ContinuationNodes=['bB', 'cC'],
-                                  weight=0.5)}
+            continuations = pending.continuations
+            while len(continuations) < len(transition.tails):
+                transition_node = transition.tails[len(continuations)]
+                if transition_node not in self.node_positions:
+                    return transition_node
+                position = self.node_positions[transition_node]
+                continuations.append(
+                    Continuation(transition_node,
+                                 self.accumulated_weights[position]))
+
+            accumulated_weight = sum(map(lambda x: x.accumulated_weight,
+                                         continuations))
+            pending.transition_continuations.append(continuations)
+            pending.weights.append(accumulated_weight)
+            if self.bounds is not None and \
+               (pending.best_accumulated_weight is None or
+                accumulated_weight > pending.best_accumulated_weight):
+                pending.best_accumulated_weight = accumulated_weight
+
+            pending.continuations = []
+            pending.position += 1
+
+        return None
+
+    def __continuation_weight(self, hypergraph, node, continuation):
+        """
+        Auxiliary function that returns the weight of the hyperedge that
+        goes from a node to the continuation nodes of a continuation.
         """
-        transitions = defaultdict(list)
-        for hyperedge in hypergraph.hyperedges:
-            continuation_nodes = hyperedge[1:]
-            weight = hypergraph.getHyperedgeLabel(hyperedge).weight
+        continuation_nodes = map(lambda x: x.continuation_node, continuation)
+        hyperedge = (node,) + tuple(continuation_nodes)
 
-            transitions[hyperedge[0]].append(TransitionData(continuation_nodes,
-                                                            weight))
+        return hypergraph.getHyperedgeLabel(hyperedge).weight
 
-        return transitions
+    def __finish_node(self, hypergraph, pending):
+        """
+        Auxiliary function that adds the transition of an explored
+        PendingNode to the transitions cache. The continuations are sorted in
+        a decreasing fashion by their accumulated weight, the ones with the
+        same weight keep the order in which they were explored. The weight of
+        the transition is the one of the hyperedge of the best continuation.
+
+        When several continuations tie with the best accumulated weight the
+        one whose hyperedge has the highest weight is taken as the best one,
+        so the weight of the best derivation doesn't depend on the order in
+        which the transitions were explored (which changes, for instance,
+        when the dags compared are swapped).
+        """
+        sorting_list = sorted(zip(pending.weights,
+                                  pending.transition_continuations),
+                              key=lambda x: x[0],
+                              reverse=True)
+        best_weight = sorting_list[0][0]
+        tied = 1
+        while tied < len(sorting_list) and \
+                sorting_list[tied][0] == best_weight:
+            tied += 1
+
+        weights = [self.__continuation_weight(hypergraph, pending.node, c)
+                   for _, c in sorting_list[:tied]]
+        best = weights.index(max(weights))
+        sorting_list.insert(0, sorting_list.pop(best))
+
+        t = Transition(tuple(map(lambda x: x[1], sorting_list)), weights[best])
+        self.__add_transition(pending.node, t, best_weight + weights[best])
 
     def __build_transitions_cache(self, hypergraph, node):
         """
@@ -143,126 +332,441 @@ class TransitionsIterator:
         decreasing fashion. Later when we enumerate the solutions we will use
         the fact that the possible transitions are sorted to offer the best
         solution first.
+
+        The nodes are visited depth-first using a stack of PendingNodes
+        instead of recursion, so the depth of the hypergraph is not limited
+        by the recursion limit. A node is added to the cache once all its
+        continuation nodes are, that is in reverse topological order, and the
+        accumulated weight of its best continuation plus its weight is stored
+        so the nodes that reach it don't compute it again. For the array
+        based hypergraphs the accumulated weights are stored on an array.
+
+        If the iterator has bounds the transitions are explored in decreasing
+        order of the bound of their continuation nodes, once the bound is
+        below the accumulated weight of an explored transition the rest can't
+        be the best one and they are discarded without exploring their
+        continuation nodes.
         """
-        if node in self.transitions_cache:
-            yield self.transitions_cache[node]
+        if node in self.node_positions:
+            return
+
+        pending = self.__start_node(hypergraph, node)
+        stack = [pending] if pending is not None else []
+        while stack:
+            transition_node = self.__explore_transitions(stack[-1])
+            if transition_node is not None:
+                pending = self.__start_node(hypergraph, transition_node)
+                if pending is not None:
+                    stack.append(pending)
+            else:
+                self.__finish_node(hypergraph, stack.pop())
 
-        if node not in self.node_transitions:
-            c = Continuation(None, hypergraph.getNodeWeight(node))
-            t = Transition(((c,),), 0)
-            self.transitions_cache[node] = t
-            yield t
+    def __enumeration_node(self, node, position, children):
+        """
+        Auxiliary function that returns the EnumerationNode of a node for
+        the continuation at position of its transition, the children are the
+        EnumerationNodes of the continuation nodes.
+        """
+        transition = self.transitions_cache[node]
+        continuation = transition.continuations[position]
+        continuation_nodes = tuple(map(lambda x: x.continuation_node,
+                                       continuation))
+        if not children:
+            derivation = Derivation(continuation_nodes, transition.weight, (),
+                                    continuation[0].accumulated_weight +
+                                    transition.weight)
         else:
-            transition_continuations = []
-            for continuation in self.node_transitions[node]:
-                continuations = []
-                for transition_node in continuation.continuation_nodes:
-                    n = self.__build_transitions_cache(hypergraph,
-                                                       transition_node).next()
-                    best_continuation = n.continuations[0]
-                    accumulated_weight = sum(map(lambda x: x.accumulated_weight,
-                                                 best_continuation))
-                    accumulated_weight += n.weight
-                    c = Continuation(transition_node, accumulated_weight)
-                    continuations.append(c)
-                transition_continuations.append(continuations)
-
-            c = self.__sort_continuations(transition_continuations)
-            continuation_nodes = map(lambda x: x.continuation_node, c[0])
-            hyperedge = (node,) + tuple(continuation_nodes)
-            t = Transition(tuple(c),
-                           hypergraph.getHyperedgeLabel(hyperedge).weight)
-            self.transitions_cache[node] = t
-            yield t
-
-    # TODO: Currently it generates the best solution first and then
-    # lexicografically the rest. Modify it to computed all the solutions in
-    # order.
+            derivation = Derivation(continuation_nodes,
+                                    transition.weight,
+                                    tuple(map(lambda x: x.derivation,
+                                              children)),
+                                    children[0].derivation.accumulated_weight +
+                                    transition.weight)
+
+        return EnumerationNode(node, position, derivation, children)
+
+    def __first_enumeration_nodes(self):
+        """
+        Auxiliary function that returns a dictionary with the EnumerationNode
+        of the first derivation of each node of the transitions cache, that
+        is the one that takes the first continuation of every node. The
+        nodes are visited in the order they were added to the cache so the
+        continuation nodes are built before the nodes that reach them.
+        """
+        first = dict()
+        for node in sorted(self.node_positions, key=self.node_positions.get):
+            continuation = self.transitions_cache[node].continuations[0]
+            children = ()
+            if continuation[0].continuation_node is not None:
+                children = tuple(first[c.continuation_node]
+                                 for c in continuation)
+            first[node] = self.__enumeration_node(node, 0, children)
+
+        return first
+
+    def __next_enumeration_node(self, enumeration_node, first):
+        """
+        Auxiliary function that returns the EnumerationNode of the derivation
+        that follows the one of enumeration_node, None if it was the last
+        one.
+
+        The last continuation node whose derivation can be advanced is
+        advanced and the ones after it start again from their first
+        derivation; when none can be advanced the next continuation of the
+        transition is taken. The continuation nodes are visited using a
+        stack instead of recursion, so the depth of the hypergraph is not
+        limited by the recursion limit. Each element of the stack is an
+        EnumerationNode along the position of the child being advanced.
+        """
+        stack = [(enumeration_node, len(enumeration_node.children))]
+        advanced = None
+        while stack:
+            enumeration_node, position = stack.pop()
+            node, current, derivation, children = enumeration_node
+            if advanced is not None:
+                # The child at position was advanced, the derivation only
+                # changes from that child on
+                following = tuple(first[n] for n in
+                                  derivation.continuation_nodes[position + 1:])
+                derivations = derivation.children[:position] + \
+                    (advanced.derivation, ) + \
+                    tuple(map(lambda x: x.derivation, following))
+                derivation = Derivation(derivation.continuation_nodes,
+                                        derivation.weight,
+                                        derivations,
+                                        derivations[0].accumulated_weight +
+                                        derivation.weight)
+                advanced = EnumerationNode(node, current, derivation,
+                                           children[:position] +
+                                           (advanced, ) + following)
+            elif position > 0:
+                stack.append((enumeration_node, position - 1))
+                # The derivations that end on a node can't be advanced
+                child = children[position - 1]
+                if child.children:
+                    stack.append((child, len(child.children)))
+            elif children and current + 1 < \
+                    len(self.transitions_cache[node].continuations):
+                # None of the children can be advanced, take the next
+                # continuation
+                continuation = \
+                    self.transitions_cache[node].continuations[current + 1]
+                advanced = self.__enumeration_node(
+                    node, current + 1,
+                    tuple(first[c.continuation_node] for c in continuation))
+
+        return advanced
+
+    # It generates the best solution first and then lexicografically the
+    # rest, check the function __enumerate_best_first to generate all the
+    # solutions in order.
     def __enumerate_transitions(self, node):
         """
         This function enumerates the possible paths in a hypergraph given a
         node.
 
-        Using the previously computed transitions cache this function uses
-        bactracking and generators to enumerate the possible transitions of
-        the hypergraph. It generates the best solution first and then the
-        rest in an topological sort.
+        Using the previously computed transitions cache this function
+        enumerates the possible transitions of the hypergraph. It generates
+        the best solution first and then the rest in an topological sort,
+        the derivations of the last continuation nodes are advanced first.
+
+        The solutions are generated as Derivations, the children of the
+        continuation nodes that are not advanced are shared with the previous
+        solution. The accumulated weight of a Derivation is the accumulated
+        weight of its first child plus its weight. Check the function
+        __next_enumeration_node to know how the next solution is built.
         """
-        # Extract the current transition
-        transition = self.transitions_cache[node]
-        for continuation in transition.continuations:
-            solution = ((continuation, transition.weight),)
-            # Build the generators
-            generators = []
-            generator_backups = []
-
-            for c in continuation:
-                c = c.continuation_node
-                # Reached the base case, yield the solution and finish the
-                # generator
-                if c is None:
-                    yield solution
-                    return
-                generators.append(self.__enumerate_transitions(c))
-                # Used to refresh the generators when they are consumed
-                generator_backups.append(c)
-
-            counter = 0
-            while True:
-                c = next(generators[counter], None)
-
-                # Reached the end of the generator
-                if c is None:
-                    if counter == 0:
-                        break
-
-                    # Update the solution
-                    solution = ((continuation, transition.weight),)
-                    # Refresh the current generator
-                    g = self.__enumerate_transitions(generator_backups[counter])
-                    generators[counter] = g
-                    # Update the counter
-                    counter -= 1
+        first = self.__first_enumeration_nodes()
+        enumeration_node = first[node]
+        while enumeration_node is not None:
+            yield enumeration_node.derivation
+            enumeration_node = self.__next_enumeration_node(enumeration_node,
+                                                            first)
+
+    def __transition_weight(self, hypergraph, node, transition):
+        """
+        Auxiliary function that returns the weight of a transition, the
+        weights whose scoring is deferred are requested to the hypergraph.
+        """
+        if transition.weight is not None:
+            return transition.weight
+
+        return hypergraph.getHyperedgeLabel((node, ) +
+                                            transition.tails).weight
 
+    def __is_derivation_computed(self, node, k):
+        """
+        Auxiliary function that returns True if the k-th best derivation of
+        a node is known, either because it was computed or because the node
+        has less derivations.
+        """
+        if node not in self.best_derivations:
+            return False
+
+        return len(self.best_derivations[node][0]) > k or \
+            node in self.exhausted_nodes
+
+    def __compute_best_derivations(self, hypergraph, node, k):
+        """
+        Auxiliary function that computes the derivations of a node until its
+        k-th best one, or all of them if the node has less. It returns the
+        list of (continuation node, rank) whose derivations are required and
+        were not computed yet, the function must be called again once they
+        are (check the function __get_kth_best_derivation).
+
+        The state of the best-first enumeration of a node is created the
+        first time the best derivation of each of its continuation nodes is
+        known. The state is a tuple with:
+            derivations -> The list of the derivations of the node found so
+                           far, in non-increasing order of score. Each
+                           derivation is a tuple (score, transition, ranks)
+                           where transition is the position of the transition
+                           on the node transitions (None for the leaves) and
+                           ranks is the position of the derivation used for
+                           each continuation node on its own list.
+            candidates -> The heap with the candidates to be the next
+                          derivation of the node.
+            visited -> The set of (transition, ranks) already pushed to the
+                       heap.
+        The candidates start with the best derivation of each transition, the
+        one that uses the best derivation of every continuation node. The
+        nodes whose derivations were all computed are kept on
+        exhausted_nodes.
+        """
+        node_transitions = self.__get_node_transitions(hypergraph, node)
+        if node not in self.best_derivations:
+            required = [(n, 0) for transition in node_transitions
+                        for n in transition.tails
+                        if not self.__is_derivation_computed(n, 0)]
+            if required:
+                return required
+
+            derivations, candidates, visited = [], [], set()
+            if not node_transitions:
+                derivations.append((hypergraph.getNodeWeight(node), None, ()))
+            else:
+                for position, transition in enumerate(node_transitions):
+                    ranks = (0, ) * len(transition.tails)
+                    score = self.__transition_weight(hypergraph, node,
+                                                     transition)
+                    for n in transition.tails:
+                        score += self.best_derivations[n][0][0][0]
+                    heappush(candidates, (-score, position, ranks))
+                    visited.add((position, ranks))
+            self.best_derivations[node] = (derivations, candidates, visited)
+
+        derivations, candidates, visited = self.best_derivations[node]
+        while len(derivations) <= k:
+            if derivations and derivations[-1][1] is not None:
+                _, position, ranks = derivations[-1]
+                transition = node_transitions[position]
+                required = []
+                for index, continuation_node in enumerate(transition.tails):
+                    next_ranks = ranks[:index] + (ranks[index] + 1, ) + \
+                        ranks[index + 1:]
+                    if (position, next_ranks) in visited:
+                        continue
+                    if not self.__is_derivation_computed(continuation_node,
+                                                         next_ranks[index]):
+                        required.append((continuation_node,
+                                         next_ranks[index]))
+                        continue
+                    # The continuation node has less derivations
+                    if len(self.best_derivations[continuation_node][0]) <= \
+                       next_ranks[index]:
+                        continue
+
+                    score = self.__transition_weight(hypergraph, node,
+                                                     transition)
+                    for n, rank in zip(transition.tails, next_ranks):
+                        score += self.best_derivations[n][0][rank][0]
+                    heappush(candidates, (-score, position, next_ranks))
+                    visited.add((position, next_ranks))
+                if required:
+                    return required
+
+            if not candidates:
+                self.exhausted_nodes.add(node)
+                return []
+
+            score, position, ranks = heappop(candidates)
+            derivations.append((-score, position, ranks))
+
+        return []
+
+    def __get_kth_best_derivation(self, hypergraph, node, k):
+        """
+        This function returns the k-th best derivation of a node (starting
+        at 0) as a tuple (score, transition, ranks), None if the node has
+        less derivations.
+
+        It follows the lazy k-best algorithm of Huang and Chiang (Better k-best
+        parsing, 2005). The derivations are computed on demand: every time a
+        derivation is taken from the candidates of the node, its neighbours
+        (the same transition increasing the rank of one of its continuation
+        nodes) are added to the candidates, so only the derivations of the
+        continuation nodes that are required are computed.
+
+        The required derivations of the continuation nodes are computed
+        using a stack instead of recursion, so the depth of the hypergraph
+        is not limited by the recursion limit.
+        """
+        stack = [(node, k)]
+        while stack:
+            required = self.__compute_best_derivations(hypergraph,
+                                                       *stack[-1])
+            if required:
+                stack.extend(required)
+            else:
+                stack.pop()
+
+        derivations = self.best_derivations[node][0]
+        if k < len(derivations):
+            return derivations[k]
+
+        return None
+
+    def __build_derivation(self, hypergraph, node, k):
+        """
+        Auxiliary function that returns the Derivation of the k-th best
+        derivation of a node, the Derivations are built once so the ones
+        of the same node and rank are shared. The Derivations of the
+        continuation nodes are built first using a stack instead of
+        recursion.
+        """
+        stack = [(node, k)]
+        while stack:
+            if stack[-1] in self.derivation_trees:
+                stack.pop()
+                continue
+
+            n, rank = stack[-1]
+            score, position, ranks = self.best_derivations[n][0][rank]
+            if position is None:
+                derivation = Derivation((None, ), 0, (), score)
+            else:
+                transition = self.node_transitions[n][position]
+                continuations = zip(transition.tails, ranks)
+                required = [c for c in continuations
+                            if c not in self.derivation_trees]
+                if required:
+                    stack.extend(required)
                     continue
 
-                # Update the accumulated_weight
-                # The commented out lines are in case the usage of the
-                # the named tuple instead the class is preferred.
-                # continuation_node = solution[0][0][counter].continuation_node
-                total_weight = c[0][0][0].accumulated_weight + c[0][1]
-                # solution[0][0][counter] = Continuation(continuation_node,
-                #                                        total_weight)
-                solution[0][0][counter].accumulated_weight = total_weight
-                counter += 1
-                solution += c
-                # Reached the end of the generators list
-                if counter == len(generators):
-                    yield solution
-                    # Remove the elements added by c
-                    solution = solution[:-len(c)]
-                    # Update the counter
-                    counter -= 1
-
-    def __init__(self, hypergraph, initial_node):
-        self.node_transitions = self.__resetStates(hypergraph)
-        self.transitions_cache = dict()
+                children = tuple(self.derivation_trees[c]
+                                 for c in continuations)
+                derivation = Derivation(transition.tails,
+                                        self.__transition_weight(hypergraph, n,
+                                                                 transition),
+                                        children, score)
+            self.derivation_trees[stack.pop()] = derivation
+
+        return self.derivation_trees[(node, k)]
+
+    def __enumerate_best_first(self, hypergraph, node):
+        """
+        This function enumerates the derivations of a node in non-increasing
+        order of score, where the score of a derivation is the weight of its
+        hyperedges plus the weight of the nodes where it ends (check the
+        function derivation_score).
+
+        Getting the first k derivations only computes, at most, the first k
+        derivations of each node, so its cost depends on k and not on the
+        number of derivations of the hypergraph.
+        """
+        k = 0
+        while self.__get_kth_best_derivation(hypergraph, node, k) is not None:
+            yield self.__build_derivation(hypergraph, node, k)
+            k += 1
 
-        if initial_node not in self.node_transitions:
+    def __init__(self, hypergraph, initial_node, bounds=None,
+                 best_first=False):
+        """
+        bounds is optional, if specified it must be a dictionary with an
+        upper bound of the accumulated weight of any derivation starting on
+        each node of the hypergraph (check the function getNodeBounds of the
+        comparator). The bounds are used to discard the transitions that
+        can't be part of the best derivation, the first derivation is the
+        same but the rest only include the transitions that were not
+        discarded.
+
+        best_first is optional, if True the derivations are generated in
+        non-increasing order of score (check the function
+        __enumerate_best_first) and the bounds are not used.
+        """
+        self.hypergraph = hypergraph
+        self.initial_node = initial_node
+        self.bounds = None if best_first else bounds
+        # The transitions are only read for the nodes reachable from the
+        # initial node, so creating the iterator doesn't depend on the size
+        # of the hypergraph. The hyperedges of a lazy hypergraph are also
+        # generated on demand.
+        self.lazy = isinstance(hypergraph, LazyHypergraph)
+        self.node_transitions = dict()
+        self.transitions_cache = dict()
+        self.node_positions = dict()
+        self.accumulated_weights = []
+        if isinstance(hypergraph, ArrayHypergraph):
+            self.accumulated_weights = array('d')
+        self.best_derivations = dict()
+        self.exhausted_nodes = set()
+        self.derivation_trees = dict()
+
+        if not self.__get_node_transitions(hypergraph, initial_node):
             raise ValueError("The specified initial node doesn't start a " +
                              "hyperedge")
 
-        self.__build_transitions_cache(hypergraph, initial_node).next()
-        self.generator = self.__enumerate_transitions(initial_node)
+        if best_first:
+            self.generator = self.__enumerate_best_first(hypergraph,
+                                                         initial_node)
+        else:
+            self.__build_transitions_cache(hypergraph, initial_node)
+            self.generator = self.__enumerate_transitions(initial_node)
+
+    def countDerivations(self):
+        """
+        This function returns the number of derivations generated by the
+        iterator from the initial node, without enumerating them. The
+        derivations already generated are included.
+
+        The number is computed using the transitions cache, the nodes are
+        visited in the order they were added to it so the continuation nodes
+        are counted before the nodes that reach them. The number of
+        derivations of a node is the sum over its continuations of the
+        product of the derivations of their continuation nodes.
+        """
+        self.__build_transitions_cache(self.hypergraph, self.initial_node)
+
+        derivations = dict()
+        for node in sorted(self.node_positions, key=self.node_positions.get):
+            total = 0
+            for continuation in self.transitions_cache[node].continuations:
+                if continuation[0].continuation_node is None:
+                    total = 1
+                    break
+                product = 1
+                for c in continuation:
+                    product *= derivations[c.continuation_node]
+                total += product
+            derivations[node] = total
+
+        return derivations[self.initial_node]
 
     def __iter__(self):
         return self
 
-    def next(self, deep_copy=True):
-        a = self.generator.next()
-
-        if not deep_copy:
-            return a
-        else:
-            return deepcopy(a)
+    def nextDerivation(self):
+        """
+        This function returns the next derivation as a Derivation, it can be
+        kept without copying it.
+        """
+        return self.generator.next()
 
+    def next(self, deep_copy=True):
+        """
+        This function returns the solution of the next derivation, check the
+        function expand_derivation. The solution is built for each call so
+        it is never modified by the iterator, deep_copy is kept for
+        compatibility.
+        """
+        return expand_derivation(self.generator.next())
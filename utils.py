@@ -88,6 +88,20 @@ def t_cost_edit_distance(s1, s2):
              g2_g1 * SUBSTITUTION_COST)
 
 
+def t_cost_edit_distance_bitmasks(mask1, size1, mask2, size2):
+    """
+    Compute the edit distance between two set of nodes represented as
+    bitmasks, as t_cost_edit_distance does for sets.
+
+    size1 and size2 are the number of nodes of each mask, they are given so
+    they can be computed only once for each mask.
+    """
+    common = popcount(mask1 & mask2)
+
+    return -((size1 - common) * SUBSTITUTION_COST +
+             (size2 - common) * SUBSTITUTION_COST)
+
+
 def t_cost_edit_distance_graphs_no_vars(g1, root_g1, g2, root_g2):
     """
     Compute the edit distance between two graphs without variables.
@@ -119,6 +133,140 @@ def t_cost_edit_distance_graphs_no_vars(g1, root_g1, g2, root_g2):
     return t_cost_edit_distance(g1, g2)
 
 
+def popcount(mask):
+    """
+    Returns the number of nodes of a set of nodes represented as a bitmask.
+    """
+    return bin(mask).count('1')
+
+
+def nodes_bitmask(nodes, positions):
+    """
+    Returns the bitmask that represents a set of nodes.
+
+    positions -> A dictionary that maps each node to its bit on the mask.
+    """
+    mask = 0
+    for node in nodes:
+        mask |= 1 << positions[node]
+
+    return mask
+
+
+def graphs_node_positions(*graphs):
+    """
+    Returns a dictionary that assigns a different bit to each one of the
+    nodes of the given graphs. Equal nodes of different graphs share the same
+    bit so the bitmasks of the graphs can be compared.
+    """
+    positions = dict()
+    for g in graphs:
+        for node in g.links.iterkeys():
+            positions.setdefault(node, len(positions))
+
+    return positions
+
+
+def reachable_bitmasks(g, positions):
+    """
+    Compute for every node of a graph the nodes reachable from it, the node
+    included, as a bitmask.
+
+    g -> A graph as specified on the datastructures module.
+    positions -> A dictionary that maps each node to its bit on the masks.
+
+    The nodes are visited once with an iterative depth first search, the mask
+    of a node is the union of the masks of its children.
+    """
+    masks = dict()
+    for start in g.links:
+        if start in masks:
+            continue
+
+        stack = [(start, iter(g.links[start]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in masks:
+                    stack.append((child, iter(g.links[child])))
+                    break
+            else:
+                stack.pop()
+                mask = 1 << positions[node]
+                for child in g.links[node]:
+                    mask |= masks[child]
+                masks[node] = mask
+
+    return masks
+
+
+def reachable_bitmasks_sizes(g, positions):
+    """
+    Returns a list of tuples (node, mask, size) with the bitmask of the nodes
+    reachable from each node of a graph and its size, check the function
+    reachable_bitmasks.
+    """
+    return [(node, mask, popcount(mask))
+            for node, mask in reachable_bitmasks(g, positions).iteritems()]
+
+
+def t_cost_edit_distance_graphs_no_vars_all_pairs(g1, g2, reachable1=None):
+    """
+    Compute the edit distance between the graphs without variables obtained
+    from every pair of nodes of two graphs, as the function
+    t_cost_edit_distance_graphs_no_vars does for one pair.
+
+    g1 -> A graph as specified on the datastructures module.
+    g2 -> A graph as specified on the datastructures module.
+    reachable1 -> Optional, the reachable nodes of g1 precomputed with
+                  reachable_bitmasks_sizes(g1, graphs_node_positions(g1)).
+                  As the nodes of g1 take the first positions they are valid
+                  for any g2, so they can be computed once when g1 is compared
+                  with several graphs.
+
+    Returns a dictionary with the pairs of nodes (n1, n2) as keys and the edit
+    distance as values. The reachable nodes of each graph are computed once as
+    bitmasks over the nodes of both graphs, so the cost of a pair is obtained
+    from the size of the intersection of two masks.
+    """
+    positions = graphs_node_positions(g1, g2)
+
+    if reachable1 is None:
+        reachable1 = reachable_bitmasks_sizes(g1, positions)
+    reachable2 = reachable_bitmasks_sizes(g2, positions)
+
+    costs = dict()
+    for n1, mask1, size1 in reachable1:
+        for n2, mask2, size2 in reachable2:
+            costs[(n1, n2)] = t_cost_edit_distance_bitmasks(mask1, size1,
+                                                            mask2, size2)
+
+    return costs
+
+
+def mapping_effective_nodes(m):
+    """
+    Compute the nodes of a mapping that are not replaced by its variables.
+
+    m -> A mapping, that is a subgraph with a set of variables
+
+    The subgraph also includes the descendants of the nodes in which we
+    include the variables, the function returns a frozenset with the nodes of
+    the subgraph that can't be reached from the variables.
+    """
+    reachable = set()
+    for var in m.variables:
+        frontier = [var]
+        while frontier:
+            r = frontier.pop()
+            if r not in m.subgraph.nodes or r in reachable:
+                continue
+            reachable.add(r)
+            frontier.extend(m.graph.links[r])
+
+    return frozenset(m.subgraph.nodes).difference(reachable)
+
+
 def t_cost_edit_distance_graphs_with_vars(m1, m2):
     """
     Compute the edit distance between two graphs with variables.
@@ -128,30 +276,11 @@ def t_cost_edit_distance_graphs_with_vars(m1, m2):
 
     The subgraphs also include the descendants of the nodes in which
     we include the variables so before we compute the edit distance
-    we have to remove them from the computation
+    we have to remove them from the computation (check the function
+    mapping_effective_nodes).
     """
-    def reachable(g):
-        """
-        Auxiliary function to compute the reachable nodes from the
-        variables.
-        """
-        reachable = list()
-        for var in g.variables:
-            frontier = [var]
-            while frontier:
-                r = frontier.pop()
-                if r not in g.subgraph.nodes:
-                    continue
-                reachable.append(r)
-                frontier.extend(g.graph.links[r])
-
-        return reachable
-
-    s1 = reachable(m1)
-    s2 = reachable(m2)
-
-    return t_cost_edit_distance(set(m1.subgraph.nodes).difference(s1),
-                                set(m2.subgraph.nodes).difference(s2))
+    return t_cost_edit_distance(mapping_effective_nodes(m1),
+                                mapping_effective_nodes(m2))
 
 if __name__ == '__main__':
     print t_cost_function(['A', 'B', 'C'], ['a', 'l'])